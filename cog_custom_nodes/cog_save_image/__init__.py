@@ -0,0 +1,69 @@
+import os
+import json
+import numpy as np
+import folder_paths
+from PIL import Image
+
+# Matches the "balanced" preset in cog_model_helpers/optimise_images.py,
+# used unless the workflow passes a preset's options as save_options
+SAVE_OPTIONS = {
+    "webp": {"method": 4},
+    "jpg": {"optimize": True},
+}
+
+
+class CogSaveImage:
+    """
+    Saves images straight to WebP or JPEG, so an output that would be
+    converted after the workflow is only encoded once.
+    """
+
+    def __init__(self):
+        self.output_dir = folder_paths.get_output_directory()
+        self.type = "output"
+
+    @classmethod
+    def INPUT_TYPES(s):
+        return {
+            "required": {
+                "images": ("IMAGE",),
+                "filename_prefix": ("STRING", {"default": "ComfyUI"}),
+                "format": (list(SAVE_OPTIONS),),
+                "quality": ("INT", {"default": 95, "min": 0, "max": 100}),
+            },
+            "optional": {
+                "save_options": ("STRING", {"default": ""}),
+            },
+        }
+
+    RETURN_TYPES = ()
+    FUNCTION = "save_images"
+    OUTPUT_NODE = True
+    CATEGORY = "image"
+
+    def save_images(self, images, filename_prefix, format, quality, save_options=""):
+        save_options = json.loads(save_options) if save_options else SAVE_OPTIONS[format]
+        full_output_folder, filename, counter, subfolder, filename_prefix = (
+            folder_paths.get_save_image_path(
+                filename_prefix, self.output_dir, images[0].shape[1], images[0].shape[0]
+            )
+        )
+        results = []
+        for batch_number, image in enumerate(images):
+            i = 255.0 * image.cpu().numpy()
+            img = Image.fromarray(np.clip(i, 0, 255).astype(np.uint8))
+            filename_with_batch_num = filename.replace("%batch_num%", str(batch_number))
+            file = f"{filename_with_batch_num}_{counter:05}_.{format}"
+            img.save(
+                os.path.join(full_output_folder, file),
+                quality=quality,
+                **save_options,
+            )
+            results.append({"filename": file, "subfolder": subfolder, "type": self.type})
+            counter += 1
+
+        return {"ui": {"images": results}}
+
+
+NODE_CLASS_MAPPINGS = {"CogSaveImage": CogSaveImage}
+NODE_DISPLAY_NAME_MAPPINGS = {"CogSaveImage": "Save Image (Cog)"}
@@ -0,0 +1,123 @@
+import os
+import subprocess
+from concurrent.futures import ThreadPoolExecutor
+from cog import Input
+
+VIDEO_FILE_EXTENSIONS = [".mp4", ".mov", ".avi", ".mkv", ".webm"]
+# Animated outputs that can be turned into a video when transcoding
+ANIMATED_FILE_EXTENSIONS = [".gif"]
+DEFAULT_VIDEO_PROFILE = "original"
+
+# ffmpeg arguments and output container for each profile. "faststart" only
+# moves the index to the front of mp4/mov files so playback can start before
+# the download finishes, the others re-encode.
+EVEN_DIMENSIONS = ["-vf", "scale=trunc(iw/2)*2:trunc(ih/2)*2"]
+VIDEO_PROFILES = {
+    "original": None,
+    "faststart": {
+        "extensions": [".mp4", ".mov"],
+        "suffix": None,
+        "args": ["-c", "copy", "-movflags", "+faststart"],
+    },
+    "h264": {
+        "extensions": VIDEO_FILE_EXTENSIONS + ANIMATED_FILE_EXTENSIONS,
+        "suffix": ".mp4",
+        "args": [
+            *EVEN_DIMENSIONS,
+            *["-c:v", "libx264", "-preset", "medium", "-crf", "23"],
+            *["-pix_fmt", "yuv420p", "-c:a", "aac", "-movflags", "+faststart"],
+        ],
+    },
+    "h264_small": {
+        "extensions": VIDEO_FILE_EXTENSIONS + ANIMATED_FILE_EXTENSIONS,
+        "suffix": ".mp4",
+        "args": [
+            *EVEN_DIMENSIONS,
+            *["-c:v", "libx264", "-preset", "slow", "-crf", "28"],
+            *["-pix_fmt", "yuv420p", "-c:a", "aac", "-movflags", "+faststart"],
+        ],
+    },
+    "vp9": {
+        "extensions": VIDEO_FILE_EXTENSIONS + ANIMATED_FILE_EXTENSIONS,
+        "suffix": ".webm",
+        "args": [
+            *["-c:v", "libvpx-vp9", "-crf", "33", "-b:v", "0", "-row-mt", "1"],
+            *["-pix_fmt", "yuv420p", "-c:a", "libopus"],
+        ],
+    },
+}
+# Each ffmpeg process is multithreaded, so only a few run at once
+VIDEO_WORKERS = 2
+
+
+def predict_video_profile() -> str:
+    return Input(
+        description="How to optimise output videos and GIFs. 'original' returns them unchanged, 'faststart' makes mp4/mov files playable while downloading, 'h264', 'h264_small' and 'vp9' re-encode them to smaller files.",
+        choices=list(VIDEO_PROFILES),
+        default=DEFAULT_VIDEO_PROFILE,
+    )
+
+
+def _claim_output_path(partial_file_path, file, suffix):
+    # A transcoded file never replaces another output with the same stem,
+    # such as out.mp4 next to out.gif. Linking fails if the name is taken,
+    # so workers running at the same time cannot claim the same one.
+    candidate = file.with_suffix(suffix)
+    counter = 0
+    while True:
+        try:
+            os.link(partial_file_path, candidate)
+            partial_file_path.unlink()
+            return candidate
+        except FileExistsError:
+            counter += 1
+            candidate = file.with_name(f"{file.stem}_{counter}{suffix}")
+
+
+def _optimise_video(file, profile):
+    suffix = profile["suffix"] or file.suffix
+    # ffmpeg cannot write over the file it is reading
+    partial_file_path = file.with_name(f"{file.name}.optimising{suffix}")
+    command = [
+        *["ffmpeg", "-y", "-v", "error", "-i", str(file)],
+        *profile["args"],
+        str(partial_file_path),
+    ]
+    result = subprocess.run(command, capture_output=True, text=True)
+    if result.returncode != 0:
+        print(f"⚠️  Could not optimise {file}, returning it unchanged")
+        print(result.stderr.strip())
+        if partial_file_path.exists():
+            partial_file_path.unlink()
+        return file
+
+    if suffix == file.suffix:
+        os.replace(partial_file_path, file)
+        optimised_file_path = file
+    else:
+        optimised_file_path = _claim_output_path(partial_file_path, file, suffix)
+    print(f"🎞️  Optimised {file.name} to {optimised_file_path.name}")
+    return optimised_file_path
+
+
+def optimise_video_files(video_profile: str = DEFAULT_VIDEO_PROFILE, files=[]):
+    profile = VIDEO_PROFILES[video_profile]
+    if profile is None:
+        return files
+
+    videos = [
+        i
+        for i, file in enumerate(files)
+        if file.is_file() and file.suffix in profile["extensions"]
+    ]
+    optimised_files = list(files)
+    if not videos:
+        return optimised_files
+
+    with ThreadPoolExecutor(max_workers=VIDEO_WORKERS) as executor:
+        results = executor.map(
+            _optimise_video, [files[i] for i in videos], [profile] * len(videos)
+        )
+        for i, optimised_file_path in zip(videos, results):
+            optimised_files[i] = optimised_file_path
+    return optimised_files
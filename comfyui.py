@@ -1,116 +1,146 @@
 import os
-import urllib.request
-import subprocess
-import threading
+import copy
 import time
 import json
-import urllib
-import uuid
-import websocket
 import random
 import requests
-import shutil
 import custom_node_helpers as helpers
 from cog import Path
+from cog_model_helpers.optimise_images import ENCODER_PRESETS, DEFAULT_ENCODER_PRESET
 from node import Node
+from server_pool import ServerPool
+from config import config
 from weights_downloader import WeightsDownloader
-from urllib.error import URLError
+from helper_context import HelperContext
+from preflight_cache import (
+    PreflightCache,
+    WorkflowPreflight,
+    SELF_DOWNLOADING_NODE_TYPES,
+)
+from download_telemetry import telemetry as shared_telemetry
+from workflow_graph import unreachable_node_ids
+from deferred_cleanup import cleanup
+from input_cache import InputCache
+from inline_images import offload_base64_images, is_base64_image
+
+# Save node from cog_custom_nodes that encodes straight to the requested
+# image format, installed by scripts/install_custom_nodes.py
+DIRECT_SAVE_NODE = "CogSaveImage"
+DIRECT_SAVE_FORMATS = ["webp", "jpg"]
 
 
 class ComfyUI:
     def __init__(self, server_address):
         self.weights_downloader = WeightsDownloader()
+        self.preflight_cache = PreflightCache()
+        self.input_cache = InputCache()
+        self.output_node_types = None
         self.server_address = server_address
+        # Replaced with the configured servers once their directories are known
+        self.server_pool = ServerPool.from_devices([None], server_address, None, None)
 
     def start_server(self, output_directory, input_directory):
         self.input_directory = input_directory
         self.output_directory = output_directory
         self.apply_helper_methods("prepare", weights_downloader=self.weights_downloader)
 
-        start_time = time.time()
-        server_thread = threading.Thread(
-            target=self.run_server, args=(output_directory, input_directory)
+        self.server_pool = ServerPool.from_devices(
+            config["COMFYUI_SERVER_DEVICES"],
+            self.server_address,
+            output_directory,
+            input_directory,
+            self.weights_downloader.supported_filetypes,
+            config["COMFYUI_SERVER_CPUS"],
         )
-        server_thread.start()
-        while not self.is_server_running():
-            if time.time() - start_time > 60:
-                raise TimeoutError("Server did not start within 60 seconds")
-            time.sleep(0.5)
 
+        start_time = time.time()
+        self.server_pool.start()
         elapsed_time = time.time() - start_time
         print(f"Server started in {elapsed_time:.2f} seconds")
 
-    def run_server(self, output_directory, input_directory):
-        command = f"python ./ComfyUI/main.py --output-directory {output_directory} --input-directory {input_directory} --disable-metadata"
-
-        """
-        We need to capture the stdout and stderr from the server process
-        so that we can print the logs to the console. If we don't do this
-        then at the point where ComfyUI attempts to print it will throw a
-        broken pipe error. This only happens from cog v0.9.13 onwards.
-        """
-        server_process = subprocess.Popen(
-            command,
-            shell=True,
-            stdout=subprocess.PIPE,
-            stderr=subprocess.PIPE,
-            universal_newlines=True,
-        )
-
-        def print_stdout():
-            for stdout_line in iter(server_process.stdout.readline, ""):
-                print(f"[ComfyUI] {stdout_line.strip()}")
-
-        stdout_thread = threading.Thread(target=print_stdout)
-        stdout_thread.start()
-
-        for stderr_line in iter(server_process.stderr.readline, ""):
-            print(f"[ComfyUI] {stderr_line.strip()}")
+    @property
+    def client(self):
+        return self.server_pool.primary.client
 
     def is_server_running(self):
-        try:
-            with urllib.request.urlopen(
-                "http://{}/history/{}".format(self.server_address, "123")
-            ) as response:
-                return response.status == 200
-        except URLError:
-            return False
+        return self.client.is_server_running()
 
     def apply_helper_methods(self, method_name, *args, **kwargs):
         # Dynamically applies a method from helpers module with given args.
-        # Example usage: self.apply_helper_methods("add_weights", weights_to_download, node)
-        for module_name in dir(helpers):
-            module = getattr(helpers, module_name)
-            method = getattr(module, method_name, None)
+        # Example usage: self.apply_helper_methods("prepare", weights_downloader=wd)
+        for helper in helpers.HELPERS:
+            method = getattr(helper, method_name, None)
             if callable(method):
                 method(*args, **kwargs)
 
-    def handle_weights(self, workflow, weights_to_download=None):
+    def handle_weights(self, workflow, weights_to_download=None, prediction=None):
         if weights_to_download is None:
             weights_to_download = []
 
         print("Checking weights")
-        embeddings = self.weights_downloader.get_weights_by_type("EMBEDDINGS")
-        embedding_to_fullname = {emb.split(".")[0]: emb for emb in embeddings}
+        embeddings_matcher = self.weights_downloader.get_embeddings_matcher()
+        fingerprint, free_text = PreflightCache.classify(
+            workflow,
+            self.weights_downloader.supported_filetypes,
+            self.weights_downloader.get_manifest_fingerprint(),
+        )
+
+        preflight = self.preflight_cache.get(fingerprint)
+        if preflight:
+            print("Reusing weights resolved for a previous workflow of this shape")
+            preflight.apply(workflow)
+        else:
+            snapshot = PreflightCache.snapshot(workflow)
+            context = HelperContext(self.weights_downloader)
+            weights = self.resolve_workflow_weights(
+                workflow, embeddings_matcher, set(free_text), context
+            )
+            preflight = WorkflowPreflight(
+                weights,
+                PreflightCache.rewrites(snapshot, workflow),
+                context.extra_downloads,
+            )
+            self.preflight_cache.put(fingerprint, preflight)
+        weights_to_download.extend(preflight.weights)
+
+        # Prompts change between requests so they are always checked for embeddings
+        for node_id, input_key in free_text:
+            weights_to_download.extend(
+                embeddings_matcher.find(workflow[node_id]["inputs"][input_key])
+            )
+
+        weights_to_download = list(set(weights_to_download))
+        telemetry = prediction.telemetry if prediction else shared_telemetry
+        with telemetry.phase("downloading"):
+            self.weights_downloader.download_weights_list(
+                weights_to_download, preflight.extra_downloads, prediction
+            )
+
+        print("====================================")
+
+    def resolve_workflow_weights(
+        self, workflow, embeddings_matcher, skip_inputs, context
+    ):
+        weights_to_download = []
         weights_filetypes = self.weights_downloader.supported_filetypes
 
         self.convert_lora_loader_nodes(workflow)
 
-        for node in workflow.values():
+        for node_id, node in workflow.items():
             # Skip HFHubLoraLoader and LoraLoaderFromURL nodes since they handle their own weights
-            if node.get("class_type") in ["HFHubLoraLoader", "LoraLoaderFromURL"]:
+            if node.get("class_type") in SELF_DOWNLOADING_NODE_TYPES:
                 continue
 
-            self.apply_helper_methods("add_weights", weights_to_download, Node(node))
+            for helper in helpers.weights_helpers_for(node.get("class_type")):
+                helper.add_weights(weights_to_download, Node(node), context=context)
 
             for input_key, input_value in node["inputs"].items():
+                if (node_id, input_key) in skip_inputs or is_base64_image(input_value):
+                    continue
                 if isinstance(input_value, str):
-                    if any(key in input_value for key in embedding_to_fullname):
-                        weights_to_download.extend(
-                            embedding_to_fullname[key]
-                            for key in embedding_to_fullname
-                            if key in input_value
-                        )
+                    embeddings = embeddings_matcher.find(input_value)
+                    if embeddings:
+                        weights_to_download.extend(embeddings)
                     elif any(input_value.endswith(ft) for ft in weights_filetypes):
                         # Sometimes a model will have a number of common filenames
                         weight_str = self.weights_downloader.get_canonical_weight_str(
@@ -124,27 +154,31 @@ class ComfyUI:
 
                         weights_to_download.append(weight_str)
 
-        weights_to_download = list(set(weights_to_download))
-
-        for weight in weights_to_download:
-            self.weights_downloader.download_weights(weight)
-
-        print("====================================")
+        return list(set(weights_to_download))
 
     def is_image_or_video_value(self, value):
-        filetypes = [".png", ".jpg", ".jpeg", ".webp", ".mp4", ".webm"]
+        filetypes = [".png", ".jpg", ".jpeg", ".webp", ".gif", ".mp4", ".webm"]
         return isinstance(value, str) and any(
             value.lower().endswith(ft) for ft in filetypes
         )
 
     def handle_known_unsupported_nodes(self, workflow):
+        node_types = frozenset(node.get("class_type") for node in workflow.values())
+        if self.preflight_cache.is_supported(node_types):
+            return
+
         for node in workflow.values():
-            self.apply_helper_methods("check_for_unsupported_nodes", Node(node))
+            Node(node).raise_if_unsupported(helpers.UNSUPPORTED_NODES)
+        self.preflight_cache.mark_supported(node_types)
 
-    def handle_inputs(self, workflow):
+    def handle_inputs(self, workflow, input_directory=None):
         print("Checking inputs")
-        seen_inputs = set()
+        input_directory = input_directory or self.input_directory
+        # Files outside the server's input directory are passed by full path
+        use_full_paths = input_directory != self.input_directory
+        seen_inputs = {}
         missing_inputs = []
+        downloads = {}
         for node in workflow.values():
             # Skip URLs in LoraLoader nodes
             if node.get("class_type") in ["LoraLoaderFromURL", "LoraLoader"]:
@@ -152,82 +186,74 @@ class ComfyUI:
 
             if "inputs" in node:
                 for input_key, input_value in node["inputs"].items():
-                    if isinstance(input_value, str) and input_value not in seen_inputs:
-                        seen_inputs.add(input_value)
+                    if is_base64_image(input_value):
+                        continue
+                    if isinstance(input_value, str) and input_value in seen_inputs:
+                        node["inputs"][input_key] = seen_inputs[input_value]
+                    elif isinstance(input_value, str):
+                        seen_inputs[input_value] = input_value
                         if input_value.startswith(("http://", "https://")):
-                            filename = os.path.join(
-                                self.input_directory, os.path.basename(input_value)
+                            filename = self.download_destination(
+                                input_directory, input_value, downloads
                             )
                             if not os.path.exists(filename):
-                                print(f"Downloading {input_value} to {filename}")
-                                try:
-                                    response = requests.get(input_value)
-                                    response.raise_for_status()
-                                    with open(filename, "wb") as file:
-                                        file.write(response.content)
-                                    print(f"✅ {filename}")
-                                except requests.exceptions.RequestException as e:
-                                    print(f"❌ Error downloading {input_value}: {e}")
-                                    missing_inputs.append(filename)
+                                downloads[input_value] = filename
 
                             # The same URL may be included in a workflow more than once
                             node["inputs"][input_key] = filename
+                            seen_inputs[input_value] = filename
 
                         elif self.is_image_or_video_value(input_value):
                             filename = os.path.join(
-                                self.input_directory, os.path.basename(input_value)
+                                input_directory, os.path.basename(input_value)
                             )
                             if not os.path.exists(filename):
                                 print(f"❌ {filename} not provided")
                                 missing_inputs.append(filename)
                             else:
                                 print(f"✅ {filename}")
+                                if use_full_paths:
+                                    node["inputs"][input_key] = filename
+                                    seen_inputs[input_value] = filename
+
+        # Every URL is downloaded at once, through the input cache
+        missing_inputs += self.input_cache.place_all(downloads)
 
         if missing_inputs:
             raise Exception(f"Missing required input files: {', '.join(missing_inputs)}")
 
         print("====================================")
 
+    @staticmethod
+    def download_destination(input_directory, url, downloads):
+        # Different URLs with the same filename are each saved to their own file
+        filename = os.path.join(input_directory, os.path.basename(url))
+        stem, extension = os.path.splitext(filename)
+        counter = 0
+        taken = set(downloads.values())
+        while filename in taken or (counter and os.path.exists(filename)):
+            counter += 1
+            filename = f"{stem}_{counter}{extension}"
+        return filename
+
     def connect(self):
-        self.client_id = str(uuid.uuid4())
-        self.ws = websocket.WebSocket()
-        self.ws.connect(f"ws://{self.server_address}/ws?clientId={self.client_id}")
+        for server in self.server_pool.servers:
+            server.client.connect()
+            server.client.start_reader()
+
+    def close(self):
+        for server in self.server_pool.servers:
+            server.client.close()
 
     def post_request(self, endpoint, data=None):
-        url = f"http://{self.server_address}{endpoint}"
-        headers = {"Content-Type": "application/json"} if data else {}
-        json_data = json.dumps(data).encode("utf-8") if data else None
-        req = urllib.request.Request(
-            url, data=json_data, headers=headers, method="POST"
-        )
-        with urllib.request.urlopen(req) as response:
-            if response.status != 200:
-                print(f"Failed: {endpoint}, status code: {response.status}")
+        self.client.post(endpoint, data)
 
-    # https://github.com/comfyanonymous/ComfyUI/blob/master/server.py
     def clear_queue(self):
-        self.post_request("/queue", {"clear": True})
-        self.post_request("/interrupt")
+        for server in self.server_pool.servers:
+            server.client.clear_queue()
 
     def queue_prompt(self, prompt):
-        try:
-            # Prompt is the loaded workflow (prompt is the label comfyUI uses)
-            p = {"prompt": prompt, "client_id": self.client_id}
-            data = json.dumps(p).encode("utf-8")
-            req = urllib.request.Request(
-                f"http://{self.server_address}/prompt?{self.client_id}", data=data
-            )
-
-            output = json.loads(urllib.request.urlopen(req).read())
-            return output["prompt_id"]
-        except urllib.error.HTTPError as e:
-            print(f"ComfyUI error: {e.code} {e.reason}")
-            http_error = True
-
-        if http_error:
-            raise Exception(
-                "ComfyUI Error – Your workflow could not be run. Please check the logs for details."
-            )
+        return self.client.queue_prompt(prompt)
 
     def _delete_corrupted_weights(self, error_data):
         if "current_inputs" in error_data:
@@ -248,53 +274,86 @@ class ComfyUI:
                 "The weights for this workflow have been corrupted. They have been deleted and will be re-downloaded on the next run. Please try again."
             )
 
-    def wait_for_prompt_completion(self, workflow, prompt_id):
+    def wait_for_prompt_completion(
+        self, workflow, prompt_id, messages, client=None, on_executed=None
+    ):
         while True:
-            out = self.ws.recv()
-            if isinstance(out, str):
-                message = json.loads(out)
-
-                if message["type"] == "execution_error":
-                    error_data = message["data"]
-
-                    if (
-                        "exception_type" in error_data
-                        and error_data["exception_type"]
-                        == "safetensors_rust.SafetensorError"
-                    ):
-                        self._delete_corrupted_weights(error_data)
-
-                    if (
-                        "exception_message" in error_data
-                        and "Unauthorized: Please login first to use this node" in error_data["exception_message"]
-                    ):
-                        raise Exception("ComfyUI API nodes are not currently supported.")
+            message = messages.get()
+            if isinstance(message, Exception):
+                raise Exception(f"Lost connection to ComfyUI: {message}")
+            if message is None:
+                # The websocket reconnected, the prompt may have finished meanwhile
+                if self.prompt_finished(prompt_id, client or self.client):
+                    break
+                continue
 
-                    error_message = json.dumps(message, indent=2)
-                    raise Exception(
-                        f"There was an error executing your workflow:\n\n{error_message}"
+            if message["type"] == "execution_error":
+                error_data = message["data"]
+
+                if (
+                    "exception_type" in error_data
+                    and error_data["exception_type"]
+                    == "safetensors_rust.SafetensorError"
+                ):
+                    self._delete_corrupted_weights(error_data)
+
+                if (
+                    "exception_message" in error_data
+                    and "Unauthorized: Please login first to use this node" in error_data["exception_message"]
+                ):
+                    raise Exception("ComfyUI API nodes are not currently supported.")
+
+                error_message = json.dumps(message, indent=2)
+                raise Exception(
+                    f"There was an error executing your workflow:\n\n{error_message}"
+                )
+
+            if message["type"] == "executed" and on_executed:
+                data = message["data"]
+                if data.get("prompt_id") == prompt_id and data.get("output"):
+                    on_executed(data["node"], data["output"])
+
+            if message["type"] == "executing":
+                data = message["data"]
+                if data["node"] is None and data["prompt_id"] == prompt_id:
+                    break
+                elif data["prompt_id"] == prompt_id:
+                    node = workflow.get(data["node"], {})
+                    meta = node.get("_meta", {})
+                    class_type = node.get("class_type", "Unknown")
+                    print(
+                        f"Executing node {data['node']}, title: {meta.get('title', 'Unknown')}, class type: {class_type}"
                     )
 
-                if message["type"] == "executing":
-                    data = message["data"]
-                    if data["node"] is None and data["prompt_id"] == prompt_id:
-                        break
-                    elif data["prompt_id"] == prompt_id:
-                        node = workflow.get(data["node"], {})
-                        meta = node.get("_meta", {})
-                        class_type = node.get("class_type", "Unknown")
-                        print(
-                            f"Executing node {data['node']}, title: {meta.get('title', 'Unknown')}, class type: {class_type}"
-                        )
-            else:
-                continue
+    def prompt_finished(self, prompt_id, client):
+        history = client.get_history(prompt_id)
+        if not history:
+            return False
+        status = history.get("status", {})
+        if status.get("status_str") == "error":
+            error_message = json.dumps(status.get("messages", []), indent=2)
+            raise Exception(
+                f"There was an error executing your workflow:\n\n{error_message}"
+            )
+        return status.get("completed", True)
 
-    def load_workflow(self, workflow):
+    def load_workflow(self, workflow, input_directory=None, prediction=None):
         if not isinstance(workflow, dict):
             wf = json.loads(workflow)
         else:
             wf = workflow
 
+        self.check_api_format(wf)
+        if config["PRUNE_UNUSED_NODES"]:
+            self.prune_unused_nodes(wf)
+        self.handle_known_unsupported_nodes(wf)
+        offload_base64_images(wf, input_directory or self.input_directory)
+        self.handle_inputs(wf, input_directory)
+        self.handle_weights(wf, prediction=prediction)
+        return wf
+
+    @staticmethod
+    def check_api_format(wf):
         # There are two types of ComfyUI JSON
         # We need the API version
         if any(key in wf.keys() for key in ["last_node_id", "last_link_id", "version"]):
@@ -302,16 +361,106 @@ class ComfyUI:
                 "You need to use the API JSON version of a ComfyUI workflow. To do this go to your ComfyUI settings and turn on 'Enable Dev mode Options'. Then you can save your ComfyUI workflow via the 'Save (API Format)' button."
             )
 
-        self.handle_known_unsupported_nodes(wf)
-        self.handle_inputs(wf)
-        self.handle_weights(wf)
-        return wf
+    def resolved_weights(self, workflow):
+        """
+        Returns each weight the workflow needs with the URLs it comes from,
+        without downloading anything or changing the workflow.
+        """
+        workflow = copy.deepcopy(workflow)
+        context = HelperContext(self.weights_downloader)
+        weights = self.resolve_workflow_weights(
+            workflow, self.weights_downloader.get_embeddings_matcher(), set(), context
+        )
+        weights_map = self.weights_downloader.weights_map
+        resolved = []
+        for weight_str in sorted(set(weights)):
+            entries = weights_map.get(weight_str, [])
+            if not isinstance(entries, list):
+                entries = [entries]
+            resolved.append([weight_str, sorted(entry["url"] for entry in entries)])
+        resolved += sorted(
+            [weight_str, [url]] for weight_str, url, _ in context.extra_downloads
+        )
+        return resolved
+
+    @staticmethod
+    def input_urls(workflow):
+        # The URLs handle_inputs downloads
+        return sorted(
+            {
+                value
+                for node in workflow.values()
+                if node.get("class_type") not in ["LoraLoaderFromURL", "LoraLoader"]
+                for value in node.get("inputs", {}).values()
+                if isinstance(value, str) and value.startswith(("http://", "https://"))
+            }
+        )
+
+    def get_output_node_types(self):
+        # Which nodes are outputs is only known to the server, and does
+        # not change while it runs
+        if self.output_node_types is None:
+            try:
+                object_info = self.client.get_object_info()
+            except requests.exceptions.RequestException as e:
+                print(f"Could not fetch node definitions: {e}")
+                return None
+            self.output_node_types = {
+                node_type
+                for node_type, info in object_info.items()
+                if info.get("output_node")
+            }
+        return self.output_node_types
+
+    def workflow_weights(self, nodes):
+        return {
+            self.weights_downloader.get_canonical_weight_str(value)
+            for node in nodes
+            for value in node.get("inputs", {}).values()
+            if isinstance(value, str)
+            and value.endswith(tuple(self.weights_downloader.supported_filetypes))
+        }
+
+    def prune_unused_nodes(self, workflow):
+        # Nodes no output depends on never run, but would still have their
+        # weights downloaded and their inputs checked
+        output_node_types = self.get_output_node_types()
+        if not output_node_types:
+            return
+
+        removed = {
+            node_id: workflow.pop(node_id)
+            for node_id in unreachable_node_ids(workflow, output_node_types)
+        }
+        if not removed:
+            return
+
+        for node_id, node in removed.items():
+            print(f"Removing unused node {node_id}: {node.get('class_type')}")
+        weights = self.workflow_weights(removed.values()) - self.workflow_weights(
+            workflow.values()
+        )
+        # Only checks the disk, this is just for the log
+        weights_map = self.weights_downloader.weights_map
+        avoided = [
+            weight_str
+            for weight_str in sorted(weights)
+            if weight_str in weights_map
+            and not all(
+                os.path.exists(path)
+                for path in self.weights_downloader.weight_paths(weight_str)
+            )
+        ]
+        if avoided:
+            print(f"Avoided downloading weights: {', '.join(avoided)}")
 
     def reset_execution_cache(self):
         print("Resetting execution cache")
         with open("reset.json", "r") as file:
             reset_workflow = json.loads(file.read())
-        self.queue_prompt(reset_workflow)
+        # The next workflow may be routed to any server
+        for server in self.server_pool.servers:
+            server.client.queue_prompt(reset_workflow)
 
     def randomise_input_seed(self, input_key, inputs):
         if input_key in inputs and isinstance(inputs[input_key], (int, float)):
@@ -326,20 +475,161 @@ class ComfyUI:
             for seed_key in seed_keys:
                 self.randomise_input_seed(seed_key, inputs)
 
-    def run_workflow(self, workflow):
+    def run_workflow(self, workflow, on_output=None, prediction=None):
+        # on_output(server, node_id, output) is called as each node's outputs are written
         print("Running workflow")
-        prompt_id = self.queue_prompt(workflow)
-        self.wait_for_prompt_completion(workflow, prompt_id)
-        output_json = self.get_history(prompt_id)
+        telemetry = prediction.telemetry if prediction else shared_telemetry
+        server = self.server_pool.acquire(workflow)
+        client = server.client
+
+        on_executed = None
+        if on_output:
+
+            def on_executed(node_id, output):
+                on_output(server, node_id, output)
+
+        try:
+            with telemetry.phase("executing"):
+                prompt_id = client.queue_prompt(workflow)
+                messages = client.subscribe(prompt_id)
+                try:
+                    self.wait_for_prompt_completion(
+                        workflow,
+                        prompt_id,
+                        messages,
+                        client,
+                        on_executed,
+                    )
+                finally:
+                    client.unsubscribe(prompt_id)
+        finally:
+            self.server_pool.release(server)
+        output_json = client.get_history(prompt_id)["outputs"]
         print("outputs: ", output_json)
         print("====================================")
+        return output_json, server
 
     def get_history(self, prompt_id):
-        with urllib.request.urlopen(
-            f"http://{self.server_address}/history/{prompt_id}"
-        ) as response:
-            output = json.loads(response.read())
-            return output[prompt_id]["outputs"]
+        return self.client.get_history(prompt_id)["outputs"]
+
+    def save_images_as(
+        self,
+        workflow,
+        output_format,
+        output_quality,
+        encoder_preset=DEFAULT_ENCODER_PRESET,
+    ):
+        """
+        Saves images straight to output_format when they would be converted
+        to it afterwards anyway, instead of writing a PNG and re-encoding it.
+        PNG output keeps the usual SaveImage node, as does a server without
+        the save node installed.
+        """
+        if output_format not in DIRECT_SAVE_FORMATS:
+            return
+        output_node_types = self.get_output_node_types()
+        if not output_node_types or DIRECT_SAVE_NODE not in output_node_types:
+            return
+        for node in workflow.values():
+            if node.get("class_type") == "SaveImage":
+                node["class_type"] = DIRECT_SAVE_NODE
+                node["inputs"]["format"] = output_format
+                node["inputs"]["quality"] = output_quality
+                node["inputs"]["save_options"] = json.dumps(
+                    ENCODER_PRESETS[encoder_preset][output_format]
+                )
+
+    def isolate_outputs(self, workflow, subfolder):
+        # Save nodes write under filename_prefix, which may include a subfolder
+        for node in workflow.values():
+            filename_prefix = node.get("inputs", {}).get("filename_prefix")
+            if isinstance(filename_prefix, str):
+                node["inputs"]["filename_prefix"] = f"{subfolder}/{filename_prefix}"
+
+    def get_output_manifest(self, workflow, outputs, server, file_types=("output",)):
+        """
+        Lists the files each node reported in the prompt's history, in the
+        order the nodes ran. Each entry has the node id, its class_type, the
+        kind of output (images, gifs, audio...), the file type (output or
+        temp) and the path.
+
+        Save nodes that ran without reporting their files are matched by
+        their filename_prefix instead.
+        """
+        manifest = []
+        for node_id, node_output in outputs.items():
+            manifest.extend(
+                self.node_output_files(
+                    node_id, node_output, server, file_types, workflow
+                )
+            )
+
+        if "output" in file_types:
+            for node_id, node in workflow.items():
+                filename_prefix = node.get("inputs", {}).get("filename_prefix")
+                if node_id not in outputs and isinstance(filename_prefix, str):
+                    manifest.extend(
+                        self.scan_node_output_files(
+                            node_id, node, filename_prefix, server.output_directory
+                        )
+                    )
+
+        for entry in manifest:
+            print(
+                f"{entry['node_id']} {entry['class_type']} {entry['kind']}: {entry['path']}"
+            )
+        return manifest
+
+    def node_output_files(
+        self, node_id, node_output, server, file_types=("output",), workflow=None
+    ):
+        directories = {
+            "output": server.output_directory,
+            "temp": server.temp_directory,
+        }
+        class_type = (workflow or {}).get(node_id, {}).get("class_type")
+        files = []
+        for kind, items in node_output.items():
+            if not isinstance(items, list):
+                continue
+            for item in items:
+                if not isinstance(item, dict) or "filename" not in item:
+                    continue
+                file_type = item.get("type", "output")
+                if file_type not in file_types:
+                    continue
+                path = os.path.join(
+                    directories[file_type], item.get("subfolder", ""), item["filename"]
+                )
+                if os.path.isfile(path):
+                    files.append(
+                        {
+                            "node_id": node_id,
+                            "class_type": class_type,
+                            "kind": kind,
+                            "type": file_type,
+                            "path": Path(path),
+                        }
+                    )
+        return files
+
+    def scan_node_output_files(self, node_id, node, filename_prefix, directory):
+        # The prefix may include subfolders, only that folder is listed
+        subfolder, prefix = os.path.split(os.path.normpath(filename_prefix))
+        folder = os.path.join(directory, subfolder)
+        if not os.path.isdir(folder):
+            return []
+        return [
+            {
+                "node_id": node_id,
+                "class_type": node.get("class_type"),
+                "kind": "files",
+                "type": "output",
+                "path": Path(os.path.join(folder, f)),
+            }
+            for f in sorted(os.listdir(folder))
+            if f.startswith(prefix) and os.path.isfile(os.path.join(folder, f))
+        ]
 
     def get_files(self, directories, prefix="", file_extensions=None):
         files = []
@@ -365,10 +655,15 @@ class ComfyUI:
 
     def cleanup(self, directories):
         self.clear_queue()
+        for server in self.server_pool.secondary:
+            directories = directories + [
+                server.output_directory,
+                server.temp_directory,
+            ]
+        # Deleting a video workflow's frames can take a while, so the old
+        # directories are moved aside and deleted in the background
         for directory in directories:
-            if os.path.exists(directory):
-                shutil.rmtree(directory)
-            os.makedirs(directory)
+            cleanup.empty(directory)
 
     def convert_lora_loader_nodes(self, workflow):
         for node_id, node in workflow.items():
@@ -0,0 +1,208 @@
+import json
+import time
+import uuid
+import queue
+import threading
+from collections import deque
+import requests
+import websocket
+from requests.adapters import HTTPAdapter
+
+REQUEST_TIMEOUT = 30
+POOL_SIZE = 8
+RECONNECT_DELAY = 1
+# Messages for prompts nobody is waiting on yet, kept so a prompt that
+# starts executing before its waiter subscribes still sees every event
+UNCLAIMED_MESSAGES = 1000
+
+
+class ComfyUIClient:
+    """
+    Talks to one ComfyUI server over a pooled keep-alive HTTP session and a
+    single long-lived websocket.
+
+    The client_id is fixed for the lifetime of the client, so reconnecting
+    the websocket reuses the server's entry for this client instead of
+    leaving a new one behind on every prediction.
+
+    One reader thread owns the websocket and routes each message to the
+    queue of the prompt it belongs to, so several prompts can be waited on
+    at once.
+    """
+
+    def __init__(self, server_address):
+        self.server_address = server_address
+        self.base_url = f"http://{server_address}"
+        self.client_id = str(uuid.uuid4())
+        self.session = requests.Session()
+        adapter = HTTPAdapter(pool_connections=1, pool_maxsize=POOL_SIZE)
+        self.session.mount("http://", adapter)
+        self.ws = None
+        self.ws_lock = threading.Lock()
+        self.subscribers = {}
+        self.unclaimed = deque(maxlen=UNCLAIMED_MESSAGES)
+        self.subscribers_lock = threading.Lock()
+        self.reader = None
+        self.closing = False
+
+    def is_server_running(self):
+        try:
+            response = self.session.get(
+                f"{self.base_url}/history/123", timeout=REQUEST_TIMEOUT
+            )
+            return response.status_code == 200
+        except requests.exceptions.ConnectionError:
+            return False
+
+    def post(self, endpoint, data=None):
+        response = self.session.post(
+            f"{self.base_url}{endpoint}", json=data, timeout=REQUEST_TIMEOUT
+        )
+        if response.status_code != 200:
+            print(f"Failed: {endpoint}, status code: {response.status_code}")
+        return response
+
+    def clear_queue(self):
+        # https://github.com/comfyanonymous/ComfyUI/blob/master/server.py
+        self.post("/queue", {"clear": True})
+        self.post("/interrupt")
+
+    def queue_prompt(self, prompt):
+        # Prompt is the loaded workflow (prompt is the label comfyUI uses)
+        response = self.session.post(
+            f"{self.base_url}/prompt",
+            json={
+                "prompt": prompt,
+                "client_id": self.client_id,
+                "prompt_id": str(uuid.uuid4()),
+            },
+            timeout=REQUEST_TIMEOUT,
+        )
+        if response.status_code != 200:
+            print(f"ComfyUI error: {response.status_code} {response.reason}")
+            print(response.text)
+            raise Exception(
+                "ComfyUI Error – Your workflow could not be run. Please check the logs for details."
+            )
+        return response.json()["prompt_id"]
+
+    def get_history(self, prompt_id):
+        response = self.session.get(
+            f"{self.base_url}/history/{prompt_id}", timeout=REQUEST_TIMEOUT
+        )
+        response.raise_for_status()
+        return response.json().get(prompt_id)
+
+    def get_object_info(self):
+        response = self.session.get(
+            f"{self.base_url}/object_info", timeout=REQUEST_TIMEOUT
+        )
+        response.raise_for_status()
+        return response.json()
+
+    def connect(self):
+        # A closed client can be connected again
+        self.closing = False
+        self.open_websocket()
+
+    def open_websocket(self):
+        with self.ws_lock:
+            if self.closing:
+                raise websocket.WebSocketConnectionClosedException("Client closed")
+            if self.ws is not None and self.ws.connected:
+                return
+            if self.ws is not None:
+                self.ws.close()
+            self.ws = websocket.WebSocket()
+            self.ws.connect(
+                f"ws://{self.server_address}/ws?clientId={self.client_id}"
+            )
+
+    def recv(self):
+        """
+        Returns the next text message from the websocket as a dict.
+
+        If the connection dropped it is reopened and None is returned, as
+        messages sent while disconnected are lost and the caller should
+        check the history for anything it was waiting on.
+        """
+        self.open_websocket()
+        while True:
+            try:
+                out = self.ws.recv()
+            except (websocket.WebSocketConnectionClosedException, OSError):
+                if self.closing:
+                    raise
+                print("ComfyUI websocket closed, reconnecting")
+                self.ws.close()
+                self.open_websocket()
+                return None
+            if isinstance(out, str):
+                return json.loads(out)
+
+    def start_reader(self):
+        with self.subscribers_lock:
+            self.closing = False
+            if self.reader is not None and self.reader.is_alive():
+                return
+            self.reader = threading.Thread(target=self.read_messages, daemon=True)
+            self.reader.start()
+
+    def read_messages(self):
+        while not self.closing:
+            try:
+                message = self.recv()
+            except Exception as e:
+                if self.closing:
+                    return
+                # Wake every waiter so none of them hang on a dead server
+                self.broadcast(e)
+                time.sleep(RECONNECT_DELAY)
+                continue
+
+            if message is None:
+                self.broadcast(None)
+                continue
+
+            prompt_id = (message.get("data") or {}).get("prompt_id")
+            if prompt_id is None:
+                continue
+            with self.subscribers_lock:
+                subscriber = self.subscribers.get(prompt_id)
+                if subscriber is None:
+                    self.unclaimed.append(message)
+            if subscriber is not None:
+                subscriber.put(message)
+
+    def broadcast(self, item):
+        with self.subscribers_lock:
+            subscribers = list(self.subscribers.values())
+        for subscriber in subscribers:
+            subscriber.put(item)
+
+    def subscribe(self, prompt_id):
+        """
+        Returns a queue that receives the messages for prompt_id. None is
+        put on it after a reconnect, and an exception if the websocket
+        could not be read.
+        """
+        self.start_reader()
+        messages = queue.Queue()
+        with self.subscribers_lock:
+            self.subscribers[prompt_id] = messages
+            for message in self.unclaimed:
+                if message["data"].get("prompt_id") == prompt_id:
+                    messages.put(message)
+        return messages
+
+    def unsubscribe(self, prompt_id):
+        with self.subscribers_lock:
+            self.subscribers.pop(prompt_id, None)
+
+    def close(self):
+        self.closing = True
+        with self.ws_lock:
+            if self.ws is not None:
+                self.ws.close()
+                self.ws = None
+        self.session.close()
@@ -1,7 +1,21 @@
 config = {
     "WEIGHTS_BASE_URL": "https://weights.replicate.delivery/default/comfy-ui",
     "REMOTE_WEIGHTS_MANIFEST_URL": "https://raw.githubusercontent.com/replicate/cog-comfyui/main/weights.json",
+    "REMOTE_WEIGHTS_MANIFEST_REFRESH_INTERVAL": 60 * 60,
     "MODELS_PATH": "ComfyUI/models",
     "USER_WEIGHTS_PATH": "downloaded_user_models",
     "USER_WEIGHTS_MANIFEST_PATH": "downloaded_user_models/weights.json",
+    "WEIGHTS_CACHE_PATH": "ComfyUI/models/.weights_cache",
+    "WEIGHTS_DISK_BUDGET_GB": None,
+    "WEIGHTS_MIN_FREE_DISK_GB": 2,
+    "MAX_CONCURRENT_DOWNLOADS": 4,
+    "MAX_DOWNLOAD_CONNECTIONS": 64,
+    "MAX_DOWNLOAD_BANDWIDTH_MBPS": None,
+    "COMFYUI_SERVER_DEVICES": [None],
+    "COMFYUI_SERVER_CPUS": None,
+    "STREAM_OUTPUTS": False,
+    "LAZY_INPUT_EXTRACTION": False,
+    "RESULT_CACHE": False,
+    "IMAGE_ENCODER_PRESET": "balanced",
+    "PRUNE_UNUSED_NODES": False,
 }
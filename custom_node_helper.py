@@ -1,6 +1,13 @@
 class CustomNodeHelper:
     # This class provides helper methods for managing node weights and checking unsupported nodes.
 
+    # Node class_types passed to add_weights. Helpers are looked up by class_type,
+    # so add_weights is only called for nodes listed here.
+    node_types = []
+
+    # Node class_types that cannot be run, mapped to the reason why
+    unsupported_nodes = {}
+
     @staticmethod
     def prepare(**kwargs):
         # Placeholder method to prepare a custom node before ComfyUI starts
@@ -12,11 +19,11 @@ class CustomNodeHelper:
         return {}
 
     @staticmethod
-    def add_weights(weights_to_download, node):
+    def add_weights(weights_to_download, node, **kwargs):
         # Placeholder method to add weights to download list based on node specifications.
+        # kwargs["context"] is the HelperContext for the workflow being loaded.
         pass
 
-    @staticmethod
-    def check_for_unsupported_nodes(node):
-        # Placeholder method to check if a node is not supported.
-        pass
+    @classmethod
+    def check_for_unsupported_nodes(cls, node):
+        node.raise_if_unsupported(cls.unsupported_nodes)
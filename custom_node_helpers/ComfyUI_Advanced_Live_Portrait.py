@@ -9,9 +9,13 @@ MODELS = [
     "warping_module.safetensors",
 ]
 
+LIVE_PORTRAIT_NODES = ["ExpressionEditor", "AdvancedLivePortrait"]
+
 
 class ComfyUI_Advanced_Live_Portrait(CustomNodeHelper):
+    node_types = LIVE_PORTRAIT_NODES
+
     @staticmethod
-    def add_weights(weights_to_download, node):
-        if node.is_type_in(["ExpressionEditor", "AdvancedLivePortrait"]):
+    def add_weights(weights_to_download, node, **kwargs):
+        if node.is_type_in(LIVE_PORTRAIT_NODES):
             weights_to_download.extend(MODELS)
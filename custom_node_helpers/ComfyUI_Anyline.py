@@ -2,15 +2,19 @@ from custom_node_helper import CustomNodeHelper
 
 MODELS = ["MTEED.pth"]
 
+ANYLINE_NODE = "AnyLinePreprocessor"
+
 
 class ComfyUI_Anyline(CustomNodeHelper):
+    node_types = [ANYLINE_NODE]
+
     @staticmethod
     def models():
         return MODELS
 
     @staticmethod
-    def add_weights(weights_to_download, node):
-        if node.is_type("AnyLinePreprocessor"):
+    def add_weights(weights_to_download, node, **kwargs):
+        if node.is_type(ANYLINE_NODE):
             weights_to_download.extend(MODELS)
 
     @staticmethod
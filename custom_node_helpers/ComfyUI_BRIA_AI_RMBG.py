@@ -4,14 +4,18 @@ MODELS = [
     "RMBG-1.4/model.pth",
 ]
 
+MODEL_LOADER = "BRIA_RMBG_ModelLoader_Zho"
+
 class ComfyUI_BRIA_AI_RMBG(CustomNodeHelper):
+    node_types = [MODEL_LOADER]
+
     @staticmethod
     def models():
         return MODELS
 
     @staticmethod
-    def add_weights(weights_to_download, node):
-        if node.is_type("BRIA_RMBG_ModelLoader_Zho"):
+    def add_weights(weights_to_download, node, **kwargs):
+        if node.is_type(MODEL_LOADER):
             weights_to_download.extend(MODELS)
 
     @staticmethod
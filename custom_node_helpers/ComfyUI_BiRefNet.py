@@ -9,16 +9,21 @@ MODELS = [
     "swin_large_patch4_window12_384_22kto1k.pth",
 ]
 
+MODEL_LOADER = "BiRefNet_ModelLoader_Zho"
+AUTO_DOWNLOAD_LOADER = "AutoDownloadBiRefNetModel"
+
 
 class ComfyUI_BiRefNet(CustomNodeHelper):
+    node_types = [MODEL_LOADER, AUTO_DOWNLOAD_LOADER]
+
     @staticmethod
     def models():
         return MODELS
 
     @staticmethod
-    def add_weights(weights_to_download, node):
-        if node.is_type("BiRefNet_ModelLoader_Zho"):
+    def add_weights(weights_to_download, node, **kwargs):
+        if node.is_type(MODEL_LOADER):
             weights_to_download.extend(MODELS)
-        elif node.is_type("AutoDownloadBiRefNetModel"):
+        elif node.is_type(AUTO_DOWNLOAD_LOADER):
             model_name = node.input("model_name")
             weights_to_download.append(f"{model_name}.safetensors")
@@ -62,8 +62,98 @@ MODELS = {
     "metric_depth_vit_giant2_800k.pth": "JUGGHM/Metric3D",
 }
 
+# Controlnet preprocessor models are not included in the API JSON
+# We need to add them manually based on the nodes being used to
+# avoid them being downloaded automatically from elsewhere
+NODE_CLASS_MAPPING = {
+    # Depth
+    "MiDaS-NormalMapPreprocessor": "dpt_hybrid-midas-501f0c75.pt",
+    "MiDaS-DepthMapPreprocessor": "dpt_hybrid-midas-501f0c75.pt",
+    "Zoe-DepthMapPreprocessor": "ZoeD_M12_N.pt",
+    "LeReS-DepthMapPreprocessor": ["res101.pth", "latest_net_G.pth"],
+    "MeshGraphormer-DepthMapPreprocessor": [
+        "hrnetv2_w64_imagenet_pretrained.pth",
+        "graphormer_hand_state_dict.bin",
+    ],
+    "DepthAnythingPreprocessor": [
+        "depth_anything_vitl14.pth",
+        "depth_anything_vitb14.pth",
+        "depth_anything_vits14.pth",
+    ],
+    "DepthAnythingV2Preprocessor": [
+        "depth_anything_v2_vitl.pth",
+        "depth_anything_v2_vitg.pth",
+        "depth_anything_v2_vitb.pth",
+        "depth_anything_v2_vits.pth",
+        "depth_anything_v2_metric_vkitti_vitl.pth",
+        "depth_anything_v2_metric_hypersim_vitl.pth",
+    ],
+    "Zoe_DepthAnythingPreprocessor": [
+        "depth_anything_metric_depth_indoor.pt",
+        "depth_anything_metric_depth_outdoor.pt",
+    ],
+    "Metric3DPreprocessor": [
+        "metric_depth_vit_small_800k.pth",
+        "metric_depth_vit_large_800k.pth",
+        "metric_depth_vit_giant2_800k.pth",
+    ],
+    "Metric3D-NormalMapPreprocessor": [
+        "metric_depth_vit_small_800k.pth",
+        "metric_depth_vit_large_800k.pth",
+        "metric_depth_vit_giant2_800k.pth",
+    ],
+    # Segmentation
+    "BAE-NormalMapPreprocessor": "scannet.pt",
+    "OneFormer-COCO-SemSegPreprocessor": "150_16_swin_l_oneformer_coco_100ep.pth",
+    "OneFormer-ADE20K-SemSegPreprocessor": "250_16_swin_l_oneformer_ade20k_160k.pth",
+    "UniFormer-SemSegPreprocessor": "upernet_global_small.pth",
+    "SemSegPreprocessor": "upernet_global_small.pth",
+    "AnimeFace_SemSegPreprocessor": ["UNet.pth", "isnetis.ckpt"],
+    "SAMPreprocessor": "mobile_sam.pt",
+    "DSINE-NormalMapPreprocessor": "dsine.pt",
+    # Line extractors
+    "AnimeLineArtPreprocessor": "netG.pth",
+    "HEDPreprocessor": "ControlNetHED.pth",
+    "FakeScribblePreprocessor": "ControlNetHED.pth",
+    "M-LSDPreprocessor": "mlsd_large_512_fp32.pth",
+    "PiDiNetPreprocessor": "table5_pidinet.pth",
+    "LineArtPreprocessor": ["sk_model.pth", "sk_model2.pth"],
+    "Manga2Anime_LineArt_Preprocessor": "erika.pth",
+    "TEEDPreprocessor": "7_model.pth",
+    "DiffusionEdge_Preprocessor": [
+        "diffusion_edge_indoor.pt",
+        "diffusion_edge_natrual.pt",  # model has a typo
+        "diffusion_edge_urban.pt",
+        "vgg16-397923af.pth",
+        "swin_b-68c6b09e.pth",
+    ],
+    "AnyLineArtPreprocessor_aux": [
+        "MTEED.pth",
+        "erika.pth",
+        "netG.pth",
+        "sk_model2.pth",
+    ],
+    # Pose
+    "OpenposePreprocessor": [
+        "body_pose_model.pth",
+        "hand_pose_model.pth",
+        "facenet.pth",
+    ],
+    # Optical flow
+    "Unimatch_OptFlowPreprocessor": [
+        "gmflow-scale1-mixdata.pth",
+        "gmflow-scale2-mixdata.pth",
+        "gmflow-scale2-regrefine6-mixdata.pth",
+    ],
+}
+
+# Runs any preprocessor above, named by its preprocessor input
+AIO_PREPROCESSOR = "AIO_Preprocessor"
+
 
 class ComfyUI_Controlnet_Aux(CustomNodeHelper):
+    node_types = list(NODE_CLASS_MAPPING) + [AIO_PREPROCESSOR]
+
     @staticmethod
     def prepare(**kwargs):
         kwargs["weights_downloader"].download_if_not_exists(
@@ -86,96 +176,13 @@ class ComfyUI_Controlnet_Aux(CustomNodeHelper):
             for key in MODELS
         }
 
-    # Controlnet preprocessor models are not included in the API JSON
-    # We need to add them manually based on the nodes being used to
-    # avoid them being downloaded automatically from elsewhere
     @staticmethod
     def node_class_mapping():
-        return {
-            # Depth
-            "MiDaS-NormalMapPreprocessor": "dpt_hybrid-midas-501f0c75.pt",
-            "MiDaS-DepthMapPreprocessor": "dpt_hybrid-midas-501f0c75.pt",
-            "Zoe-DepthMapPreprocessor": "ZoeD_M12_N.pt",
-            "LeReS-DepthMapPreprocessor": ["res101.pth", "latest_net_G.pth"],
-            "MeshGraphormer-DepthMapPreprocessor": [
-                "hrnetv2_w64_imagenet_pretrained.pth",
-                "graphormer_hand_state_dict.bin",
-            ],
-            "DepthAnythingPreprocessor": [
-                "depth_anything_vitl14.pth",
-                "depth_anything_vitb14.pth",
-                "depth_anything_vits14.pth",
-            ],
-            "DepthAnythingV2Preprocessor": [
-                "depth_anything_v2_vitl.pth",
-                "depth_anything_v2_vitg.pth",
-                "depth_anything_v2_vitb.pth",
-                "depth_anything_v2_vits.pth",
-                "depth_anything_v2_metric_vkitti_vitl.pth",
-                "depth_anything_v2_metric_hypersim_vitl.pth",
-            ],
-            "Zoe_DepthAnythingPreprocessor": [
-                "depth_anything_metric_depth_indoor.pt",
-                "depth_anything_metric_depth_outdoor.pt",
-            ],
-            "Metric3DPreprocessor": [
-                "metric_depth_vit_small_800k.pth",
-                "metric_depth_vit_large_800k.pth",
-                "metric_depth_vit_giant2_800k.pth",
-            ],
-            "Metric3D-NormalMapPreprocessor": [
-                "metric_depth_vit_small_800k.pth",
-                "metric_depth_vit_large_800k.pth",
-                "metric_depth_vit_giant2_800k.pth",
-            ],
-            # Segmentation
-            "BAE-NormalMapPreprocessor": "scannet.pt",
-            "OneFormer-COCO-SemSegPreprocessor": "150_16_swin_l_oneformer_coco_100ep.pth",
-            "OneFormer-ADE20K-SemSegPreprocessor": "250_16_swin_l_oneformer_ade20k_160k.pth",
-            "UniFormer-SemSegPreprocessor": "upernet_global_small.pth",
-            "SemSegPreprocessor": "upernet_global_small.pth",
-            "AnimeFace_SemSegPreprocessor": ["UNet.pth", "isnetis.ckpt"],
-            "SAMPreprocessor": "mobile_sam.pt",
-            "DSINE-NormalMapPreprocessor": "dsine.pt",
-            # Line extractors
-            "AnimeLineArtPreprocessor": "netG.pth",
-            "HEDPreprocessor": "ControlNetHED.pth",
-            "FakeScribblePreprocessor": "ControlNetHED.pth",
-            "M-LSDPreprocessor": "mlsd_large_512_fp32.pth",
-            "PiDiNetPreprocessor": "table5_pidinet.pth",
-            "LineArtPreprocessor": ["sk_model.pth", "sk_model2.pth"],
-            "Manga2Anime_LineArt_Preprocessor": "erika.pth",
-            "TEEDPreprocessor": "7_model.pth",
-            "DiffusionEdge_Preprocessor": [
-                "diffusion_edge_indoor.pt",
-                "diffusion_edge_natrual.pt",  # model has a typo
-                "diffusion_edge_urban.pt",
-                "vgg16-397923af.pth",
-                "swin_b-68c6b09e.pth",
-            ],
-            "AnyLineArtPreprocessor_aux": [
-                "MTEED.pth",
-                "erika.pth",
-                "netG.pth",
-                "sk_model2.pth",
-            ],
-            # Pose
-            "OpenposePreprocessor": [
-                "body_pose_model.pth",
-                "hand_pose_model.pth",
-                "facenet.pth",
-            ],
-            # Optical flow
-            "Unimatch_OptFlowPreprocessor": [
-                "gmflow-scale1-mixdata.pth",
-                "gmflow-scale2-mixdata.pth",
-                "gmflow-scale2-regrefine6-mixdata.pth",
-            ],
-        }
+        return NODE_CLASS_MAPPING
 
     @staticmethod
-    def add_weights(weights_to_download, node):
-        node_mapping = ComfyUI_Controlnet_Aux.node_class_mapping()
+    def add_weights(weights_to_download, node, **kwargs):
+        node_mapping = NODE_CLASS_MAPPING
 
         if node.is_type_in(node_mapping.keys()):
             class_weights = node_mapping[node.type()]
@@ -184,7 +191,7 @@ class ComfyUI_Controlnet_Aux(CustomNodeHelper):
             )
 
         # Additional check for AIO_Preprocessor and its preprocessor input value
-        if node.is_type("AIO_Preprocessor"):
+        if node.is_type(AIO_PREPROCESSOR):
             preprocessor = node.input("preprocessor")
             if preprocessor in node_mapping:
                 preprocessor_weights = node_mapping[preprocessor]
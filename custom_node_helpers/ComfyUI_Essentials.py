@@ -1,8 +1,11 @@
 from custom_node_helper import CustomNodeHelper
 
+CLIPSEG_LOADER = "LoadCLIPSegModels"
 
 class ComfyUI_Essentials(CustomNodeHelper):
+    node_types = [CLIPSEG_LOADER]
+
     @staticmethod
-    def add_weights(weights_to_download, node):
-        if node.is_type("LoadCLIPSegModels"):
+    def add_weights(weights_to_download, node, **kwargs):
+        if node.is_type(CLIPSEG_LOADER):
             weights_to_download.extend(["models--CIDAS--clipseg-rd64-refined"])
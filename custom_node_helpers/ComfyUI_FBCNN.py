@@ -1,7 +1,11 @@
 from custom_node_helper import CustomNodeHelper
 
+FBCNN_NODE = "JPEG artifacts removal FBCNN"
+
 class ComfyUI_FBCNN(CustomNodeHelper):
+    node_types = [FBCNN_NODE]
+
     @staticmethod
-    def add_weights(weights_to_download, node):
-        if node.is_type("JPEG artifacts removal FBCNN"):
+    def add_weights(weights_to_download, node, **kwargs):
+        if node.is_type(FBCNN_NODE):
             weights_to_download.append("fbcnn_color.pth")
@@ -9,12 +9,16 @@ FLASHVSR_WEIGHTS = [
     "Prompt.safetensors",
 ]
 
+FLASHVSR_NODES = [
+    "AILab_FlashVSR",
+    "AILab_FlashVSR_Advanced",
+]
+
 
 class ComfyUI_FlashVSR(CustomNodeHelper):
+    node_types = FLASHVSR_NODES
+
     @staticmethod
-    def add_weights(weights_to_download, node):
-        if node.is_type_in([
-            "AILab_FlashVSR",
-            "AILab_FlashVSR_Advanced",
-        ]):
+    def add_weights(weights_to_download, node, **kwargs):
+        if node.is_type_in(FLASHVSR_NODES):
             weights_to_download.extend(FLASHVSR_WEIGHTS)
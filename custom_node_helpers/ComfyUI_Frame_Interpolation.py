@@ -35,6 +35,16 @@ FRAME_INTERPOLATION_MODELS_PATH = (
 
 
 class ComfyUI_Frame_Interpolation(CustomNodeHelper):
+    unsupported_nodes = {
+        "IFRNet VFI": "Use RIFE or FILM - IFRNet weights are not available",
+        "IFUnet VFI": "Use RIFE or FILM - IFUnet weights are not available",
+        "MCM VFI": "Use RIFE or FILM - MCM is not available because cupy is not installed",
+        "GMFSS Fortuna VFI": "Use RIFE or FILM - GMFSS Fortuna VFI is not available because cupy is not installed",
+        "Sepconv VFI": "Use RIFE or FILM - Sepconv VFI is not available because cupy is not installed",
+        "STMFNet VFI": "Use RIFE or FILM - STMFNet VFI is not available because cupy is not installed",
+        "FLAVR VFI": "Use RIFE or FILM - FLAVR VFI weights are not available",
+    }
+
     @staticmethod
     def models():
         return RIFE_MODELS + FILM_MODELS + AMT_MODELS + CAIN_MODELS
@@ -55,16 +65,3 @@ class ComfyUI_Frame_Interpolation(CustomNodeHelper):
                     "dest": f"{FRAME_INTERPOLATION_MODELS_PATH}/{category}",
                 }
         return weights
-
-    @staticmethod
-    def check_for_unsupported_nodes(node):
-        unsupported_nodes = {
-            "IFRNet VFI": "Use RIFE or FILM - IFRNet weights are not available",
-            "IFUnet VFI": "Use RIFE or FILM - IFUnet weights are not available",
-            "MCM VFI": "Use RIFE or FILM - MCM is not available because cupy is not installed",
-            "GMFSS Fortuna VFI": "Use RIFE or FILM - GMFSS Fortuna VFI is not available because cupy is not installed",
-            "Sepconv VFI": "Use RIFE or FILM - Sepconv VFI is not available because cupy is not installed",
-            "STMFNet VFI": "Use RIFE or FILM - STMFNet VFI is not available because cupy is not installed",
-            "FLAVR VFI": "Use RIFE or FILM - FLAVR VFI weights are not available",
-        }
-        node.raise_if_unsupported(unsupported_nodes)
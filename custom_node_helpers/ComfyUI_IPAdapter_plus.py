@@ -22,8 +22,17 @@ PRESETS = [
     "Kolors",
 ]
 
+UNIFIED_LOADERS = [
+    "IPAdapterUnifiedLoader",
+    "IPAdapterUnifiedLoaderFaceID",
+    "IPAdapterUnifiedLoaderCommunity",
+]
+INSIGHTFACE_LOADER = "IPAdapterInsightFaceLoader"
+
 
 class ComfyUI_IPAdapter_plus(CustomNodeHelper):
+    node_types = UNIFIED_LOADERS + [INSIGHTFACE_LOADER]
+
     @staticmethod
     def prepare(**kwargs):
         # create the ipadapter folder in ComfyUI/models/ipadapter
@@ -143,19 +152,13 @@ class ComfyUI_IPAdapter_plus(CustomNodeHelper):
         return weights_to_add
 
     @staticmethod
-    def add_weights(weights_to_download, node):
-        if node.is_type_in(
-            [
-                "IPAdapterUnifiedLoader",
-                "IPAdapterUnifiedLoaderFaceID",
-                "IPAdapterUnifiedLoaderCommunity",
-            ]
-        ):
+    def add_weights(weights_to_download, node, **kwargs):
+        if node.is_type_in(UNIFIED_LOADERS):
             preset = node.input("preset")
             print(f"Including weights for IPAdapter preset: {preset}")
             if preset:
                 weights_to_download.extend(
                     ComfyUI_IPAdapter_plus.get_preset_weights(preset)
                 )
-        elif node.is_type("IPAdapterInsightFaceLoader"):
+        elif node.is_type(INSIGHTFACE_LOADER):
             weights_to_download.append("models/buffalo_l")
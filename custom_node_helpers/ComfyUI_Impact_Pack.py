@@ -1,9 +1,13 @@
 from custom_node_helper import CustomNodeHelper
 
+DETECTOR_PROVIDER = "UltralyticsDetectorProvider"
+
 class ComfyUI_Impact_Pack(CustomNodeHelper):
+    node_types = [DETECTOR_PROVIDER]
+
     @staticmethod
-    def add_weights(weights_to_download, node):
-        if node.is_type("UltralyticsDetectorProvider"):
+    def add_weights(weights_to_download, node, **kwargs):
+        if node.is_type(DETECTOR_PROVIDER):
             weights_to_download.extend([
                 "bbox/hand_yolov8s.pt",
                 "bbox/face_yolov8m.pt",
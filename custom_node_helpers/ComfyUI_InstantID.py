@@ -1,18 +1,23 @@
 from custom_node_helper import CustomNodeHelper
 
+FACE_ANALYSIS = "InstantIDFaceAnalysis"
+MODEL_LOADER = "InstantIDModelLoader"
+CONTROLNET_LOADER = "ControlNetLoader"
 
 class ComfyUI_InstantID(CustomNodeHelper):
+    node_types = [FACE_ANALYSIS, MODEL_LOADER, CONTROLNET_LOADER]
+
     @staticmethod
-    def add_weights(weights_to_download, node):
-        if node.is_type("InstantIDFaceAnalysis"):
+    def add_weights(weights_to_download, node, **kwargs):
+        if node.is_type(FACE_ANALYSIS):
             weights_to_download.append("models/antelopev2")
         elif (
-            node.is_type("InstantIDModelLoader")
+            node.is_type(MODEL_LOADER)
             and node.input("instantid_file") == "ipadapter.bin"
         ):
             node.set_input("instantid_file", "instantid-ip-adapter.bin")
             weights_to_download.append("instantid-ip-adapter.bin")
-        elif node.is_type("ControlNetLoader"):
+        elif node.is_type(CONTROLNET_LOADER):
             if (
                 node.input("control_net_name")
                 == "instantid/diffusion_pytorch_model.safetensors"
@@ -1,7 +1,11 @@
 from custom_node_helper import CustomNodeHelper
 
+CLIPSEG_NODES = ["BatchCLIPSeg", "DownloadAndLoadCLIPSeg"]
+
 class ComfyUI_KJNodes(CustomNodeHelper):
+    node_types = CLIPSEG_NODES
+
     @staticmethod
-    def add_weights(weights_to_download, node):
-        if node.is_type_in(["BatchCLIPSeg", "DownloadAndLoadCLIPSeg"]):
+    def add_weights(weights_to_download, node, **kwargs):
+        if node.is_type_in(CLIPSEG_NODES):
             weights_to_download.extend(["models--CIDAS--clipseg-rd64-refined"])
@@ -1,7 +1,21 @@
 from custom_node_helper import CustomNodeHelper
 
+APPLY_NODES = [
+    "LayeredDiffusionApply",
+    "LayeredDiffusionJointApply",
+    "LayeredDiffusionCondApply",
+    "LayeredDiffusionCondJointApply",
+]
+DIFF_APPLY_NODE = "LayeredDiffusionDiffApply"
+DECODE_NODES = [
+    "LayeredDiffusionDecode",
+    "LayeredDiffusionDecodeRGBA",
+    "LayeredDiffusionDecodeSplit",
+]
 
 class ComfyUI_LayerDiffuse(CustomNodeHelper):
+    node_types = APPLY_NODES + [DIFF_APPLY_NODE] + DECODE_NODES
+
     @staticmethod
     def get_config_weights(config):
         config_weights_map = {
@@ -34,28 +48,13 @@ class ComfyUI_LayerDiffuse(CustomNodeHelper):
         return vae_weights_map.get(config, [])
 
     @staticmethod
-    def add_weights(weights_to_download, node):
-        if node.is_type_in(
-            [
-                "LayeredDiffusionApply",
-                "LayeredDiffusionJointApply",
-                "LayeredDiffusionCondApply",
-                "LayeredDiffusionCondJointApply",
-            ]
-        ):
+    def add_weights(weights_to_download, node, **kwargs):
+        if node.is_type_in(APPLY_NODES):
             config = node.input("config")
             weights_to_download.extend(ComfyUI_LayerDiffuse.get_config_weights(config))
-        elif node.is_type(
-            "LayeredDiffusionDiffApply",
-        ):
+        elif node.is_type(DIFF_APPLY_NODE):
             config = f"Diff, {node.input('config')}"
             weights_to_download.extend(ComfyUI_LayerDiffuse.get_config_weights(config))
-        elif node.is_type_in(
-            [
-                "LayeredDiffusionDecode",
-                "LayeredDiffusionDecodeRGBA",
-                "LayeredDiffusionDecodeSplit",
-            ]
-        ):
+        elif node.is_type_in(DECODE_NODES):
             sd_version = node.input("sd_version")
             weights_to_download.extend(ComfyUI_LayerDiffuse.get_vae_weights(sd_version))
@@ -1,7 +1,15 @@
 from custom_node_helper import CustomNodeHelper
 
+REACTOR_NODES = [
+    "ReActorFaceSwap",
+    "ReActorLoadFaceModel",
+    "ReActorSaveFaceModel",
+    "ReActorFaceSwapOpt",
+]
 
 class ComfyUI_Reactor(CustomNodeHelper):
+    node_types = REACTOR_NODES
+
     facedetection_weights = {
         "retinaface_resnet50": "detection_Resnet50_Final.pth",
         "retinaface_mobile0.25": "detection_mobilenet0.25_Final.pth",
@@ -10,15 +18,8 @@ class ComfyUI_Reactor(CustomNodeHelper):
     }
 
     @staticmethod
-    def add_weights(weights_to_download, node):
-        if node.is_type_in(
-            [
-                "ReActorFaceSwap",
-                "ReActorLoadFaceModel",
-                "ReActorSaveFaceModel",
-                "ReActorFaceSwapOpt",
-            ]
-        ):
+    def add_weights(weights_to_download, node, **kwargs):
+        if node.is_type_in(REACTOR_NODES):
             weights_to_download.append("models/buffalo_l")
             weights_to_download.append("parsing_parsenet.pth")
             weights_to_download.append("vit-base-nsfw-detector")
@@ -12,16 +12,18 @@ MODEL_WEIGHTS = {
     "GroundingDINO_SwinB (938MB)": "groundingdino_swinb_cogcoor.pth",
 }
 
+MODEL_LOADERS = [
+    "SAMModelLoader (segment anything)",
+    "GroundingDinoModelLoader (segment anything)",
+]
+
 
 class ComfyUI_Segment_Anything(CustomNodeHelper):
+    node_types = MODEL_LOADERS
+
     @staticmethod
-    def add_weights(weights_to_download, node):
-        if node.is_type_in(
-            [
-                "SAMModelLoader (segment anything)",
-                "GroundingDinoModelLoader (segment anything)",
-            ]
-        ):
+    def add_weights(weights_to_download, node, **kwargs):
+        if node.is_type_in(MODEL_LOADERS):
             model_name = node.input("model_name")
             if model_name in MODEL_WEIGHTS:
                 weights_to_download.append(MODEL_WEIGHTS[model_name])
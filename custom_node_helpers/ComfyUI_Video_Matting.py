@@ -9,18 +9,23 @@ RVM_MODELS = [
 
 BRIAAI_MODELS = ["briaai_rmbg_v1.4.pth"]
 
+BRIAAI_NODE = "BRIAAI Matting"
+RVM_NODE = "Robust Video Matting"
+
 
 class ComfyUI_Video_Matting(CustomNodeHelper):
+    node_types = [BRIAAI_NODE, RVM_NODE]
+
     @staticmethod
     def models():
         return RVM_MODELS + BRIAAI_MODELS
 
     @staticmethod
-    def add_weights(weights_to_download, node):
-        if node.is_type("BRIAAI Matting"):
+    def add_weights(weights_to_download, node, **kwargs):
+        if node.is_type(BRIAAI_NODE):
             weights_to_download.extend(BRIAAI_MODELS)
 
-        if node.is_type("Robust Video Matting"):
+        if node.is_type(RVM_NODE):
             weights_to_download.extend(RVM_MODELS)
 
     @staticmethod
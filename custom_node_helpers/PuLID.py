@@ -11,31 +11,36 @@ facexlib_models = [
     "parsing_parsenet.pth",
 ]
 
+EVA_CLIP_LOADERS = ["PulidEvaClipLoader", "PulidFluxEvaClipLoader"]
+APPLY_NODES = ["ApplyPulid", "ApplyPulidFlux"]
+INSIGHTFACE_LOADERS = ["PulidInsightFaceLoader", "PulidFluxInsightFaceLoader"]
+
 
 class PuLID(CustomNodeHelper):
+    node_types = EVA_CLIP_LOADERS + APPLY_NODES + INSIGHTFACE_LOADERS
+
     @staticmethod
-    def add_weights(weights_to_download, node):
-        if node.is_type_in(
-            [
-                "PulidEvaClipLoader",
-                "PulidFluxEvaClipLoader",
-                "ApplyPulid",
-                "ApplyPulidFlux",
-            ]
-        ):
-            from weights_downloader import WeightsDownloader
-
-            weights_downloader = WeightsDownloader()
-
-            if node.is_type_in(["PulidEvaClipLoader", "PulidFluxEvaClipLoader"]):
+    def add_weights(weights_to_download, node, **kwargs):
+        if node.is_type_in(EVA_CLIP_LOADERS + APPLY_NODES):
+            if node.is_type_in(EVA_CLIP_LOADERS):
                 weights_to_download.append("EVA02_CLIP_L_336_psz14_s6B.pt")
 
-            if node.is_type_in(["ApplyPulid", "ApplyPulidFlux"]):
-                for file in facexlib_models:
-                    weights_downloader.download_if_not_exists(
-                        file,
-                        f"{BASE_FILE_PATH}/facedetection/{file}.tar",
-                        FACEXLIB_PATH,
-                    )
-        elif node.is_type_in(["PulidInsightFaceLoader", "PulidFluxInsightFaceLoader"]):
+            if node.is_type_in(APPLY_NODES):
+                downloads = [
+                    (file, f"{BASE_FILE_PATH}/facedetection/{file}.tar", FACEXLIB_PATH)
+                    for file in facexlib_models
+                ]
+                context = kwargs.get("context")
+                if context is not None:
+                    for download in downloads:
+                        context.add_download(*download)
+                else:
+                    # Called outside a workflow load, so nothing else
+                    # will schedule these
+                    from weights_downloader import WeightsDownloader
+
+                    weights_downloader = WeightsDownloader()
+                    for download in downloads:
+                        weights_downloader.download_if_not_exists(*download)
+        elif node.is_type_in(INSIGHTFACE_LOADERS):
             weights_to_download.append("models/antelopev2")
@@ -2,10 +2,26 @@ import os
 import sys
 import importlib
 
+HELPERS = []
+
 current_dir = os.path.dirname(os.path.abspath(__file__))
-for file in os.listdir(current_dir):
+for file in sorted(os.listdir(current_dir)):
     if file.endswith(".py") and not file.startswith("__"):
         module_name = file[:-3]
         module = importlib.import_module(f".{module_name}", package=__name__)
         class_name = module_name
-        setattr(sys.modules[__name__], class_name, getattr(module, class_name))
+        helper = getattr(module, class_name)
+        setattr(sys.modules[__name__], class_name, helper)
+        HELPERS.append(helper)
+
+# Built once at import so each node needs a single lookup by class_type
+WEIGHTS_HELPERS_BY_NODE_TYPE = {}
+UNSUPPORTED_NODES = {}
+for helper in HELPERS:
+    for node_type in helper.node_types:
+        WEIGHTS_HELPERS_BY_NODE_TYPE.setdefault(node_type, []).append(helper)
+    UNSUPPORTED_NODES.update(helper.unsupported_nodes)
+
+
+def weights_helpers_for(node_type):
+    return WEIGHTS_HELPERS_BY_NODE_TYPE.get(node_type, [])
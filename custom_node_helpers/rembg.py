@@ -1,11 +1,15 @@
 from custom_node_helper import CustomNodeHelper
 
+# RemBGSession+ is in ComfyUI_essentials, Image Rembg is in WAS nodes
+REMBG_SESSION = "RemBGSession+"
+WAS_REMBG = "Image Rembg (Remove Background)"
 
 class rembg(CustomNodeHelper):
+    node_types = [REMBG_SESSION, WAS_REMBG]
+
     @staticmethod
-    def add_weights(weights_to_download, node):
-        # RemBGSession+ is in ComfyUI_essentials
-        if node.is_type("RemBGSession+"):
+    def add_weights(weights_to_download, node, **kwargs):
+        if node.is_type(REMBG_SESSION):
             model = node.input("model")
             model_weights = {
                 "u2net: general purpose": ["u2net.onnx"],
@@ -23,8 +27,7 @@ class rembg(CustomNodeHelper):
             if model in model_weights:
                 weights_to_download.extend(model_weights[model])
 
-        # Image Rembg (Remove Background) is in WAS nodes
-        elif node.is_type("Image Rembg (Remove Background)"):
+        elif node.is_type(WAS_REMBG):
             model = node.input("model")
             if model == "sam":
                 weights_to_download.extend(
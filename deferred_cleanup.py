@@ -0,0 +1,149 @@
+import os
+import time
+import uuid
+import shutil
+import threading
+from collections import deque
+
+TRASH_DIRECTORY_NAME = ".cog-trash"
+# Used for paths on the same filesystem, others use the root of their own
+TRASH_DIRECTORY = os.path.join("/tmp", TRASH_DIRECTORY_NAME)
+# When more than this many paths are waiting to be deleted, or free disk is
+# below MIN_FREE_BYTES, callers wait for deletion to catch up
+MAX_PENDING = 16
+MIN_FREE_BYTES = 5 * 1024 * 1024 * 1024
+BACKPRESSURE_TIMEOUT = 120
+
+
+class DeferredCleanup:
+    """
+    Removes directories and files without making the caller wait for them
+    to be deleted.
+
+    Each path is renamed into the trash directory of its filesystem, which
+    is instant however many files it holds, and a background thread deletes
+    the trash. There is one trash directory per filesystem, outside the
+    directories predictions use. Trash left behind by a previous process
+    is deleted too.
+    """
+
+    def __init__(self):
+        self.pending = deque()
+        self.condition = threading.Condition()
+        # Trash directory for each filesystem, by device id
+        self.trash_directories = {}
+        self.deleter = None
+
+    @staticmethod
+    def mount_point(path):
+        path = os.path.realpath(path)
+        device = os.stat(path).st_dev
+        while path != os.path.dirname(path):
+            parent = os.path.dirname(path)
+            if os.stat(parent).st_dev != device:
+                break
+            path = parent
+        return path
+
+    def trash_directory_for(self, path):
+        # rename only works within a filesystem, so each one has its own trash
+        parent = os.path.dirname(os.path.abspath(path))
+        device = os.stat(parent).st_dev
+        with self.condition:
+            trash_directory = self.trash_directories.get(device)
+            if trash_directory is not None:
+                return trash_directory
+
+            os.makedirs(os.path.dirname(TRASH_DIRECTORY), exist_ok=True)
+            if os.stat(os.path.dirname(TRASH_DIRECTORY)).st_dev == device:
+                trash_directory = TRASH_DIRECTORY
+            else:
+                trash_directory = os.path.join(
+                    self.mount_point(parent), TRASH_DIRECTORY_NAME
+                )
+            os.makedirs(trash_directory, exist_ok=True)
+            self.trash_directories[device] = trash_directory
+            self.pending.extend(
+                os.path.join(trash_directory, name)
+                for name in os.listdir(trash_directory)
+            )
+            return trash_directory
+
+    def is_backed_up(self, trash_directory):
+        if len(self.pending) > MAX_PENDING:
+            return True
+        return (
+            bool(self.pending)
+            and shutil.disk_usage(trash_directory).free < MIN_FREE_BYTES
+        )
+
+    def remove(self, path):
+        if not os.path.lexists(path):
+            return
+        try:
+            trash_directory = self.trash_directory_for(path)
+        except OSError as e:
+            print(f"⚠️  No trash directory for {path}, deleting it now: {e}")
+            self.delete(path)
+            return
+        self.start()
+
+        with self.condition:
+            deadline = time.time() + BACKPRESSURE_TIMEOUT
+            while self.is_backed_up(trash_directory) and time.time() < deadline:
+                self.condition.wait(timeout=1)
+
+        trashed_path = os.path.join(trash_directory, uuid.uuid4().hex)
+        try:
+            os.rename(path, trashed_path)
+        except OSError as e:
+            print(f"⚠️  Could not move {path} to trash, deleting it now: {e}")
+            self.delete(path)
+            return
+
+        with self.condition:
+            self.pending.append(trashed_path)
+            self.condition.notify_all()
+
+    def empty(self, directory):
+        # Swaps directory for a new empty one
+        self.remove(directory)
+        os.makedirs(directory, exist_ok=True)
+
+    @staticmethod
+    def delete(path):
+        if os.path.isdir(path) and not os.path.islink(path):
+            shutil.rmtree(path, ignore_errors=True)
+        elif os.path.lexists(path):
+            try:
+                os.remove(path)
+            except OSError as e:
+                print(f"⚠️  Could not delete {path}: {e}")
+
+    def start(self):
+        with self.condition:
+            if self.deleter is not None and self.deleter.is_alive():
+                return
+            self.deleter = threading.Thread(target=self.delete_pending, daemon=True)
+            self.deleter.start()
+
+    def delete_pending(self):
+        while True:
+            with self.condition:
+                while not self.pending:
+                    self.condition.wait()
+                path = self.pending[0]
+
+            self.delete(path)
+
+            with self.condition:
+                self.pending.popleft()
+                self.condition.notify_all()
+
+    def wait(self):
+        with self.condition:
+            while self.pending:
+                self.condition.wait()
+
+
+cleanup = DeferredCleanup()
@@ -0,0 +1,162 @@
+import time
+import threading
+import requests
+from concurrent.futures import ThreadPoolExecutor, FIRST_EXCEPTION, wait
+from config import config
+from weights_manifest import WeightsManifest
+from download_telemetry import telemetry as shared_telemetry
+from resumable_download import ResumableDownload
+
+MAX_CONCURRENT_DOWNLOADS = config["MAX_CONCURRENT_DOWNLOADS"]
+MAX_DOWNLOAD_CONNECTIONS = config["MAX_DOWNLOAD_CONNECTIONS"]
+SIZE_CHECK_TIMEOUT = 10
+MANIFEST_REFRESH_WAIT = 10
+
+
+class DownloadJob:
+    def __init__(self, weight_str, url, dest):
+        self.weight_str = weight_str
+        self.url = url
+        self.dest = dest
+        self.size = None
+
+
+class DownloadScheduler:
+    """
+    Downloads a set of weights with a bounded pool of workers.
+
+    Every weight is checked for availability before any download starts,
+    and the smallest files are started first so that a missing or failing
+    weight errors out before we spend minutes on a large checkpoint.
+    """
+
+    def __init__(
+        self,
+        weights_downloader,
+        max_workers=MAX_CONCURRENT_DOWNLOADS,
+        max_connections=MAX_DOWNLOAD_CONNECTIONS,
+        telemetry=shared_telemetry,
+    ):
+        self.weights_downloader = weights_downloader
+        self.telemetry = telemetry
+        self.max_workers = max(1, max_workers)
+        self.max_connections = max(1, max_connections)
+
+    def download(self, weight_strs, extra_downloads=()):
+        jobs = self.plan(weight_strs, extra_downloads)
+        if not jobs:
+            return
+
+        self.check_availability(jobs)
+        jobs.sort(key=lambda job: (job.size is None, job.size or 0))
+
+        workers = min(self.max_workers, len(jobs))
+        connections_per_job = max(1, self.max_connections // workers)
+        print(
+            f"⏳ Downloading {len(jobs)} weights with {workers} workers, {connections_per_job} connections each"
+        )
+
+        start = time.time()
+        abort = threading.Event()
+        executor = ThreadPoolExecutor(max_workers=workers)
+        futures = [
+            executor.submit(
+                self.weights_downloader.download_if_not_exists,
+                job.weight_str,
+                job.url,
+                job.dest,
+                connections_per_job,
+                job.size,
+                abort,
+                self.telemetry,
+            )
+            for job in jobs
+        ]
+        done, _ = wait(futures, return_when=FIRST_EXCEPTION)
+        failed = [future for future in done if future.exception() is not None]
+        if failed:
+            # Queued downloads are cancelled and running ones stop at their
+            # next chunk, keeping what they fetched so a retry can resume
+            abort.set()
+            executor.shutdown(wait=False, cancel_futures=True)
+            raise failed[0].exception()
+        executor.shutdown()
+
+        print(f"✅ Downloaded {len(jobs)} weights in {time.time() - start:.2f}s")
+
+    def plan(self, weight_strs, extra_downloads=()):
+        weights_map = self.weights_downloader.weights_map
+        unavailable = [w for w in weight_strs if w not in weights_map]
+        if unavailable and WeightsManifest.wait_for_first_refresh(
+            MANIFEST_REFRESH_WAIT
+        ):
+            # A newer manifest may have arrived while we were waiting
+            weights_map = self.weights_downloader.weights_map
+            unavailable = [w for w in weight_strs if w not in weights_map]
+        if unavailable:
+            raise ValueError(
+                f"{', '.join(unavailable)} unavailable. View the list of available weights: https://github.com/replicate/cog-comfyui/blob/main/supported_weights.md"
+            )
+
+        jobs = []
+        seen = set()
+
+        def add_job(weight_str, url, dest):
+            key = (weight_str, dest)
+            if key in seen:
+                return
+            seen.add(key)
+
+            if self.weights_downloader.check_if_file_exists(weight_str, dest):
+                self.telemetry.cache_hit(weight_str, dest)
+                return
+            jobs.append(DownloadJob(weight_str, url, dest))
+
+        for weight_str in weight_strs:
+            if self.weights_downloader.weights_manifest.is_non_commercial_only(
+                weight_str
+            ):
+                print(
+                    f"⚠️  {weight_str} is for non-commercial use only. Unless you have obtained a commercial license.\nDetails: https://github.com/replicate/cog-comfyui/blob/main/weights_licenses.md"
+                )
+
+            entries = weights_map[weight_str]
+            if not isinstance(entries, list):
+                entries = [entries]
+
+            for entry in entries:
+                add_job(weight_str, entry["url"], entry["dest"])
+
+        # Files helpers need that are not in the weights manifest
+        for weight_str, url, dest in extra_downloads:
+            add_job(weight_str, url, dest)
+
+        return jobs
+
+    def check_availability(self, jobs):
+        with ThreadPoolExecutor(max_workers=min(16, len(jobs))) as executor:
+            list(executor.map(self.fetch_size, jobs))
+
+        unavailable = [job.weight_str for job in jobs if job.size == -1]
+        if unavailable:
+            raise ValueError(
+                f"{', '.join(unavailable)} could not be found at the weights URL. View the list of available weights: https://github.com/replicate/cog-comfyui/blob/main/supported_weights.md"
+            )
+
+    @staticmethod
+    def fetch_size(job):
+        # Probed the same way the download is, so servers that reject HEAD
+        # (presigned GET-only URLs) fall back to a ranged GET. A size of -1
+        # marks a weight the server refuses to serve. Any other failure
+        # leaves the size unknown and the download is scheduled last, the
+        # download itself will report the error.
+        download = ResumableDownload(job.url, job.dest)
+        try:
+            job.size = download.probe(timeout=SIZE_CHECK_TIMEOUT)["size"]
+        except requests.HTTPError as e:
+            if e.response is not None and e.response.status_code in (403, 404, 410):
+                job.size = -1
+        except (requests.RequestException, ValueError):
+            pass
+        finally:
+            download.session.close()
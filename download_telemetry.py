@@ -0,0 +1,156 @@
+import time
+import threading
+from contextlib import contextmanager
+
+PROGRESS_INTERVAL = 5
+MB = 1024 * 1024
+
+
+def format_bytes(num_bytes):
+    if num_bytes >= 1024 * MB:
+        return f"{num_bytes / (1024 * MB):.2f}GB"
+    return f"{num_bytes / MB:.2f}MB"
+
+
+class DownloadTelemetry:
+    """
+    Records structured download events (start, progress, finish, cache_hit,
+    failure) and summarises them, alongside how long was spent downloading
+    compared to executing.
+
+    Each prediction records into its own instance from prediction(), so
+    concurrent predictions are summarised separately. Listeners added with
+    add_listener receive every event from every prediction as a dict.
+    """
+
+    def __init__(self, listeners=None):
+        self.lock = threading.Lock()
+        self.listeners = listeners if listeners is not None else []
+        self.last_progress = {}
+        self.events = []
+        self.phases = {}
+
+    def add_listener(self, listener):
+        self.listeners.append(listener)
+
+    def prediction(self):
+        return DownloadTelemetry(self.listeners)
+
+    def emit(self, event, weight_str, **fields):
+        record = {"event": event, "weight": weight_str, "time": time.time(), **fields}
+        with self.lock:
+            self.events.append(record)
+        for listener in self.listeners:
+            listener(record)
+        return record
+
+    def cache_hit(self, weight_str, dest):
+        self.emit("cache_hit", weight_str, dest=dest)
+        print(f"✅ {weight_str} exists in {dest}")
+
+    def start(self, weight_str, dest, url):
+        with self.lock:
+            self.last_progress[weight_str] = time.time()
+        self.emit("start", weight_str, dest=dest, url=url)
+        print(f"⏳ Downloading {weight_str} to {dest}")
+
+    def progress(self, weight_str, bytes_done, total_bytes, bytes_per_second):
+        # Called for every chunk, only reported every few seconds
+        now = time.time()
+        with self.lock:
+            if now - self.last_progress.get(weight_str, 0) < PROGRESS_INTERVAL:
+                return
+            self.last_progress[weight_str] = now
+
+        eta = (
+            (total_bytes - bytes_done) / bytes_per_second
+            if total_bytes and bytes_per_second
+            else None
+        )
+        self.emit(
+            "progress",
+            weight_str,
+            bytes=bytes_done,
+            total_bytes=total_bytes,
+            bytes_per_second=bytes_per_second,
+            eta_seconds=eta,
+        )
+        total = f"/{format_bytes(total_bytes)}" if total_bytes else ""
+        eta_str = f", ETA {eta:.0f}s" if eta is not None else ""
+        print(
+            f"⏳ {weight_str} {format_bytes(bytes_done)}{total} at {format_bytes(bytes_per_second)}/s{eta_str}"
+        )
+
+    def finish(self, weight_str, dest, size, elapsed):
+        with self.lock:
+            self.last_progress.pop(weight_str, None)
+        self.emit(
+            "finish",
+            weight_str,
+            dest=dest,
+            bytes=size,
+            seconds=elapsed,
+            bytes_per_second=size / elapsed if elapsed > 0 else 0,
+        )
+        print(
+            f"✅ {weight_str} downloaded to {dest} in {elapsed:.2f}s, size: {format_bytes(size)}"
+        )
+
+    def failure(self, weight_str, dest, error):
+        with self.lock:
+            self.last_progress.pop(weight_str, None)
+        self.emit("failure", weight_str, dest=dest, error=str(error))
+        print(f"❌ {weight_str} failed to download to {dest}: {error}")
+
+    @contextmanager
+    def phase(self, name):
+        start = time.time()
+        try:
+            yield
+        finally:
+            with self.lock:
+                self.phases[name] = self.phases.get(name, 0) + time.time() - start
+
+    def summary(self):
+        with self.lock:
+            events = list(self.events)
+            phases = dict(self.phases)
+
+        finished = [e for e in events if e["event"] == "finish"]
+        cache_hits = sum(1 for e in events if e["event"] == "cache_hit")
+        lookups = cache_hits + len(finished)
+        return {
+            "downloading_seconds": phases.get("downloading", 0),
+            "executing_seconds": phases.get("executing", 0),
+            "downloads": len(finished),
+            "bytes_downloaded": sum(e["bytes"] for e in finished),
+            "failures": sum(1 for e in events if e["event"] == "failure"),
+            "cache_hits": cache_hits,
+            "cache_hit_ratio": cache_hits / lookups if lookups else None,
+        }
+
+    def print_summary(self):
+        summary = self.summary()
+        downloading = summary["downloading_seconds"]
+        throughput = (
+            f" at {format_bytes(summary['bytes_downloaded'] / downloading)}/s"
+            if summary["bytes_downloaded"] and downloading
+            else ""
+        )
+        ratio = summary["cache_hit_ratio"]
+        hits = (
+            f"{summary['cache_hits']}/{summary['cache_hits'] + summary['downloads']} ({ratio:.0%})"
+            if ratio is not None
+            else "n/a"
+        )
+        print("====================================")
+        print(
+            f"Downloading: {downloading:.2f}s, {summary['downloads']} weights, {format_bytes(summary['bytes_downloaded'])}{throughput}"
+        )
+        print(f"Executing: {summary['executing_seconds']:.2f}s")
+        print(f"Weights cache hits: {hits}")
+        print("====================================")
+        return summary
+
+
+telemetry = DownloadTelemetry()
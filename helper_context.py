@@ -0,0 +1,20 @@
+class HelperContext:
+    """
+    Shared with custom node helpers while the weights for a workflow are
+    resolved. Helpers use it instead of constructing their own downloader,
+    and register files that are not plain weights with add_download so they
+    are deduplicated and scheduled alongside every other download.
+    """
+
+    def __init__(self, weights_downloader):
+        self.weights_downloader = weights_downloader
+        self.extra_downloads = []
+
+    @property
+    def weights_manifest(self):
+        return self.weights_downloader.weights_manifest
+
+    def add_download(self, weight_str, url, dest):
+        download = (weight_str, url, dest)
+        if download not in self.extra_downloads:
+            self.extra_downloads.append(download)
@@ -0,0 +1,75 @@
+import os
+import base64
+import hashlib
+
+# Shorter strings are cheap enough to leave in the workflow
+BASE64_IMAGE_MIN_LENGTH = 1024
+
+# How each image format starts once base64 encoded, and its file extension
+BASE64_IMAGE_SIGNATURES = {
+    "iVBORw0KGgo": ".png",
+    "/9j/": ".jpg",
+    "UklGR": ".webp",
+    "R0lGOD": ".gif",
+}
+
+# Nodes that load a base64 image, and the file loader that does the same.
+# ETN_LoadImageBase64 returns the image and a mask made the same way as LoadImage.
+FILE_LOADERS = {
+    "ETN_LoadImageBase64": "LoadImage",
+}
+
+
+def strip_data_url(value):
+    if value.startswith("data:") and ";base64," in value[:100]:
+        return value.split(",", 1)[1]
+    return value
+
+
+def base64_image_extension(value):
+    """
+    The file extension of the image value encodes, or None if it is not a
+    large base64 image.
+    """
+    if not isinstance(value, str) or len(value) < BASE64_IMAGE_MIN_LENGTH:
+        return None
+    value = strip_data_url(value)
+    for signature, extension in BASE64_IMAGE_SIGNATURES.items():
+        if value.startswith(signature):
+            return extension
+    return None
+
+
+def is_base64_image(value):
+    return base64_image_extension(value) is not None
+
+
+def offload_base64_images(workflow, input_directory):
+    """
+    Decodes large base64 images into input_directory once and switches
+    their nodes to the equivalent file loader, so the images are not sent
+    in the prompt or kept in ComfyUI's history.
+    """
+    for node_id, node in workflow.items():
+        file_loader = FILE_LOADERS.get(node.get("class_type"))
+        if file_loader is None:
+            continue
+
+        value = node.get("inputs", {}).get("image")
+        extension = base64_image_extension(value)
+        if extension is None:
+            continue
+
+        data = base64.b64decode(strip_data_url(value))
+        # Named by content, so a repeated image is written once
+        filename = f"base64_{hashlib.sha256(data).hexdigest()[:16]}{extension}"
+        path = os.path.join(input_directory, filename)
+        if not os.path.exists(path):
+            with open(path, "wb") as f:
+                f.write(data)
+
+        print(
+            f"Saved base64 image from node {node_id} to {filename} ({len(data)} bytes)"
+        )
+        node["class_type"] = file_loader
+        node["inputs"]["image"] = filename
@@ -0,0 +1,245 @@
+import os
+import json
+import time
+import uuid
+import shutil
+import hashlib
+import threading
+from collections import OrderedDict
+from concurrent.futures import ThreadPoolExecutor
+import requests
+from requests.adapters import HTTPAdapter
+
+# Kept on the same filesystem as the input directory so files can be hardlinked
+INPUT_CACHE_DIRECTORY = "/tmp/.input_cache"
+INPUT_CACHE_MAX_BYTES = 10 * 1024 * 1024 * 1024
+INPUT_FETCH_WORKERS = 8
+CHUNK_SIZE = 1024 * 1024
+REQUEST_TIMEOUT = 60
+
+
+class InputCache:
+    """
+    Downloads input URLs, streaming them to disk, and keeps them in an LRU
+    cache so the same reference image or video is not downloaded for every
+    prediction.
+
+    Each entry is keyed by URL and remembers the ETag and Last-Modified the
+    server sent. A cached URL is revalidated with a conditional request on
+    every use and only downloaded again if it has changed. URLs without
+    either validator are always downloaded.
+
+    Cached files are hardlinked into the input directory, falling back to a
+    copy across filesystems.
+    """
+
+    def __init__(self, directory=INPUT_CACHE_DIRECTORY, max_bytes=INPUT_CACHE_MAX_BYTES):
+        self.directory = directory
+        self.max_bytes = max_bytes
+        self.lock = threading.Lock()
+        self.url_locks = {}
+        self.session = requests.Session()
+        adapter = HTTPAdapter(pool_maxsize=INPUT_FETCH_WORKERS)
+        self.session.mount("http://", adapter)
+        self.session.mount("https://", adapter)
+        self.entries = OrderedDict()
+        self.load()
+
+    def load(self):
+        os.makedirs(self.directory, exist_ok=True)
+        entries = []
+        for name in os.listdir(self.directory):
+            if name.endswith(".partial"):
+                os.remove(os.path.join(self.directory, name))
+                continue
+            if not name.endswith(".json"):
+                continue
+            key = name[: -len(".json")]
+            try:
+                with open(self.metadata_path(key), "r") as f:
+                    metadata = json.load(f)
+                last_used = os.path.getmtime(self.content_path(key))
+            except (OSError, ValueError):
+                self.evict(key)
+                continue
+            entries.append((last_used, key, metadata))
+
+        for _, key, metadata in sorted(entries, key=lambda entry: entry[0]):
+            self.entries[key] = metadata
+
+    @staticmethod
+    def key(url):
+        return hashlib.sha256(url.encode("utf-8")).hexdigest()
+
+    def content_path(self, key):
+        return os.path.join(self.directory, key)
+
+    def metadata_path(self, key):
+        return os.path.join(self.directory, f"{key}.json")
+
+    def url_lock(self, key):
+        with self.lock:
+            return self.url_locks.setdefault(key, threading.Lock())
+
+    def fetch(self, url, destination=None):
+        """
+        Returns the path of the cached copy of url, downloading it if it is
+        not cached or has changed. If a destination is given the cached
+        copy is linked there.
+        """
+        key = self.key(url)
+        # Predictions fetching the same URL at once share one download
+        with self.url_lock(key):
+            with self.lock:
+                metadata = self.entries.get(key)
+
+            headers = {}
+            if metadata and os.path.exists(self.content_path(key)):
+                if metadata.get("etag"):
+                    headers["If-None-Match"] = metadata["etag"]
+                if metadata.get("last_modified"):
+                    headers["If-Modified-Since"] = metadata["last_modified"]
+
+            with self.session.get(
+                url, headers=headers, stream=True, timeout=REQUEST_TIMEOUT
+            ) as response:
+                if response.status_code == 304:
+                    print(f"✅ {url} is cached")
+                    self.touch(key)
+                else:
+                    response.raise_for_status()
+                    self.store(key, url, response)
+
+            if destination:
+                self.link(self.content_path(key), destination)
+
+        self.evict_least_recently_used()
+        return destination or self.content_path(key)
+
+    def version(self, url):
+        """
+        Returns what identifies the current content of url, its ETag and
+        Last-Modified, without downloading it. None if the server sends
+        neither or cannot be reached.
+        """
+        try:
+            response = self.session.head(
+                url, allow_redirects=True, timeout=REQUEST_TIMEOUT
+            )
+            response.raise_for_status()
+        except requests.exceptions.RequestException:
+            return None
+        etag = response.headers.get("ETag")
+        last_modified = response.headers.get("Last-Modified")
+        if not etag and not last_modified:
+            return None
+        return [etag, last_modified]
+
+    def store(self, key, url, response):
+        partial_path = f"{self.content_path(key)}.{uuid.uuid4().hex}.partial"
+        size = 0
+        try:
+            with open(partial_path, "wb") as f:
+                for chunk in response.iter_content(chunk_size=CHUNK_SIZE):
+                    f.write(chunk)
+                    size += len(chunk)
+            # Replacing rather than rewriting leaves files already linked
+            # from an input directory untouched
+            os.replace(partial_path, self.content_path(key))
+        finally:
+            if os.path.exists(partial_path):
+                os.remove(partial_path)
+
+        metadata = {
+            "url": url,
+            "etag": response.headers.get("ETag"),
+            "last_modified": response.headers.get("Last-Modified"),
+            "size": size,
+        }
+        with open(self.metadata_path(key), "w") as f:
+            json.dump(metadata, f)
+        with self.lock:
+            self.entries[key] = metadata
+            self.entries.move_to_end(key)
+
+    def touch(self, key):
+        os.utime(self.content_path(key))
+        with self.lock:
+            if key in self.entries:
+                self.entries.move_to_end(key)
+
+    def evict(self, key):
+        for path in [self.content_path(key), self.metadata_path(key)]:
+            if os.path.exists(path):
+                os.remove(path)
+
+    def evict_least_recently_used(self):
+        with self.lock:
+            total = sum(metadata.get("size", 0) for metadata in self.entries.values())
+            evicted = []
+            # The most recent entry is always kept, however large
+            while total > self.max_bytes and len(self.entries) > 1:
+                key, metadata = self.entries.popitem(last=False)
+                total -= metadata.get("size", 0)
+                evicted.append(key)
+        for key in evicted:
+            with self.url_lock(key):
+                self.evict(key)
+
+    @staticmethod
+    def link(cached_path, destination):
+        # Linked or copied under a new name, then swapped in, so nothing is
+        # ever written through a path that may be a link to the cache
+        partial_path = f"{destination}.{uuid.uuid4().hex}.partial"
+        try:
+            try:
+                os.link(cached_path, partial_path)
+            except OSError:
+                shutil.copyfile(cached_path, partial_path)
+            os.replace(partial_path, destination)
+        finally:
+            if os.path.lexists(partial_path):
+                os.remove(partial_path)
+
+    def place_all(self, downloads):
+        """
+        Fetches every url in downloads, a dict of url to destination, at the
+        same time. Returns the destinations that could not be downloaded.
+        Only the first url for each destination is fetched, later ones are
+        reported as failed.
+        """
+        failed = []
+        if not downloads:
+            return failed
+
+        urls_by_destination = {}
+        for url, destination in downloads.items():
+            if destination in urls_by_destination:
+                print(
+                    f"❌ {url} and {urls_by_destination[destination]} would both be saved to {destination}"
+                )
+                failed.append(destination)
+            else:
+                urls_by_destination[destination] = url
+
+        def place(url, destination):
+            print(f"Downloading {url} to {destination}")
+            start = time.time()
+            try:
+                self.fetch(url, destination)
+                print(f"✅ {destination} ({time.time() - start:.2f}s)")
+            except (requests.exceptions.RequestException, OSError) as e:
+                print(f"❌ Error downloading {url}: {e}")
+                failed.append(destination)
+
+        with ThreadPoolExecutor(max_workers=INPUT_FETCH_WORKERS) as executor:
+            list(
+                executor.map(
+                    place, urls_by_destination.values(), urls_by_destination.keys()
+                )
+            )
+        return failed
+
+    def fetch_text(self, url):
+        with open(self.fetch(url), "r", encoding="utf-8") as f:
+            return f.read()
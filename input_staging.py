@@ -0,0 +1,121 @@
+import os
+import fcntl
+import shutil
+import tarfile
+import zipfile
+import posixpath
+from concurrent.futures import ThreadPoolExecutor
+
+EXTRACT_WORKERS = 8
+# From linux/fs.h, clones a file's extents on filesystems that support it
+FICLONE = 0x40049409
+
+
+def reflink(source, destination):
+    with open(source, "rb") as src, open(destination, "wb") as dst:
+        fcntl.ioctl(dst.fileno(), FICLONE, src.fileno())
+
+
+def stage_file(source, destination):
+    """
+    Puts source at destination without copying its contents where possible:
+    a hardlink on the same filesystem, then a reflink, then a copy.
+    """
+    if os.path.lexists(destination):
+        os.remove(destination)
+    try:
+        os.link(source, destination)
+        return
+    except OSError:
+        pass
+    try:
+        reflink(source, destination)
+        return
+    except OSError:
+        if os.path.exists(destination):
+            os.remove(destination)
+    shutil.copyfile(source, destination)
+
+
+def normalise(path):
+    return posixpath.normpath(path.replace("\\", "/")).lstrip("/")
+
+
+def referenced_paths(workflow, input_directory):
+    """
+    Every string input that could name a file or directory in the input
+    directory, relative to it.
+    """
+    input_directory = normalise(os.path.abspath(input_directory))
+    paths = set()
+    for node in workflow.values():
+        for value in node.get("inputs", {}).values():
+            if not isinstance(value, str) or not value or "\n" in value:
+                continue
+            path = normalise(value)
+            if path.startswith(f"{input_directory}/"):
+                path = path[len(input_directory) + 1 :]
+            paths.add(path)
+    return paths
+
+
+def is_referenced(member_name, paths, basenames):
+    name = normalise(member_name)
+    if name in paths or posixpath.basename(name) in basenames:
+        return True
+    # Batch loaders take a whole directory
+    parent = posixpath.dirname(name)
+    while parent:
+        if parent in paths:
+            return True
+        parent = posixpath.dirname(parent)
+    return False
+
+
+def select_members(names, referenced):
+    if referenced is None:
+        return names
+    basenames = {posixpath.basename(path) for path in referenced}
+    selected = [name for name in names if is_referenced(name, referenced, basenames)]
+    # Nodes can read files the workflow never names, so when nothing
+    # matches, everything is extracted rather than nothing
+    return selected or names
+
+
+def extract_zip(archive, destination, referenced=None):
+    with zipfile.ZipFile(archive, "r") as zip_ref:
+        names = [info.filename for info in zip_ref.infolist() if not info.is_dir()]
+    names = select_members(names, referenced)
+
+    # Directories are made up front so workers do not race to create them
+    for name in names:
+        parts = [p for p in posixpath.dirname(name).split("/") if p not in ("", ".", "..")]
+        os.makedirs(os.path.join(destination, *parts), exist_ok=True)
+
+    def extract(chunk):
+        # Each worker reads through its own handle
+        with zipfile.ZipFile(archive, "r") as zip_ref:
+            for name in chunk:
+                zip_ref.extract(name, destination)
+
+    workers = min(EXTRACT_WORKERS, len(names)) or 1
+    chunks = [names[i::workers] for i in range(workers)]
+    with ThreadPoolExecutor(max_workers=workers) as executor:
+        list(executor.map(extract, chunks))
+    return names
+
+
+def extract_tar(archive, destination, referenced=None):
+    # Compressed tars can only be read front to back, so members are
+    # extracted in one pass
+    with tarfile.open(archive, "r") as tar:
+        files = [member for member in tar.getmembers() if not member.isdir()]
+        names = select_members([member.name for member in files], referenced)
+        if len(names) == len(files):
+            tar.extractall(destination)
+        else:
+            wanted = set(names)
+            tar.extractall(
+                destination, members=[m for m in files if m.name in wanted]
+            )
+    return names
@@ -0,0 +1,74 @@
+from collections import deque
+
+# Below this many patterns, one `in` check per pattern (done in C) beats
+# walking an Aho-Corasick automaton one character at a time in Python
+AHO_CORASICK_MIN_PATTERNS = 300
+
+
+class MultiPatternMatcher:
+    """
+    Finds which of a fixed set of substrings occur anywhere in a text.
+
+    patterns maps each substring to the value returned when it is found.
+    Matching is plain substring containment, the same as `pattern in text`
+    for every pattern, including overlapping matches. Large pattern sets
+    are compiled into an Aho-Corasick automaton so a text is scanned once
+    regardless of how many patterns there are.
+    """
+
+    def __init__(self, patterns, min_automaton_patterns=AHO_CORASICK_MIN_PATTERNS):
+        self.patterns = dict(patterns)
+        # The empty string is contained in every text
+        self.always = [v for k, v in self.patterns.items() if k == ""]
+        self.use_automaton = len(self.patterns) >= min_automaton_patterns
+        if self.use_automaton:
+            self._build_automaton()
+
+    def _build_automaton(self):
+        self.goto = [{}]
+        self.fail = [0]
+        self.out = [[]]
+
+        for pattern, value in self.patterns.items():
+            if not pattern:
+                continue
+            state = 0
+            for char in pattern:
+                next_state = self.goto[state].get(char)
+                if next_state is None:
+                    next_state = len(self.goto)
+                    self.goto.append({})
+                    self.fail.append(0)
+                    self.out.append([])
+                    self.goto[state][char] = next_state
+                state = next_state
+            self.out[state].append(value)
+
+        queue = deque(self.goto[0].values())
+        while queue:
+            state = queue.popleft()
+            for char, next_state in self.goto[state].items():
+                queue.append(next_state)
+                fallback = self.fail[state]
+                while fallback and char not in self.goto[fallback]:
+                    fallback = self.fail[fallback]
+                self.fail[next_state] = self.goto[fallback].get(char, 0)
+                self.out[next_state] = self.out[next_state] + self.out[
+                    self.fail[next_state]
+                ]
+
+    def find(self, text):
+        """Returns the values of every pattern found in text, each once."""
+        if not self.use_automaton:
+            return [v for k, v in self.patterns.items() if k in text]
+
+        goto, fail, out = self.goto, self.fail, self.out
+        found = dict.fromkeys(self.always)
+        state = 0
+        for char in text:
+            while state and char not in goto[state]:
+                state = fail[state]
+            state = goto[state].get(char, 0)
+            if out[state]:
+                found.update(dict.fromkeys(out[state]))
+        return list(found)
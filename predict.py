@@ -1,17 +1,27 @@
 import os
+import time
+import uuid
+import queue
+import asyncio
 import shutil
-import tarfile
-import zipfile
+import threading
 import mimetypes
 from PIL import Image
-from typing import List, Optional
+from typing import AsyncIterator, List, Optional
 from cog import BasePredictor, Input, Path
-from comfyui import ComfyUI
+from comfyui import ComfyUI, DIRECT_SAVE_NODE
 from weights_downloader import WeightsDownloader
-from cog_model_helpers import optimise_images
+from cog_model_helpers import optimise_images, optimise_videos
+from concurrent.futures import ThreadPoolExecutor
+from deferred_cleanup import cleanup
 from config import config
 import requests
 import base64
+import json
+import yaml
+import input_staging
+from result_cache import ResultCache
+from prediction_context import PredictionContext
 
 
 os.environ["DOWNLOAD_LATEST_WEIGHTS_MANIFEST"] = "true"
@@ -26,6 +36,31 @@ INPUT_DIR = "/tmp/inputs"
 COMFYUI_TEMP_OUTPUT_DIR = "ComfyUI/temp"
 ALL_DIRECTORIES = [OUTPUT_DIR, INPUT_DIR, COMFYUI_TEMP_OUTPUT_DIR]
 
+
+def max_concurrent_predictions():
+    # cog.yaml's concurrency.max is the one place this is set
+    try:
+        with open("cog.yaml", "r") as f:
+            cog_config = yaml.safe_load(f) or {}
+    except OSError:
+        return 1
+    return (cog_config.get("concurrency") or {}).get("max", 1)
+
+
+# With more than one concurrent prediction, each one gets its own input and
+# output directories and nothing global is cleared or interrupted
+CONCURRENT_PREDICTIONS = max_concurrent_predictions() > 1
+# Return each node's outputs as soon as it has run, rather than all at the end
+STREAM_OUTPUTS = config["STREAM_OUTPUTS"]
+# Extract only the members of an input archive that the workflow refers to
+LAZY_INPUT_EXTRACTION = config["LAZY_INPUT_EXTRACTION"]
+# Return the outputs of an identical earlier prediction when seeds are not randomised
+RESULT_CACHE = config["RESULT_CACHE"]
+# How hard images are compressed: "fast", "balanced" or "small"
+IMAGE_ENCODER_PRESET = config["IMAGE_ENCODER_PRESET"]
+# Files from finished concurrent predictions are kept long enough for cog to upload them
+FINISHED_FILES_TTL = 10 * 60
+
 IMAGE_TYPES = [".jpg", ".jpeg", ".png", ".webp"]
 VIDEO_TYPES = [".mp4", ".mov", ".avi", ".mkv", ".webm"]
 
@@ -44,6 +79,9 @@ class Predictor(BasePredictor):
 
         self.comfyUI = ComfyUI("127.0.0.1:8188")
         self.comfyUI.start_server(OUTPUT_DIR, INPUT_DIR)
+        self.finished_files = []
+        self.finished_files_lock = threading.Lock()
+        self.result_cache = ResultCache() if RESULT_CACHE else None
 
     def handle_user_weights(self, weights: str):
         if hasattr(weights, "url"):
@@ -76,23 +114,30 @@ class Predictor(BasePredictor):
                                     f"Skipping {file} because it already exists in {destination}"
                                 )
 
-    def handle_input_file(self, input_file: Path):
+    def handle_input_file(
+        self, input_file: Path, input_dir: str = INPUT_DIR, workflow=None
+    ):
         file_extension = self.get_file_extension(input_file)
 
+        # Only the archive members the workflow refers to are extracted
+        referenced = None
+        if LAZY_INPUT_EXTRACTION and workflow is not None:
+            referenced = input_staging.referenced_paths(workflow, input_dir)
+
         if file_extension == ".tar":
-            with tarfile.open(input_file, "r") as tar:
-                tar.extractall(INPUT_DIR)
+            staged = input_staging.extract_tar(input_file, input_dir, referenced)
         elif file_extension == ".zip":
-            with zipfile.ZipFile(input_file, "r") as zip_ref:
-                zip_ref.extractall(INPUT_DIR)
+            staged = input_staging.extract_zip(input_file, input_dir, referenced)
         elif file_extension in IMAGE_TYPES + VIDEO_TYPES:
-            shutil.copy(input_file, os.path.join(INPUT_DIR, f"input{file_extension}"))
+            staged = [f"input{file_extension}"]
+            input_staging.stage_file(input_file, os.path.join(input_dir, staged[0]))
         else:
             raise ValueError(f"Unsupported file type: {file_extension}")
 
         print("====================================")
-        print(f"Inputs uploaded to {INPUT_DIR}:")
-        self.comfyUI.get_files(INPUT_DIR)
+        print(f"Inputs uploaded to {input_dir}:")
+        for name in staged:
+            print(name)
         print("====================================")
 
     def get_file_extension(self, input_file: Path) -> str:
@@ -115,7 +160,7 @@ class Predictor(BasePredictor):
                     )
         return file_extension
 
-    def predict(
+    async def predict(
         self,
         workflow_json: str = Input(
             description="Your ComfyUI workflow as JSON string or URL. You must use the API version of your workflow. Get it from ComfyUI using 'Save (API format)'. Instructions here: https://github.com/replicate/cog-comfyui",
@@ -131,6 +176,7 @@ class Predictor(BasePredictor):
         ),
         output_format: str = optimise_images.predict_output_format(),
         output_quality: int = optimise_images.predict_output_quality(),
+        video_profile: str = optimise_videos.predict_video_profile(),
         randomise_seeds: bool = Input(
             description="Automatically randomise seeds (seed, noise_seed, rand_seed)",
             default=True,
@@ -141,44 +187,340 @@ class Predictor(BasePredictor):
         ),
     ) -> List[Path]:
         """Run a single prediction on the model"""
-        self.comfyUI.cleanup(ALL_DIRECTORIES)
+        # The prediction itself is blocking, so it runs in a worker thread
+        outputs = self.run_prediction(
+            workflow_json,
+            input_file,
+            return_temp_files,
+            output_format,
+            output_quality,
+            video_profile,
+            randomise_seeds,
+            force_reset_cache,
+        )
+        return await asyncio.to_thread(list, outputs)
 
-        if input_file:
-            self.handle_input_file(input_file)
+    if STREAM_OUTPUTS:
+        # Streaming changes the output schema from a list of files to an
+        # iterator, so this version of predict is only declared when enabled
 
-        workflow_json_content = workflow_json
-        if workflow_json.startswith("data:") and ";base64," in workflow_json:
-            try:
-                base64_part = workflow_json.split(",", 1)[1]
-                decoded_bytes = base64.b64decode(base64_part)
-                workflow_json_content = decoded_bytes.decode("utf-8")
-            except Exception as e:
-                raise ValueError(f"Failed to decode base64 workflow JSON: {e}")
-        elif workflow_json.startswith(("http://", "https://")):
-            try:
-                response = requests.get(workflow_json)
-                response.raise_for_status()
-                workflow_json_content = response.text
-            except requests.exceptions.RequestException as e:
-                raise ValueError(f"Failed to download workflow JSON from URL: {e}")
+        async def predict(
+            self,
+            workflow_json: str = Input(
+                description="Your ComfyUI workflow as JSON string or URL. You must use the API version of your workflow. Get it from ComfyUI using 'Save (API format)'. Instructions here: https://github.com/replicate/cog-comfyui",
+                default="",
+            ),
+            input_file: Optional[Path] = Input(
+                description="Input image, video, tar or zip file. Read guidance on workflows and input files here: https://github.com/replicate/cog-comfyui. Alternatively, you can replace inputs with URLs in your JSON workflow and the model will download them.",
+                default=None,
+            ),
+            return_temp_files: bool = Input(
+                description="Return any temporary files, such as preprocessed controlnet images. Useful for debugging.",
+                default=False,
+            ),
+            output_format: str = optimise_images.predict_output_format(),
+            output_quality: int = optimise_images.predict_output_quality(),
+            video_profile: str = optimise_videos.predict_video_profile(),
+            randomise_seeds: bool = Input(
+                description="Automatically randomise seeds (seed, noise_seed, rand_seed)",
+                default=True,
+            ),
+            force_reset_cache: bool = Input(
+                description="Force reset the ComfyUI cache before running the workflow. Useful for debugging.",
+                default=False,
+            ),
+        ) -> AsyncIterator[Path]:
+            """Run a single prediction on the model, returning each output as soon as it is ready"""
+            outputs = self.run_prediction(
+                workflow_json,
+                input_file,
+                return_temp_files,
+                output_format,
+                output_quality,
+                video_profile,
+                randomise_seeds,
+                force_reset_cache,
+            )
+            # Each step runs in a worker thread, as the prediction is blocking
+            while (output := await asyncio.to_thread(next, outputs, None)) is not None:
+                yield output
+
+    def run_prediction(
+        self,
+        workflow_json,
+        input_file,
+        return_temp_files,
+        output_format,
+        output_quality,
+        video_profile,
+        randomise_seeds,
+        force_reset_cache,
+    ):
+        prediction_id = uuid.uuid4().hex if CONCURRENT_PREDICTIONS else None
+        input_dir = self.prepare_directories(prediction_id)
+        output_dir = os.path.join(OUTPUT_DIR, prediction_id or "")
+        result_key = None
+        prediction = PredictionContext()
+        try:
+            workflow_json_content = workflow_json
+            if workflow_json.startswith("data:") and ";base64," in workflow_json:
+                try:
+                    base64_part = workflow_json.split(",", 1)[1]
+                    decoded_bytes = base64.b64decode(base64_part)
+                    workflow_json_content = decoded_bytes.decode("utf-8")
+                except Exception as e:
+                    raise ValueError(f"Failed to decode base64 workflow JSON: {e}")
+            elif workflow_json.startswith(("http://", "https://")):
+                try:
+                    workflow_json_content = self.comfyUI.input_cache.fetch_text(
+                        workflow_json
+                    )
+                except requests.exceptions.RequestException as e:
+                    raise ValueError(f"Failed to download workflow JSON from URL: {e}")
+
+            workflow = json.loads(workflow_json_content or EXAMPLE_WORKFLOW_JSON)
+            if input_file:
+                self.handle_input_file(input_file, input_dir, workflow)
+
+            if self.result_cache and not randomise_seeds:
+                result_key = self.result_key(
+                    workflow,
+                    input_dir,
+                    [return_temp_files, output_format, output_quality, video_profile],
+                )
+            if result_key:
+                cached_files = self.cached_result(result_key, output_dir)
+                if cached_files is not None:
+                    print("Returning the outputs of an identical earlier prediction")
+                    for file in cached_files:
+                        yield Path(file)
+                    result_key = None
+                    return
+
+            wf = self.comfyUI.load_workflow(workflow, input_dir, prediction)
+
+            self.comfyUI.connect()
+
+            if force_reset_cache or not randomise_seeds:
+                self.comfyUI.reset_execution_cache()
+
+            if randomise_seeds:
+                self.comfyUI.randomise_seeds(wf)
+
+            if prediction_id:
+                self.comfyUI.isolate_outputs(wf, prediction_id)
 
-        wf = self.comfyUI.load_workflow(workflow_json_content or EXAMPLE_WORKFLOW_JSON)
+            self.comfyUI.save_images_as(
+                wf, output_format, output_quality, IMAGE_ENCODER_PRESET
+            )
 
-        self.comfyUI.connect()
+            results = []
+            if STREAM_OUTPUTS:
+                for file in self.stream_outputs(
+                    wf,
+                    prediction,
+                    prediction_id,
+                    return_temp_files,
+                    output_format,
+                    output_quality,
+                    video_profile,
+                ):
+                    results.append(file)
+                    yield file
+            else:
+                outputs, server = self.comfyUI.run_workflow(
+                    wf, prediction=prediction
+                )
+                files, encoded_files = self.collect_files(
+                    wf, outputs, server, prediction_id, return_temp_files
+                )
+                for file in self.optimise_files(
+                    files, encoded_files, output_format, output_quality, video_profile
+                ):
+                    results.append(file)
+                    yield Path(file)
+            if result_key:
+                self.result_cache.put(result_key, results)
+            prediction.telemetry.print_summary()
+        finally:
+            prediction.close()
+            if result_key:
+                self.result_cache.release(result_key)
+            if prediction_id:
+                cleanup.remove(input_dir)
+                self.remove_later(
+                    os.path.join(server.output_directory, prediction_id)
+                    for server in self.comfyUI.server_pool.servers
+                )
+
+    def result_key(self, workflow, input_dir, options):
+        # Built from the workflow as submitted, before load_workflow
+        # downloads its weights and inputs
+        self.comfyUI.check_api_format(workflow)
+        input_urls = []
+        for url in self.comfyUI.input_urls(workflow):
+            version = self.comfyUI.input_cache.version(url)
+            if version is None:
+                print(f"Not using the result cache, {url} has no ETag or Last-Modified")
+                return None
+            input_urls.append([url, version])
+        return self.result_cache.key(
+            workflow,
+            input_dir,
+            self.comfyUI.resolved_weights(workflow),
+            input_urls,
+            options,
+        )
 
-        if force_reset_cache or not randomise_seeds:
-            self.comfyUI.reset_execution_cache()
+    def cached_result(self, result_key, output_dir):
+        # Returns None once this prediction has claimed result_key and should run
+        while True:
+            cached_files = self.result_cache.get(result_key, output_dir)
+            if cached_files is not None:
+                return cached_files
+            running = self.result_cache.claim(result_key)
+            if running is None:
+                return None
+            print("Waiting for an identical prediction to finish")
+            running.wait()
 
-        if randomise_seeds:
-            self.comfyUI.randomise_seeds(wf)
+    def optimise_files(
+        self, files, encoded_files, output_format, output_quality, video_profile
+    ):
+        # Videos are transcoded by ffmpeg while the images are being encoded
+        with ThreadPoolExecutor(max_workers=1) as executor:
+            videos = executor.submit(
+                optimise_videos.optimise_video_files, video_profile, files
+            )
+            images = optimise_images.optimise_image_files(
+                output_format,
+                output_quality,
+                files,
+                encoder_preset=IMAGE_ENCODER_PRESET,
+                encoded_files=encoded_files,
+            )
+            videos = videos.result()
 
-        self.comfyUI.run_workflow(wf)
+        # Each list only replaces the files it handled
+        return [
+            video if video != file else image
+            for file, image, video in zip(files, images, videos)
+        ]
 
-        output_directories = [OUTPUT_DIR]
+    def collect_files(self, wf, outputs, server, prediction_id, return_temp_files):
+        manifest = self.comfyUI.get_output_manifest(
+            wf, outputs, server, ("output", "temp")
+        )
+        temp_files = [entry["path"] for entry in manifest if entry["type"] == "temp"]
+        if prediction_id:
+            # The temp directory is shared and never cleared in this mode
+            self.remove_later(temp_files)
+
+        files = list(
+            dict.fromkeys(e["path"] for e in manifest if e["type"] == "output")
+        )
+        if not files:
+            # Nothing was reported, fall back to every file this prediction wrote
+            output_dir = server.output_directory
+            if prediction_id:
+                output_dir = os.path.join(output_dir, prediction_id)
+            if os.path.isdir(output_dir):
+                files = self.comfyUI.get_files(output_dir)
         if return_temp_files:
-            output_directories.append(COMFYUI_TEMP_OUTPUT_DIR)
+            files += temp_files
+        return files, self.encoded_files(manifest)
+
+    def encoded_files(self, manifest):
+        # Files the bundled save node wrote in the requested format already
+        return {
+            entry["path"]
+            for entry in manifest
+            if entry["class_type"] == DIRECT_SAVE_NODE
+        }
+
+    def stream_outputs(
+        self,
+        wf,
+        prediction,
+        prediction_id,
+        return_temp_files,
+        output_format,
+        output_quality,
+        video_profile,
+    ):
+        # Each node's outputs are optimised and returned as soon as ComfyUI
+        # reports them, instead of after the whole workflow has finished
+        ready = queue.Queue()
+        result = {}
+
+        file_types = ("output", "temp") if return_temp_files else ("output",)
+
+        def on_output(server, node_id, output):
+            files = self.comfyUI.node_output_files(
+                node_id, output, server, file_types, wf
+            )
+            encoded_files.update(self.encoded_files(files))
+            ready.put([entry["path"] for entry in files])
 
-        optimised_files = optimise_images.optimise_image_files(
-            output_format, output_quality, self.comfyUI.get_files(output_directories)
+        def run():
+            try:
+                result["outputs"] = self.comfyUI.run_workflow(
+                    wf, on_output, prediction
+                )
+            except Exception as e:
+                result["error"] = e
+            finally:
+                ready.put(None)
+
+        threading.Thread(target=run).start()
+        returned = set()
+        encoded_files = set()
+
+        def optimise(files):
+            files = [f for f in files if f not in returned]
+            optimised_files = self.optimise_files(
+                files, encoded_files, output_format, output_quality, video_profile
+            )
+            returned.update(files + optimised_files)
+            if prediction_id:
+                self.remove_later(optimised_files)
+            return [Path(f) for f in optimised_files]
+
+        while (files := ready.get()) is not None:
+            yield from optimise(files)
+
+        if "error" in result:
+            raise result["error"]
+
+        # Pick up files from nodes that do not report their outputs
+        outputs, server = result["outputs"]
+        files, swept_encoded_files = self.collect_files(
+            wf, outputs, server, prediction_id, return_temp_files
         )
-        return [Path(p) for p in optimised_files]
+        encoded_files.update(swept_encoded_files)
+        yield from optimise(files)
+
+    def prepare_directories(self, prediction_id):
+        if not prediction_id:
+            self.comfyUI.cleanup(ALL_DIRECTORIES)
+            return INPUT_DIR
+
+        # Other predictions are running, so only this prediction's files are touched
+        self.remove_finished_files()
+        input_dir = os.path.join(INPUT_DIR, prediction_id)
+        os.makedirs(input_dir)
+        return input_dir
+
+    def remove_later(self, paths):
+        with self.finished_files_lock:
+            self.finished_files.extend((time.time(), str(path)) for path in paths)
+
+    def remove_finished_files(self):
+        now = time.time()
+        with self.finished_files_lock:
+            expired = [p for t, p in self.finished_files if now - t > FINISHED_FILES_TTL]
+            self.finished_files = [
+                (t, p) for t, p in self.finished_files if now - t <= FINISHED_FILES_TTL
+            ]
+        for path in expired:
+            cleanup.remove(path)
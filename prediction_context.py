@@ -0,0 +1,23 @@
+from contextlib import ExitStack
+from download_telemetry import telemetry
+
+
+class PredictionContext:
+    """
+    State that belongs to one prediction while its workflow is loaded,
+    downloaded and run, so concurrent predictions never share it.
+
+    Context managers passed to hold stay entered until close is called at
+    the end of the prediction. Download events and phase timings are
+    recorded in telemetry.
+    """
+
+    def __init__(self):
+        self.resources = ExitStack()
+        self.telemetry = telemetry.prediction()
+
+    def hold(self, context_manager):
+        return self.resources.enter_context(context_manager)
+
+    def close(self):
+        self.resources.close()
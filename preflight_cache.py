@@ -0,0 +1,155 @@
+import json
+import hashlib
+import threading
+from collections import OrderedDict
+import custom_node_helpers as helpers
+from inline_images import is_base64_image
+
+PREFLIGHT_CACHE_SIZE = 256
+
+# These nodes download their own weights, so their inputs are never checked
+SELF_DOWNLOADING_NODE_TYPES = ["HFHubLoraLoader", "LoraLoaderFromURL"]
+
+# Every string input of these nodes can change which weights are needed
+# or how the node is rewritten, not only those that look like filenames
+STRUCTURAL_NODE_TYPES = {"LoraLoader"}
+
+# Marks an input a rewrite removes. A sentinel rather than None, which is
+# a valid input value (JSON null) that rewrites must be able to set
+DELETED = object()
+
+
+class WorkflowPreflight:
+    """
+    The result of resolving weights for one workflow shape: the weights it
+    needs, any extra downloads helpers registered, and the rewrites
+    (synonyms, LoRA loader conversion, helper input changes) to apply to
+    each node.
+    """
+
+    def __init__(self, weights, rewrites, extra_downloads=()):
+        self.weights = weights
+        self.rewrites = rewrites
+        self.extra_downloads = list(extra_downloads)
+
+    def apply(self, workflow):
+        for node_id, class_type, inputs in self.rewrites:
+            node = workflow[node_id]
+            if class_type is not None:
+                node["class_type"] = class_type
+            for key, value in inputs.items():
+                if value is DELETED:
+                    node["inputs"].pop(key, None)
+                else:
+                    node["inputs"][key] = value
+
+
+class PreflightCache:
+    """
+    Memoizes weight resolution by the structural fingerprint of a workflow.
+
+    The fingerprint covers class_types, model file inputs and every string
+    input of nodes whose helpers inspect their inputs. Free text such as
+    prompts is left out, so workflows that differ only in prompts and seeds
+    share an entry. Free text is still scanned for embeddings each time.
+    """
+
+    def __init__(self, max_entries=PREFLIGHT_CACHE_SIZE):
+        self.max_entries = max_entries
+        self.entries = OrderedDict()
+        self.supported_node_types = OrderedDict()
+        self.lock = threading.Lock()
+
+    @staticmethod
+    def is_structural_node(class_type):
+        return (
+            class_type in STRUCTURAL_NODE_TYPES
+            or class_type in helpers.WEIGHTS_HELPERS_BY_NODE_TYPE
+        )
+
+    @staticmethod
+    def classify(workflow, weights_filetypes, manifest_fingerprint):
+        """
+        Returns the workflow's structural fingerprint, and the (node_id, key)
+        of every free text input that only needs an embeddings scan.
+        """
+        weights_filetypes = tuple(weights_filetypes)
+        structure = [manifest_fingerprint]
+        free_text = []
+        for node_id in sorted(workflow):
+            node = workflow[node_id]
+            class_type = node.get("class_type")
+            structure.append([node_id, class_type])
+            if class_type in SELF_DOWNLOADING_NODE_TYPES:
+                continue
+
+            structural_node = PreflightCache.is_structural_node(class_type)
+            for key, value in node.get("inputs", {}).items():
+                # Inline images never name weights and are too large to scan
+                if not isinstance(value, str) or is_base64_image(value):
+                    continue
+                if structural_node or value.endswith(weights_filetypes):
+                    structure.append([key, value])
+                else:
+                    free_text.append((node_id, key))
+
+        fingerprint = hashlib.sha256(
+            json.dumps(structure, separators=(",", ":")).encode("utf-8")
+        ).hexdigest()
+        return fingerprint, free_text
+
+    def _get(self, entries, key):
+        with self.lock:
+            value = entries.get(key)
+            if value is not None:
+                entries.move_to_end(key)
+            return value
+
+    def _put(self, entries, key, value):
+        with self.lock:
+            entries[key] = value
+            entries.move_to_end(key)
+            while len(entries) > self.max_entries:
+                entries.popitem(last=False)
+
+    def get(self, fingerprint):
+        return self._get(self.entries, fingerprint)
+
+    def put(self, fingerprint, preflight):
+        self._put(self.entries, fingerprint, preflight)
+
+    def is_supported(self, node_types):
+        return self._get(self.supported_node_types, node_types) is not None
+
+    def mark_supported(self, node_types):
+        self._put(self.supported_node_types, node_types, True)
+
+    @staticmethod
+    def snapshot(workflow):
+        return {
+            node_id: (node.get("class_type"), dict(node.get("inputs", {})))
+            for node_id, node in workflow.items()
+        }
+
+    @staticmethod
+    def rewrites(snapshot, workflow):
+        rewrites = []
+        for node_id, (class_type, inputs) in snapshot.items():
+            node = workflow[node_id]
+            new_inputs = node.get("inputs", {})
+            changed = {
+                key: value
+                for key, value in new_inputs.items()
+                if key not in inputs or inputs[key] != value
+            }
+            changed.update({key: DELETED for key in inputs if key not in new_inputs})
+            new_class_type = node.get("class_type")
+            if changed or new_class_type != class_type:
+                rewrites.append(
+                    (
+                        node_id,
+                        new_class_type if new_class_type != class_type else None,
+                        changed,
+                    )
+                )
+        return rewrites
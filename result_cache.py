@@ -0,0 +1,158 @@
+import os
+import json
+import uuid
+import shutil
+import hashlib
+import threading
+from collections import OrderedDict
+from input_staging import stage_file
+
+RESULT_CACHE_DIRECTORY = "/tmp/.result_cache"
+RESULT_CACHE_MAX_BYTES = 20 * 1024 * 1024 * 1024
+MANIFEST_FILENAME = "files.json"
+
+
+class ResultCache:
+    """
+    Keeps the optimised outputs of deterministic predictions on disk, so an
+    identical request is answered without running the workflow again.
+
+    A request is identical when the workflow as submitted, the contents of
+    every input file, the version of every input URL, the weights the
+    workflow resolves to (by name and URL) and the output options are the
+    same, so a cached result is found before anything is downloaded. Only
+    predictions that do not randomise seeds are cached.
+
+    Entries are evicted least recently used first once the cache is larger
+    than max_bytes. Identical requests that arrive together wait for the
+    first one to finish and then share its result.
+    """
+
+    def __init__(self, directory=RESULT_CACHE_DIRECTORY, max_bytes=RESULT_CACHE_MAX_BYTES):
+        self.directory = directory
+        self.max_bytes = max_bytes
+        self.lock = threading.Lock()
+        self.entries = OrderedDict()
+        self.in_flight = {}
+        self.load()
+
+    def load(self):
+        os.makedirs(self.directory, exist_ok=True)
+        entries = []
+        for key in os.listdir(self.directory):
+            entry_directory = os.path.join(self.directory, key)
+            manifest_path = os.path.join(entry_directory, MANIFEST_FILENAME)
+            try:
+                with open(manifest_path, "r") as f:
+                    manifest = json.load(f)
+                last_used = os.path.getmtime(manifest_path)
+            except (OSError, ValueError):
+                # Unfinished or damaged entries
+                shutil.rmtree(entry_directory, ignore_errors=True)
+                continue
+            entries.append((last_used, key, manifest))
+
+        for _, key, manifest in sorted(entries, key=lambda entry: entry[0]):
+            self.entries[key] = manifest
+
+    @staticmethod
+    def hash_inputs(input_directory):
+        inputs = []
+        for root, _, files in os.walk(input_directory):
+            for name in files:
+                path = os.path.join(root, name)
+                with open(path, "rb") as f:
+                    digest = hashlib.file_digest(f, "sha256").hexdigest()
+                inputs.append([os.path.relpath(path, input_directory), digest])
+        return sorted(inputs)
+
+    @staticmethod
+    def key(workflow, input_directory, weights, input_urls, options):
+        identity = [
+            workflow,
+            ResultCache.hash_inputs(input_directory),
+            weights,
+            input_urls,
+            options,
+        ]
+        return hashlib.sha256(
+            json.dumps(identity, sort_keys=True).encode("utf-8")
+        ).hexdigest()
+
+    def entry_directory(self, key):
+        return os.path.join(self.directory, key)
+
+    def get(self, key, output_directory):
+        """
+        Links a cached result into output_directory and returns its files,
+        or returns None if key is not cached.
+        """
+        with self.lock:
+            manifest = self.entries.get(key)
+            if manifest is None:
+                return None
+            self.entries.move_to_end(key)
+
+            files = []
+            for i, name in enumerate(manifest["files"]):
+                destination = os.path.join(output_directory, str(i), name)
+                os.makedirs(os.path.dirname(destination), exist_ok=True)
+                stage_file(
+                    os.path.join(self.entry_directory(key), str(i), name), destination
+                )
+                files.append(destination)
+            os.utime(os.path.join(self.entry_directory(key), MANIFEST_FILENAME))
+        return files
+
+    def put(self, key, files):
+        partial_directory = os.path.join(self.directory, f".{uuid.uuid4().hex}")
+        size = 0
+        try:
+            for i, file in enumerate(files):
+                destination = os.path.join(partial_directory, str(i), os.path.basename(file))
+                os.makedirs(os.path.dirname(destination), exist_ok=True)
+                stage_file(file, destination)
+                size += os.path.getsize(destination)
+            manifest = {"files": [os.path.basename(file) for file in files], "size": size}
+            with open(os.path.join(partial_directory, MANIFEST_FILENAME), "w") as f:
+                json.dump(manifest, f)
+
+            with self.lock:
+                if key in self.entries:
+                    return
+                os.rename(partial_directory, self.entry_directory(key))
+                self.entries[key] = manifest
+        finally:
+            shutil.rmtree(partial_directory, ignore_errors=True)
+
+        print(f"Cached {len(files)} outputs ({size} bytes)")
+        self.evict_least_recently_used()
+
+    def evict_least_recently_used(self):
+        with self.lock:
+            total = sum(manifest["size"] for manifest in self.entries.values())
+            evicted = []
+            while total > self.max_bytes and len(self.entries) > 1:
+                key, manifest = self.entries.popitem(last=False)
+                total -= manifest["size"]
+                evicted.append(key)
+        for key in evicted:
+            shutil.rmtree(self.entry_directory(key), ignore_errors=True)
+
+    def claim(self, key):
+        """
+        Returns None if the caller should run the prediction for key, or an
+        event that is set when an identical prediction already running
+        finishes. Callers that get None must call release.
+        """
+        with self.lock:
+            event = self.in_flight.get(key)
+            if event is None:
+                self.in_flight[key] = threading.Event()
+            return event
+
+    def release(self, key):
+        with self.lock:
+            event = self.in_flight.pop(key, None)
+        if event is not None:
+            event.set()
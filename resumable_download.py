@@ -0,0 +1,575 @@
+import os
+import json
+import time
+import errno
+import shutil
+import hashlib
+import tarfile
+import threading
+import itertools
+import requests
+from collections import deque
+from concurrent.futures import ThreadPoolExecutor
+from config import config
+
+WEIGHTS_CACHE_PATH = config["WEIGHTS_CACHE_PATH"]
+STAGING_PATH = os.path.join(WEIGHTS_CACHE_PATH, "staging")
+COMPLETE_MARKERS_PATH = os.path.join(WEIGHTS_CACHE_PATH, "complete")
+MAX_DOWNLOAD_CONNECTIONS = config["MAX_DOWNLOAD_CONNECTIONS"]
+MAX_DOWNLOAD_BANDWIDTH_MBPS = config["MAX_DOWNLOAD_BANDWIDTH_MBPS"]
+
+CHUNK_SIZE = 1024 * 1024
+MIN_SEGMENT_SIZE = 32 * 1024 * 1024
+# Tars are fetched in parts of this size and extracted in order, so at most
+# one part per connection is held in memory
+STREAM_PART_SIZE = 8 * 1024 * 1024
+PROGRESS_SAVE_INTERVAL = 2
+REQUEST_TIMEOUT = 30
+# A dropped connection is retried from the segment's saved offset
+SEGMENT_RETRIES = 3
+RETRY_BACKOFF = 2
+
+
+class BandwidthLimiter:
+    # Token bucket shared by every download in the process
+    def __init__(self, megabytes_per_second):
+        self.rate = megabytes_per_second * 1024 * 1024 if megabytes_per_second else None
+        self.lock = threading.Lock()
+        self.allowance = self.rate or 0
+        self.last_check = time.monotonic()
+
+    def consume(self, num_bytes):
+        if not self.rate:
+            return
+        with self.lock:
+            now = time.monotonic()
+            self.allowance = min(
+                self.rate, self.allowance + (now - self.last_check) * self.rate
+            )
+            self.last_check = now
+            self.allowance -= num_bytes
+            wait = -self.allowance / self.rate if self.allowance < 0 else 0
+        if wait:
+            time.sleep(wait)
+
+
+connection_slots = threading.BoundedSemaphore(MAX_DOWNLOAD_CONNECTIONS)
+bandwidth_limiter = BandwidthLimiter(MAX_DOWNLOAD_BANDWIDTH_MBPS)
+
+
+class DownloadAborted(Exception):
+    pass
+
+
+class RemoteFileChanged(Exception):
+    pass
+
+
+def marker_path(path):
+    key = hashlib.sha1(os.path.abspath(path).encode("utf-8")).hexdigest()
+    return os.path.join(COMPLETE_MARKERS_PATH, f"{key}.json")
+
+
+def write_complete_marker(path):
+    os.makedirs(COMPLETE_MARKERS_PATH, exist_ok=True)
+    size = os.path.getsize(path) if os.path.isfile(path) else None
+    write_json_atomically(marker_path(path), {"path": path, "size": size})
+
+
+def is_complete(path):
+    """
+    A weight is complete if it exists and matches its completion marker.
+    Files without a marker were put there some other way (baked into the
+    image, or downloaded before markers existed) and are trusted.
+    """
+    if not os.path.exists(path):
+        return False
+    marker = marker_path(path)
+    if not os.path.exists(marker):
+        return True
+    try:
+        with open(marker, "r") as f:
+            size = json.load(f).get("size")
+    except (OSError, ValueError):
+        return True
+    return size is None or not os.path.isfile(path) or os.path.getsize(path) == size
+
+
+def remove_complete_marker(path):
+    marker = marker_path(path)
+    if os.path.exists(marker):
+        os.remove(marker)
+
+
+def write_json_atomically(path, data):
+    tmp_path = f"{path}.{os.getpid()}.{threading.get_ident()}.tmp"
+    with open(tmp_path, "w") as f:
+        json.dump(data, f)
+    os.replace(tmp_path, path)
+
+
+def atomic_move(src, dst):
+    if os.path.isdir(dst) and not os.path.islink(dst):
+        # A directory can be shared with other weights, so a directory is
+        # merged into it entry by entry and nothing else in it is touched
+        if os.path.isdir(src) and not os.path.islink(src):
+            for entry in os.listdir(src):
+                atomic_move(os.path.join(src, entry), os.path.join(dst, entry))
+            os.rmdir(src)
+            return
+        if os.listdir(dst):
+            raise IsADirectoryError(f"Refusing to replace non-empty directory {dst}")
+        os.rmdir(dst)
+    try:
+        os.replace(src, dst)
+    except OSError as e:
+        if e.errno != errno.EXDEV:
+            raise
+        # Staging is on another filesystem, copy next to the destination first
+        # so the final step is still a rename
+        tmp_dst = f"{dst}.partial-{os.getpid()}"
+        shutil.move(src, tmp_dst)
+        os.replace(tmp_dst, dst)
+
+
+def download_url(url, path, connections=MAX_DOWNLOAD_CONNECTIONS):
+    """Downloads url to path as it is, replacing any file already there."""
+    dest, filename = os.path.split(os.path.abspath(path))
+    download = ResumableDownload(
+        url, dest, connections, extract=False, filename=filename
+    )
+    return download.run()[0]
+
+
+class ChunkReader:
+    # A read-only file object over an iterator of byte chunks
+    def __init__(self, chunks):
+        self.chunks = chunks
+        self.buffer = b""
+        self.offset = 0
+
+    def read(self, size=-1):
+        parts = []
+        while size != 0:
+            if self.offset == len(self.buffer):
+                self.buffer = next(self.chunks, b"")
+                self.offset = 0
+                if not self.buffer:
+                    break
+            end = len(self.buffer)
+            if size > 0:
+                end = min(end, self.offset + size)
+                size -= end - self.offset
+            parts.append(self.buffer[self.offset : end])
+            self.offset = end
+        return b"".join(parts)
+
+    def read_exactly(self, size):
+        data = self.read(size)
+        if len(data) < size:
+            raise IOError("Download ended before the end of the archive")
+        return data
+
+
+class ResumableDownload:
+    """
+    Downloads a URL using parallel range requests.
+
+    Tars are extracted in order as the parts arrive, so a weight only needs
+    its own size on disk. The position reached in the archive is saved as it
+    goes, so an interrupted download resumes from the member, and the byte
+    within it, that it had got to. Other files are staged whole, with each
+    segment's progress saved alongside.
+
+    Either way the result is moved into place with an atomic rename once
+    every byte has arrived, so a partial download can never be mistaken for
+    a complete weight.
+    """
+
+    def __init__(
+        self,
+        url,
+        dest,
+        connections=8,
+        extract=True,
+        on_progress=None,
+        abort=None,
+        filename=None,
+    ):
+        self.url = url
+        self.dest = dest
+        self.connections = max(1, connections)
+        self.extract = extract
+        # Name of the file in dest when not extracting, the URL's by default
+        self.filename = filename or os.path.basename(url)
+        key = hashlib.sha1(url.encode("utf-8")).hexdigest()[:16]
+        self.staging_dir = os.path.join(STAGING_PATH, key)
+        self.file_path = os.path.join(self.staging_dir, "download")
+        self.progress_path = os.path.join(self.staging_dir, "progress.json")
+        self.extract_dir = os.path.join(self.staging_dir, "extract")
+        self.progress_lock = threading.Lock()
+        self.session = requests.Session()
+        # on_progress(bytes_done, total_bytes, bytes_per_second)
+        self.on_progress = on_progress
+        self.session_bytes = 0
+        self.session_start = time.monotonic()
+        # Set by the caller to stop the download, what arrived is kept
+        self.abort = abort
+
+    def run(self):
+        os.makedirs(self.staging_dir, exist_ok=True)
+        try:
+            if self.extract:
+                self.fetch_and_extract()
+            else:
+                self.fetch()
+            moved = self.install()
+        finally:
+            self.session.close()
+        shutil.rmtree(self.staging_dir, ignore_errors=True)
+        return moved
+
+    def probe(self, timeout=REQUEST_TIMEOUT):
+        response = self.session.head(self.url, allow_redirects=True, timeout=timeout)
+        if response.ok:
+            headers = response.headers
+            size = headers.get("Content-Length")
+            ranges = headers.get("Accept-Ranges") == "bytes"
+        else:
+            # Some servers, such as presigned GET-only URLs, reject HEAD
+            with self.session.get(
+                self.url,
+                headers={"Range": "bytes=0-0"},
+                stream=True,
+                timeout=timeout,
+            ) as response:
+                response.raise_for_status()
+                headers = response.headers
+                ranges = response.status_code == 206
+                if ranges:
+                    # Content-Range is "bytes 0-0/<size>"
+                    size = headers.get("Content-Range", "").rsplit("/", 1)[-1]
+                    size = size if size.isdigit() else None
+                else:
+                    size = headers.get("Content-Length")
+        return {
+            "url": self.url,
+            "size": int(size) if size else None,
+            "etag": headers.get("ETag"),
+            "last_modified": headers.get("Last-Modified"),
+            "ranges": ranges,
+        }
+
+    def load_progress(self, remote):
+        if not os.path.exists(self.progress_path):
+            return None
+        if not self.extract and not os.path.exists(self.file_path):
+            return None
+        try:
+            with open(self.progress_path, "r") as f:
+                progress = json.load(f)
+        except (OSError, ValueError):
+            return None
+        # Extraction progress is an archive offset, not staged segments
+        if self.extract != ("offset" in progress):
+            return None
+        validators = ["url", "size", "etag", "last_modified"]
+        if any(progress.get(v) != remote[v] for v in validators):
+            print(f"Remote file changed, restarting download of {self.url}")
+            return None
+        return progress
+
+    def save_progress(self, progress):
+        with self.progress_lock:
+            write_json_atomically(self.progress_path, progress)
+
+    def new_progress(self, remote):
+        size = remote["size"]
+        num_segments = min(self.connections, max(1, size // MIN_SEGMENT_SIZE))
+        segment_size = -(-size // num_segments)
+        segments = [
+            {"start": start, "end": min(start + segment_size, size), "done": 0}
+            for start in range(0, size, segment_size)
+        ]
+        with open(self.file_path, "wb") as f:
+            f.truncate(size)
+        return {**remote, "segments": segments, "complete": False}
+
+    def fetch(self):
+        remote = self.probe()
+        if not remote["ranges"] or not remote["size"]:
+            self.fetch_whole(remote)
+            return
+
+        progress = self.load_progress(remote)
+        if progress is None:
+            progress = self.new_progress(remote)
+            self.save_progress(progress)
+        elif progress["complete"]:
+            return
+        else:
+            fetched = sum(s["done"] for s in progress["segments"])
+            print(f"Resuming {self.url} from {fetched / (1024 * 1024):.2f}MB")
+
+        fd = os.open(self.file_path, os.O_WRONLY)
+        try:
+            with ThreadPoolExecutor(max_workers=len(progress["segments"])) as pool:
+                for future in [
+                    pool.submit(self.fetch_segment, fd, segment, progress)
+                    for segment in progress["segments"]
+                ]:
+                    future.result()
+            os.fsync(fd)
+        finally:
+            os.close(fd)
+
+        progress["complete"] = True
+        self.save_progress(progress)
+
+    def fetch_and_extract(self):
+        remote = self.probe()
+        resumable = bool(remote["ranges"] and remote["size"])
+        progress = self.load_progress(remote) if resumable else None
+        if progress is None:
+            shutil.rmtree(self.extract_dir, ignore_errors=True)
+            progress = {**remote, "offset": 0, "member": None, "complete": False}
+        elif progress["complete"]:
+            return
+        os.makedirs(self.extract_dir, exist_ok=True)
+
+        # A member cut short is written on from where it stopped
+        member = progress["member"]
+        start = progress["offset"]
+        if member:
+            path = os.path.join(self.extract_dir, member["name"])
+            written = min(
+                os.path.getsize(path) if os.path.exists(path) else 0, member["size"]
+            )
+            start = member["data_offset"] + written
+        if start:
+            print(f"Resuming {self.url} from {start / (1024 * 1024):.2f}MB")
+
+        if resumable:
+            validator = remote["etag"] or remote["last_modified"]
+            chunks = self.iter_parts(start, remote["size"], validator)
+        else:
+            chunks = self.iter_whole(remote)
+        stream = ChunkReader(chunks)
+        try:
+            if member:
+                with open(path, "ab") as f:
+                    remaining = member["size"] - written
+                    while remaining:
+                        data = stream.read_exactly(min(CHUNK_SIZE, remaining))
+                        f.write(data)
+                        remaining -= len(data)
+                padding = -member["size"] % tarfile.BLOCKSIZE
+                stream.read_exactly(padding)
+                start = member["data_offset"] + member["size"] + padding
+                progress.update(offset=start, member=None)
+                self.save_progress(progress)
+
+            with tarfile.open(fileobj=stream, mode="r|", bufsize=CHUNK_SIZE) as tar:
+                for info in tar:
+                    if info.isfile():
+                        name = tarfile.data_filter(info, self.extract_dir).name
+                        progress["member"] = {
+                            "name": name,
+                            "data_offset": start + info.offset_data,
+                            "size": info.size,
+                        }
+                        self.save_progress(progress)
+                        path = os.path.join(self.extract_dir, name)
+                        os.makedirs(os.path.dirname(path), exist_ok=True)
+                        with tar.extractfile(info) as src, open(path, "wb") as dst:
+                            shutil.copyfileobj(src, dst, CHUNK_SIZE)
+                    else:
+                        tar.extract(info, self.extract_dir, filter="data")
+                    # tar.offset is where the next member's header starts
+                    progress.update(offset=start + tar.offset, member=None)
+                    self.save_progress(progress)
+        finally:
+            chunks.close()
+
+        progress["complete"] = True
+        self.save_progress(progress)
+
+    def iter_parts(self, start, end, validator):
+        # Parts are fetched in parallel but yielded in order
+        part_starts = iter(range(start, end, STREAM_PART_SIZE))
+        stop = threading.Event()
+        pool = ThreadPoolExecutor(max_workers=self.connections)
+
+        def submit(part_start):
+            part_end = min(part_start + STREAM_PART_SIZE, end)
+            return pool.submit(
+                self.retrying, self.fetch_part, part_start, part_end, validator, stop
+            )
+
+        self.stream_done, self.stream_size = start, end
+        pending = deque(
+            submit(s) for s in itertools.islice(part_starts, self.connections)
+        )
+        try:
+            while pending:
+                data = pending.popleft().result()
+                next_start = next(part_starts, None)
+                if next_start is not None:
+                    pending.append(submit(next_start))
+                yield data
+        finally:
+            stop.set()
+            pool.shutdown(wait=True, cancel_futures=True)
+
+    def fetch_part(self, start, end, validator, stop):
+        headers = {"Range": f"bytes={start}-{end - 1}"}
+        if validator:
+            headers["If-Range"] = validator
+
+        data = bytearray()
+        with connection_slots:
+            with self.session.get(
+                self.url, headers=headers, stream=True, timeout=REQUEST_TIMEOUT
+            ) as response:
+                self.check_partial_response(response)
+                for chunk in response.iter_content(chunk_size=CHUNK_SIZE):
+                    if stop.is_set():
+                        raise DownloadAborted(f"Stopped downloading {self.url}")
+                    self.check_abort()
+                    bandwidth_limiter.consume(len(chunk))
+                    data += chunk
+                    with self.progress_lock:
+                        self.stream_done += len(chunk)
+                        done = self.stream_done
+                    self.report_progress(len(chunk), done, self.stream_size)
+
+        if len(data) < end - start:
+            raise IOError(f"Connection closed early while downloading {self.url}")
+        return bytes(data)
+
+    def iter_whole(self, remote):
+        # The server cannot serve ranges, so this download cannot be resumed
+        with connection_slots:
+            with self.session.get(
+                self.url, stream=True, timeout=REQUEST_TIMEOUT
+            ) as response:
+                response.raise_for_status()
+                for chunk in response.iter_content(chunk_size=CHUNK_SIZE):
+                    self.check_abort()
+                    bandwidth_limiter.consume(len(chunk))
+                    self.report_progress(
+                        len(chunk), self.session_bytes + len(chunk), remote["size"]
+                    )
+                    yield chunk
+
+    def fetch_segment(self, fd, segment, progress):
+        return self.retrying(self.fetch_segment_once, fd, segment, progress)
+
+    def retrying(self, fetch, *args):
+        for attempt in range(SEGMENT_RETRIES + 1):
+            try:
+                return fetch(*args)
+            except (requests.exceptions.RequestException, OSError) as e:
+                if attempt == SEGMENT_RETRIES:
+                    raise
+                delay = RETRY_BACKOFF * 2**attempt
+                print(f"⚠️  Retrying part of {self.url} in {delay}s: {e}")
+                if self.abort is not None:
+                    self.abort.wait(delay)
+                else:
+                    time.sleep(delay)
+                self.check_abort()
+
+    def fetch_segment_once(self, fd, segment, progress):
+        offset = segment["start"] + segment["done"]
+        if offset >= segment["end"]:
+            return
+
+        headers = {"Range": f"bytes={offset}-{segment['end'] - 1}"}
+        validator = progress["etag"] or progress["last_modified"]
+        if validator:
+            headers["If-Range"] = validator
+
+        last_save = time.monotonic()
+        try:
+            with connection_slots:
+                with self.session.get(
+                    self.url, headers=headers, stream=True, timeout=REQUEST_TIMEOUT
+                ) as response:
+                    self.check_partial_response(response)
+                    for chunk in response.iter_content(chunk_size=CHUNK_SIZE):
+                        self.check_abort()
+                        bandwidth_limiter.consume(len(chunk))
+                        os.pwrite(fd, chunk, offset)
+                        offset += len(chunk)
+                        segment["done"] = offset - segment["start"]
+                        self.report_progress(
+                            len(chunk),
+                            sum(s["done"] for s in progress["segments"]),
+                            progress["size"],
+                        )
+                        if time.monotonic() - last_save > PROGRESS_SAVE_INTERVAL:
+                            self.save_progress(progress)
+                            last_save = time.monotonic()
+        finally:
+            # Keep whatever arrived so a retry can resume from here
+            self.save_progress(progress)
+
+        if offset < segment["end"]:
+            raise IOError(f"Connection closed early while downloading {self.url}")
+
+    def fetch_whole(self, remote):
+        # The server cannot serve ranges, so this download cannot be resumed
+        with connection_slots:
+            with self.session.get(
+                self.url, stream=True, timeout=REQUEST_TIMEOUT
+            ) as response:
+                response.raise_for_status()
+                with open(self.file_path, "wb") as f:
+                    for chunk in response.iter_content(chunk_size=CHUNK_SIZE):
+                        self.check_abort()
+                        bandwidth_limiter.consume(len(chunk))
+                        f.write(chunk)
+                        self.report_progress(
+                            len(chunk), self.session_bytes + len(chunk), remote["size"]
+                        )
+        self.save_progress({**remote, "segments": [], "complete": True})
+
+    def check_partial_response(self, response):
+        if response.status_code == 200:
+            # If-Range did not match, so the file has changed
+            raise RemoteFileChanged(f"{self.url} changed while it was being downloaded")
+        if response.status_code != 206:
+            raise IOError(
+                f"Expected a partial response for {self.url}, got {response.status_code}"
+            )
+
+    def check_abort(self):
+        if self.abort is not None and self.abort.is_set():
+            raise DownloadAborted(f"Stopped downloading {self.url}")
+
+    def report_progress(self, chunk_bytes, bytes_done, total_bytes):
+        with self.progress_lock:
+            self.session_bytes += chunk_bytes
+            session_bytes = self.session_bytes
+        if self.on_progress:
+            elapsed = time.monotonic() - self.session_start
+            self.on_progress(
+                bytes_done, total_bytes, session_bytes / elapsed if elapsed > 0 else 0
+            )
+
+    def install(self):
+        os.makedirs(self.dest, exist_ok=True)
+        if not self.extract:
+            target = os.path.join(self.dest, self.filename)
+            atomic_move(self.file_path, target)
+            write_complete_marker(target)
+            return [target]
+
+        moved = []
+        for entry in os.listdir(self.extract_dir):
+            target = os.path.join(self.dest, entry)
+            atomic_move(os.path.join(self.extract_dir, entry), target)
+            write_complete_marker(target)
+            moved.append(target)
+        return moved
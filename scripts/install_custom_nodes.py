@@ -2,6 +2,7 @@
 
 import json
 import os
+import shutil
 import subprocess
 
 """
@@ -63,6 +64,20 @@ for repo in repos:
 
         os.chdir(current_dir)
 
+# Custom nodes kept in this repository are copied over any earlier copy,
+# so the installed version always matches the checked out one
+bundled_nodes_dir = "cog_custom_nodes"
+for node_name in sorted(os.listdir(bundled_nodes_dir)):
+    src = os.path.join(bundled_nodes_dir, node_name)
+    if os.path.isdir(src):
+        print(f"Installing bundled custom node {node_name}")
+        shutil.copytree(
+            src,
+            os.path.join(custom_nodes_dir, node_name),
+            dirs_exist_ok=True,
+            ignore=shutil.ignore_patterns("__pycache__"),
+        )
+
 # Copy custom node config files to the correct directory
 config_files = {
     "was_suite_config": {
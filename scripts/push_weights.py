@@ -9,6 +9,9 @@ import urllib.parse
 import time
 from datetime import datetime
 
+sys.path.append(os.path.join(os.path.dirname(__file__), ".."))
+from resumable_download import download_url
+
 
 def check_gcloud_auth():
     try:
@@ -134,13 +137,11 @@ def download_file(url, filename=None, civitai_api_token=None, hf_cli_download=Fa
         url = civitai_url_with_token(url, civitai_api_token)
         print(f"Downloading {url} to {filename}")
         try:
-            result = subprocess.run(["pget", "-f", url, filename], timeout=600)
-            if result.returncode != 0:
-                raise RuntimeError(
-                    "Download failed. You may need to pass in a valid CivitAI API token."
-                )
-        except subprocess.TimeoutExpired:
-            raise RuntimeError("Download failed due to timeout")
+            download_url(url, filename)
+        except Exception as e:
+            raise RuntimeError(
+                f"Download failed: {e}. You may need to pass in a valid CivitAI API token."
+            )
     elif is_huggingface_url(url):
         if hf_cli_download:
             repo_id, revision, filename_and_path, extracted_filename = (
@@ -173,13 +174,13 @@ def download_file(url, filename=None, civitai_api_token=None, hf_cli_download=Fa
                 filename = get_filename_from_huggingface_url(url)
                 filename = confirm_filename(filename)
             print(f"Downloading from HuggingFace: {url} to {filename}")
-            subprocess.run(["pget", "-f", url, filename])
+            download_url(url, filename)
     else:
         if not filename:
             filename = get_filename_from_url(url)
             filename = confirm_filename(filename)
         print(f"Downloading {url} to {filename}")
-        subprocess.run(["pget", "-f", url, filename])
+        download_url(url, filename)
 
     print(f"Successfully downloaded {filename}")
     end_time = time.time()
@@ -0,0 +1,235 @@
+import os
+import time
+import threading
+import subprocess
+from collections import OrderedDict
+from comfyui_client import ComfyUIClient
+
+SERVER_START_TIMEOUT = 60
+# How many recently used model files are remembered for each server
+LOADED_MODELS_MEMORY = 32
+
+# Workflows made only of these nodes are light enough to run on a CPU server
+CPU_NODE_TYPES = {
+    "LoadImage",
+    "LoadImageMask",
+    "SaveImage",
+    "CogSaveImage",
+    "PreviewImage",
+    "ImageScale",
+    "ImageScaleBy",
+    "ImageInvert",
+    "ImageCrop",
+    "BiRefNet_ModelLoader_Zho",
+    "BiRefNet_Zho",
+    "Image Rembg (Remove Background)",
+    "ImageRemoveBackground+",
+    "RemBGSession+",
+}
+
+
+class ComfyUIServer:
+    """
+    One ComfyUI process: its port, device, output and temp directories, and
+    the client used to talk to it.
+
+    device is None to let ComfyUI choose, "cpu", or a CUDA device index.
+    cpus is None to run on any CPU, or the CPU ids the process is pinned to.
+    """
+
+    def __init__(
+        self,
+        port,
+        output_directory,
+        input_directory,
+        device=None,
+        temp_directory=None,
+        main_script="./ComfyUI/main.py",
+        name="ComfyUI",
+        cpus=None,
+    ):
+        self.name = name
+        self.port = port
+        self.server_address = f"127.0.0.1:{port}"
+        self.output_directory = output_directory
+        self.input_directory = input_directory
+        self.device = device
+        self.cpus = cpus
+        # ComfyUI keeps temp files in a "temp" folder inside --temp-directory
+        self.temp_base_directory = temp_directory
+        self.temp_directory = os.path.join(temp_directory or "ComfyUI", "temp")
+        self.main_script = main_script
+        self.client = ComfyUIClient(self.server_address)
+        self.in_flight = 0
+        self.loaded_models = OrderedDict()
+
+    @property
+    def is_cpu(self):
+        return self.device == "cpu"
+
+    def command(self):
+        command = f"python {self.main_script} --port {self.port} --output-directory {self.output_directory} --input-directory {self.input_directory} --disable-metadata"
+        if self.temp_base_directory:
+            command += f" --temp-directory {self.temp_base_directory}"
+        if self.is_cpu:
+            command += " --cpu"
+        elif self.device is not None:
+            command += f" --cuda-device {self.device}"
+        if self.cpus:
+            # Pinned with taskset rather than a preexec_fn, which is unsafe
+            # when servers are started from threads
+            cpu_list = ",".join(str(cpu) for cpu in sorted(self.cpus))
+            command = f"taskset -c {cpu_list} {command}"
+        return command
+
+    def run(self):
+        """
+        We need to capture the stdout and stderr from the server process
+        so that we can print the logs to the console. If we don't do this
+        then at the point where ComfyUI attempts to print it will throw a
+        broken pipe error. This only happens from cog v0.9.13 onwards.
+        """
+        os.makedirs(self.output_directory, exist_ok=True)
+        server_process = subprocess.Popen(
+            self.command(),
+            shell=True,
+            stdout=subprocess.PIPE,
+            stderr=subprocess.PIPE,
+            universal_newlines=True,
+        )
+
+        def print_stdout():
+            for stdout_line in iter(server_process.stdout.readline, ""):
+                print(f"[{self.name}] {stdout_line.strip()}")
+
+        stdout_thread = threading.Thread(target=print_stdout)
+        stdout_thread.start()
+
+        for stderr_line in iter(server_process.stderr.readline, ""):
+            print(f"[{self.name}] {stderr_line.strip()}")
+
+    def remember_models(self, models):
+        for model in models:
+            self.loaded_models[model] = True
+            self.loaded_models.move_to_end(model)
+        while len(self.loaded_models) > LOADED_MODELS_MEMORY:
+            self.loaded_models.popitem(last=False)
+
+
+class ServerPool:
+    """
+    Runs several ComfyUI servers and routes each workflow to one of them.
+
+    A workflow goes to the server with the fewest prompts in flight,
+    preferring a server that recently ran the same model files, since
+    they are likely still loaded. CPU servers only take workflows made
+    entirely of CPU_NODE_TYPES.
+    """
+
+    def __init__(self, servers, weights_filetypes=()):
+        self.servers = servers
+        self.weights_filetypes = tuple(weights_filetypes)
+        self.lock = threading.Lock()
+
+    @classmethod
+    def from_devices(
+        cls,
+        devices,
+        server_address,
+        output_directory,
+        input_directory,
+        weights_filetypes=(),
+        cpus=None,
+    ):
+        # The first server keeps the given port and directories, each
+        # further one takes the next port and directories of its own.
+        # cpus, if given, holds the CPU ids for each device's server.
+        cpus = cpus or [None] * len(devices)
+        first_port = int(server_address.rsplit(":", 1)[1])
+        servers = [
+            ComfyUIServer(
+                first_port,
+                output_directory,
+                input_directory,
+                device=devices[0],
+                cpus=cpus[0],
+            )
+        ]
+        for i, device in enumerate(devices[1:], start=1):
+            port = first_port + i
+            servers.append(
+                ComfyUIServer(
+                    port,
+                    f"{output_directory}_{port}",
+                    input_directory,
+                    device=device,
+                    temp_directory=f"ComfyUI/servers/{port}",
+                    name=f"ComfyUI:{port}",
+                    cpus=cpus[i],
+                )
+            )
+        return cls(servers, weights_filetypes)
+
+    @property
+    def primary(self):
+        return self.servers[0]
+
+    @property
+    def secondary(self):
+        return self.servers[1:]
+
+    def start(self):
+        start_time = time.time()
+        for server in self.servers:
+            threading.Thread(target=server.run).start()
+
+        for server in self.servers:
+            while not server.client.is_server_running():
+                if time.time() - start_time > SERVER_START_TIMEOUT:
+                    raise TimeoutError(
+                        f"Server on port {server.port} did not start within {SERVER_START_TIMEOUT} seconds"
+                    )
+                time.sleep(0.5)
+
+    def workflow_models(self, workflow):
+        return {
+            value
+            for node in workflow.values()
+            for value in node.get("inputs", {}).values()
+            if isinstance(value, str) and value.endswith(self.weights_filetypes)
+        }
+
+    @staticmethod
+    def runs_on_cpu(workflow):
+        return all(
+            node.get("class_type") in CPU_NODE_TYPES for node in workflow.values()
+        )
+
+    def eligible_servers(self, workflow):
+        if self.runs_on_cpu(workflow):
+            return self.servers
+        servers = [server for server in self.servers if not server.is_cpu]
+        return servers or self.servers
+
+    def acquire(self, workflow):
+        models = self.workflow_models(workflow)
+        with self.lock:
+
+            def score(server):
+                overlap = (
+                    len(models & server.loaded_models.keys()) / len(models)
+                    if models
+                    else 0
+                )
+                return server.in_flight - overlap
+
+            server = min(self.eligible_servers(workflow), key=score)
+            server.in_flight += 1
+            server.remember_models(models)
+        if len(self.servers) > 1:
+            print(f"Running workflow on ComfyUI server {server.port}")
+        return server
+
+    def release(self, server):
+        with self.lock:
+            server.in_flight -= 1
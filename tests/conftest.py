@@ -0,0 +1,164 @@
+import os
+import sys
+import time
+import threading
+from http.server import BaseHTTPRequestHandler, ThreadingHTTPServer
+
+import pytest
+
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+
+
+class FileServer:
+    """
+    Serves files from memory with range, ETag and conditional request
+    support, and records every request so tests can check what was sent.
+    """
+
+    def __init__(self):
+        self.files = {}
+        self.etags = {}
+        self.requests = []
+        # Paths that answer HEAD with this status instead
+        self.head_status = {}
+        # Paths whose responses are cut short after this many bytes, for
+        # the first few requests
+        self.drops = {}
+        # Paths whose bodies are sent after this many seconds
+        self.delays = {}
+        self.lock = threading.Lock()
+        self.httpd = ThreadingHTTPServer(("127.0.0.1", 0), self.handler())
+        self.httpd.daemon_threads = True
+        self.thread = threading.Thread(
+            target=self.httpd.serve_forever, kwargs={"poll_interval": 0.05}, daemon=True
+        )
+
+    def url(self, path):
+        return f"http://127.0.0.1:{self.httpd.server_port}{path}"
+
+    def add(self, path, data, etag=None):
+        self.files[path] = data
+        self.etags[path] = etag
+        return self.url(path)
+
+    def drop(self, path, after_bytes, times=1):
+        self.drops[path] = [after_bytes, times]
+
+    def requests_for(self, path, method="GET"):
+        with self.lock:
+            return [r for r in self.requests if r["path"] == path and r["method"] == method]
+
+    def handler(self):
+        server = self
+
+        class Handler(BaseHTTPRequestHandler):
+            protocol_version = "HTTP/1.1"
+
+            def log_message(self, *args):
+                pass
+
+            def record(self):
+                with server.lock:
+                    server.requests.append(
+                        {"method": self.command, "path": self.path, "headers": dict(self.headers)}
+                    )
+
+            def do_HEAD(self):
+                self.record()
+                if self.path in server.head_status:
+                    self.send_response(server.head_status[self.path])
+                    self.send_header("Content-Length", "0")
+                    self.end_headers()
+                    return
+                self.respond(head=True)
+
+            def do_GET(self):
+                self.record()
+                self.respond(head=False)
+
+            def respond(self, head):
+                data = server.files.get(self.path)
+                if data is None:
+                    self.send_response(404)
+                    self.send_header("Content-Length", "0")
+                    self.end_headers()
+                    return
+
+                etag = server.etags.get(self.path)
+                if etag and self.headers.get("If-None-Match") == etag:
+                    self.send_response(304)
+                    self.send_header("ETag", etag)
+                    self.end_headers()
+                    return
+
+                start, end, status = 0, len(data), 200
+                range_header = self.headers.get("Range")
+                if_range = self.headers.get("If-Range")
+                if range_header and (not if_range or if_range == etag):
+                    first, last = range_header.split("=", 1)[1].split("-")
+                    start, end, status = int(first), int(last) + 1, 206
+
+                self.send_response(status)
+                self.send_header("Accept-Ranges", "bytes")
+                self.send_header("Content-Length", str(end - start))
+                if status == 206:
+                    self.send_header("Content-Range", f"bytes {start}-{end - 1}/{len(data)}")
+                if etag:
+                    self.send_header("ETag", etag)
+                self.end_headers()
+                if head:
+                    return
+
+                body = data[start:end]
+                time.sleep(server.delays.get(self.path, 0))
+                with server.lock:
+                    drop = server.drops.get(self.path)
+                    if drop and drop[1] > 0 and len(body) > drop[0]:
+                        drop[1] -= 1
+                        body = body[: drop[0]]
+                        self.close_connection = True
+                self.wfile.write(body)
+
+        return Handler
+
+    def __enter__(self):
+        self.thread.start()
+        return self
+
+    def __exit__(self, *args):
+        self.httpd.shutdown()
+        self.httpd.server_close()
+
+
+@pytest.fixture
+def file_server():
+    with FileServer() as server:
+        yield server
+
+
+@pytest.fixture
+def comfyui(tmp_path, monkeypatch):
+    """A ComfyUI wrapper that is never connected to a server."""
+    pytest.importorskip("websocket")
+    import weights_cache
+    import weights_manifest
+    from comfyui import ComfyUI
+
+    # predict.py turns this on when imported, tests never fetch the manifest
+    monkeypatch.delenv("DOWNLOAD_LATEST_WEIGHTS_MANIFEST", raising=False)
+    cache_path = str(tmp_path / "weights_cache")
+    monkeypatch.setattr(weights_cache, "WEIGHTS_CACHE_PATH", cache_path)
+    monkeypatch.setattr(
+        weights_cache, "WEIGHTS_ACCESS_PATH", os.path.join(cache_path, "weights_access.json")
+    )
+    monkeypatch.setattr(weights_cache, "LEASES_PATH", os.path.join(cache_path, "leases"))
+    monkeypatch.setattr(
+        weights_manifest,
+        "WEIGHTS_MANIFEST_INDEX_PATH",
+        os.path.join(cache_path, "weights_manifest_index.pickle"),
+    )
+    comfyui = ComfyUI("127.0.0.1:1")
+    # Set by start_server, which is never called here
+    comfyui.input_directory = str(tmp_path / "server_inputs")
+    comfyui.output_directory = str(tmp_path / "server_outputs")
+    return comfyui
@@ -0,0 +1,149 @@
+import importlib.util
+import json
+import os
+import sys
+import types
+
+import numpy as np
+import pytest
+from PIL import Image
+
+NODE_PATH = os.path.join(
+    os.path.dirname(__file__), "..", "cog_custom_nodes", "cog_save_image", "__init__.py"
+)
+
+
+class Tensor:
+    """The parts of a torch image tensor the node uses."""
+
+    def __init__(self, array):
+        self.array = array
+        self.shape = array.shape
+
+    def cpu(self):
+        return self
+
+    def numpy(self):
+        return self.array
+
+
+@pytest.fixture
+def cog_save_image(tmp_path, monkeypatch):
+    # folder_paths is ComfyUI's, it is faked to save under tmp_path
+    def get_save_image_path(filename_prefix, output_dir, width, height):
+        subfolder, filename = os.path.split(filename_prefix)
+        folder = os.path.join(output_dir, subfolder)
+        os.makedirs(folder, exist_ok=True)
+        return folder, filename, 1, subfolder, filename_prefix
+
+    folder_paths = types.SimpleNamespace(
+        get_output_directory=lambda: str(tmp_path),
+        get_save_image_path=get_save_image_path,
+    )
+    monkeypatch.setitem(sys.modules, "folder_paths", folder_paths)
+    spec = importlib.util.spec_from_file_location("cog_save_image", NODE_PATH)
+    module = importlib.util.module_from_spec(spec)
+    spec.loader.exec_module(module)
+    return module.NODE_CLASS_MAPPINGS["CogSaveImage"]()
+
+
+def images(count=1):
+    rng = np.random.default_rng(0)
+    return [Tensor(rng.random((16, 24, 3))) for _ in range(count)]
+
+
+def reference(tmp_path, image, name, **save_options):
+    pixels = np.clip(255.0 * image.array, 0, 255).astype(np.uint8)
+    path = tmp_path / name
+    Image.fromarray(pixels).save(path, **save_options)
+    return path.read_bytes()
+
+
+def test_saves_each_image_in_the_requested_format(cog_save_image, tmp_path):
+    batch = images(2)
+
+    result = cog_save_image.save_images(batch, "outputs/ComfyUI", "webp", 80)
+
+    assert result["ui"]["images"] == [
+        {"filename": "ComfyUI_00001_.webp", "subfolder": "outputs", "type": "output"},
+        {"filename": "ComfyUI_00002_.webp", "subfolder": "outputs", "type": "output"},
+    ]
+    with Image.open(tmp_path / "outputs" / "ComfyUI_00001_.webp") as saved:
+        assert saved.format == "WEBP"
+        assert saved.size == (24, 16)
+
+
+def test_quality_and_save_options_are_applied(cog_save_image, tmp_path):
+    (image,) = images()
+
+    cog_save_image.save_images([image], "low", "jpg", 20)
+    cog_save_image.save_images([image], "high", "jpg", 95, json.dumps({"progressive": True}))
+
+    low = (tmp_path / "low_00001_.jpg").read_bytes()
+    high = (tmp_path / "high_00001_.jpg").read_bytes()
+    assert low == reference(tmp_path, image, "ref.jpg", quality=20, optimize=True)
+    assert high == reference(tmp_path, image, "ref.jpg", quality=95, progressive=True)
+
+
+@pytest.fixture
+def comfyui_with_save_node(comfyui):
+    # As reported by a server's object_info
+    comfyui.output_node_types = {"SaveImage", "PreviewImage", "CogSaveImage"}
+    return comfyui
+
+
+def save_workflow():
+    return {
+        "9": {"class_type": "SaveImage", "inputs": {"filename_prefix": "ComfyUI", "images": ["8", 0]}},
+        "10": {"class_type": "PreviewImage", "inputs": {"images": ["8", 0]}},
+    }
+
+
+def test_png_output_keeps_save_image(comfyui_with_save_node):
+    wf = save_workflow()
+
+    comfyui_with_save_node.save_images_as(wf, "png", 80)
+
+    assert wf == save_workflow()
+
+
+def test_save_image_is_rewritten_for_webp_and_jpg(comfyui_with_save_node):
+    for output_format in ["webp", "jpg"]:
+        wf = save_workflow()
+
+        comfyui_with_save_node.save_images_as(wf, output_format, 70, "fast")
+
+        assert wf["9"]["class_type"] == "CogSaveImage"
+        assert wf["9"]["inputs"]["format"] == output_format
+        assert wf["9"]["inputs"]["quality"] == 70
+        assert wf["9"]["inputs"]["images"] == ["8", 0]
+        assert wf["10"] == save_workflow()["10"]
+
+
+def test_save_image_is_kept_when_the_server_lacks_the_node(comfyui):
+    comfyui.output_node_types = {"SaveImage", "PreviewImage"}
+    wf = save_workflow()
+
+    comfyui.save_images_as(wf, "webp", 80)
+
+    assert wf == save_workflow()
+
+
+def test_the_rewritten_node_saves_at_the_output_quality(
+    comfyui_with_save_node, cog_save_image, tmp_path
+):
+    wf = save_workflow()
+    comfyui_with_save_node.save_images_as(wf, "jpg", 35, "balanced")
+    inputs = wf["9"]["inputs"]
+    (image,) = images()
+
+    cog_save_image.save_images(
+        [image],
+        inputs["filename_prefix"],
+        inputs["format"],
+        inputs["quality"],
+        inputs["save_options"],
+    )
+
+    saved = (tmp_path / "ComfyUI_00001_.jpg").read_bytes()
+    assert saved == reference(tmp_path, image, "ref.jpg", quality=35, optimize=True)
@@ -0,0 +1,138 @@
+import json
+import queue
+
+import pytest
+
+websocket = pytest.importorskip("websocket")
+import comfyui_client  # noqa: E402
+from comfyui_client import ComfyUIClient  # noqa: E402
+
+
+class FakeServer:
+    """Stands in for ComfyUI's websocket endpoint, fed messages by the test."""
+
+    def __init__(self):
+        self.messages = queue.Queue()
+        self.connections = []
+
+    def send(self, message_type, **data):
+        self.messages.put(json.dumps({"type": message_type, "data": data}))
+
+    def drop_connection(self):
+        self.messages.put(websocket.WebSocketConnectionClosedException("dropped"))
+
+    def socket(self):
+        server = self
+
+        class Socket:
+            connected = False
+
+            def connect(self, url):
+                self.connected = True
+                server.connections.append(url)
+
+            def recv(self):
+                if not self.connected:
+                    raise websocket.WebSocketConnectionClosedException("closed")
+                item = server.messages.get()
+                if isinstance(item, Exception):
+                    self.connected = False
+                    raise item
+                return item
+
+            def close(self):
+                if self.connected:
+                    self.connected = False
+                    # Wakes a reader blocked in recv
+                    server.messages.put(websocket.WebSocketConnectionClosedException("closed"))
+
+        return Socket()
+
+
+@pytest.fixture
+def server(monkeypatch):
+    server = FakeServer()
+    monkeypatch.setattr(comfyui_client.websocket, "WebSocket", server.socket)
+    return server
+
+
+@pytest.fixture
+def client(server):
+    client = ComfyUIClient("127.0.0.1:1")
+    client.connect()
+    yield client
+    client.close()
+
+
+def next_message(messages):
+    return messages.get(timeout=5)
+
+
+def test_routes_messages_to_the_prompt_they_belong_to(server, client):
+    first = client.subscribe("first")
+    second = client.subscribe("second")
+
+    server.send("status", status={})
+    server.send("executing", node="1", prompt_id="second")
+    server.send("executing", node="2", prompt_id="first")
+    server.send("executed", node="3", prompt_id="second")
+
+    assert next_message(first)["data"]["node"] == "2"
+    assert [next_message(second)["data"]["node"] for _ in range(2)] == ["1", "3"]
+    assert first.empty()
+
+
+def test_messages_sent_before_subscribing_are_replayed(server, client):
+    client.start_reader()
+    server.send("execution_start", prompt_id="early")
+    server.send("executing", node="1", prompt_id="early")
+    server.send("executing", node="1", prompt_id="other")
+    # The reader has taken everything up to here once this arrives
+    probe = client.subscribe("probe")
+    server.send("executing", node=None, prompt_id="probe")
+    next_message(probe)
+
+    messages = client.subscribe("early")
+
+    assert next_message(messages)["type"] == "execution_start"
+    assert next_message(messages)["data"]["node"] == "1"
+    assert messages.empty()
+
+
+def test_a_dropped_connection_wakes_waiters_and_reconnects(server, client):
+    messages = client.subscribe("prompt")
+
+    server.drop_connection()
+    assert next_message(messages) is None
+
+    server.send("executing", node=None, prompt_id="prompt")
+    assert next_message(messages)["data"]["node"] is None
+    # The same client_id is used for every connection
+    assert len(server.connections) == 2
+    assert len(set(server.connections)) == 1
+
+
+def test_a_closed_client_can_connect_again(server, client):
+    client.subscribe("prompt")
+    client.close()
+    client.reader.join(timeout=5)
+    assert not client.reader.is_alive()
+
+    client.connect()
+    messages = client.subscribe("prompt")
+    server.send("executing", node="1", prompt_id="prompt")
+
+    assert next_message(messages)["data"]["node"] == "1"
+
+
+def test_unsubscribed_prompts_stop_receiving_messages(server, client):
+    messages = client.subscribe("prompt")
+    client.unsubscribe("prompt")
+    done = client.subscribe("done")
+
+    server.send("executing", node="1", prompt_id="prompt")
+    server.send("executing", node=None, prompt_id="done")
+
+    next_message(done)
+    assert messages.empty()
+
@@ -0,0 +1,101 @@
+import copy
+import json
+import os
+
+import custom_node_helpers as helpers
+import weights_downloader
+from custom_node_helpers.PuLID import FACEXLIB_PATH, facexlib_models
+from helper_context import HelperContext
+from node import Node
+
+EXAMPLES = os.path.join(os.path.dirname(__file__), "..", "examples", "api_workflows")
+
+
+def example_nodes():
+    for name in sorted(os.listdir(EXAMPLES)):
+        if name.endswith(".json"):
+            with open(os.path.join(EXAMPLES, name)) as f:
+                for node in json.load(f).values():
+                    if isinstance(node, dict) and "class_type" in node:
+                        yield node
+
+
+def registered_nodes():
+    # Every class_type a helper handles, with the inputs its branches read
+    for node_type in helpers.WEIGHTS_HELPERS_BY_NODE_TYPE:
+        yield {"class_type": node_type, "inputs": {}}
+    yield {"class_type": "AIO_Preprocessor", "inputs": {"preprocessor": "CannyEdgePreprocessor"}}
+    yield {"class_type": "ApplyPulidFlux", "inputs": {}}
+    yield {
+        "class_type": "InstantIDModelLoader",
+        "inputs": {"instantid_file": "ipadapter.bin"},
+    }
+
+
+def weights_from(helpers_to_run, node):
+    node = copy.deepcopy(node)
+    weights = []
+    context = HelperContext(None)
+    for helper in helpers_to_run:
+        helper.add_weights(weights, Node(node), context=context)
+    return weights, context.extra_downloads, node
+
+
+def test_registry_matches_calling_every_helper():
+    for node in list(example_nodes()) + list(registered_nodes()):
+        full_scan = weights_from(helpers.HELPERS, node)
+        registry = weights_from(
+            helpers.weights_helpers_for(node.get("class_type")), node
+        )
+        assert registry == full_scan, node.get("class_type")
+
+
+def test_helpers_ignore_nodes_they_do_not_list():
+    for helper in helpers.HELPERS:
+        for node_type in helpers.WEIGHTS_HELPERS_BY_NODE_TYPE:
+            if node_type in helper.node_types:
+                continue
+            weights, extra_downloads, _ = weights_from(
+                [helper], {"class_type": node_type, "inputs": {"model": "u2net"}}
+            )
+            assert (weights, extra_downloads) == ([], []), (helper.__name__, node_type)
+
+
+def pulid_workflow():
+    return {
+        "1": {"class_type": "PulidFluxEvaClipLoader", "inputs": {}},
+        "2": {"class_type": "PulidFluxInsightFaceLoader", "inputs": {"provider": "CUDA"}},
+        "3": {"class_type": "ApplyPulidFlux", "inputs": {"eva_clip": ["1", 0]}},
+    }
+
+
+def test_extra_downloads_are_scheduled_with_the_workflow_weights(comfyui):
+    calls = []
+    comfyui.weights_downloader.download_weights_list = (
+        lambda weights, extra_downloads=(), prediction=None: calls.append(
+            (sorted(weights), list(extra_downloads))
+        )
+    )
+
+    comfyui.handle_weights(pulid_workflow())
+
+    assert len(calls) == 1
+    weights, extra_downloads = calls[0]
+    assert weights == ["EVA02_CLIP_L_336_psz14_s6B.pt", "models/antelopev2"]
+    assert [weight_str for weight_str, _, _ in extra_downloads] == facexlib_models
+    assert all(dest == FACEXLIB_PATH for _, _, dest in extra_downloads)
+
+
+def test_pulid_downloads_directly_without_a_context(monkeypatch):
+    downloaded = []
+
+    class Downloader:
+        def download_if_not_exists(self, weight_str, url, dest):
+            downloaded.append(weight_str)
+
+    monkeypatch.setattr(weights_downloader, "WeightsDownloader", Downloader)
+    weights = []
+    helpers.PuLID.add_weights(weights, Node(pulid_workflow()["3"]))
+
+    assert weights == []
+    assert downloaded == facexlib_models
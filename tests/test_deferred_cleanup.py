@@ -0,0 +1,85 @@
+import os
+
+import pytest
+
+import deferred_cleanup
+from deferred_cleanup import DeferredCleanup
+
+
+@pytest.fixture
+def trash(tmp_path, monkeypatch):
+    trash = tmp_path / "trash" / ".cog-trash"
+    monkeypatch.setattr(deferred_cleanup, "TRASH_DIRECTORY", str(trash))
+    return trash
+
+
+def work_directory(tmp_path, name, files=3):
+    directory = tmp_path / "inputs" / name
+    (directory / "nested").mkdir(parents=True)
+    for i in range(files):
+        (directory / "nested" / f"{i}.png").write_bytes(b"x")
+    return directory
+
+
+def test_removes_directories_in_the_background(tmp_path, trash):
+    cleanup = DeferredCleanup()
+    directory = work_directory(tmp_path, "prediction")
+
+    cleanup.remove(str(directory))
+
+    assert not directory.exists()
+    cleanup.wait()
+    assert os.listdir(trash) == []
+
+
+def test_trash_is_kept_outside_the_removed_paths_parent(tmp_path, trash):
+    cleanup = DeferredCleanup()
+
+    cleanup.remove(str(work_directory(tmp_path, "first")))
+    cleanup.remove(str(work_directory(tmp_path, "second")))
+    cleanup.wait()
+
+    assert os.listdir(tmp_path / "inputs") == []
+    assert list(cleanup.trash_directories.values()) == [str(trash)]
+
+
+def test_deletes_trash_left_by_a_previous_process(tmp_path, trash):
+    trash.mkdir(parents=True)
+    (trash / "leftover").mkdir()
+    (trash / "leftover" / "file").write_bytes(b"x")
+
+    cleanup = DeferredCleanup()
+    cleanup.remove(str(work_directory(tmp_path, "prediction")))
+    cleanup.wait()
+
+    assert os.listdir(trash) == []
+
+
+def test_empty_swaps_in_an_empty_directory(tmp_path, trash):
+    cleanup = DeferredCleanup()
+    directory = work_directory(tmp_path, "outputs")
+
+    cleanup.empty(str(directory))
+
+    assert directory.is_dir()
+    assert os.listdir(directory) == []
+    cleanup.wait()
+
+
+def test_removes_single_files_and_ignores_missing_paths(tmp_path, trash):
+    cleanup = DeferredCleanup()
+    file = tmp_path / "output.png"
+    file.write_bytes(b"x")
+
+    cleanup.remove(str(file))
+    cleanup.remove(str(tmp_path / "missing.png"))
+    cleanup.wait()
+
+    assert not file.exists()
+
+
+def test_mount_point_is_an_ancestor_on_the_same_filesystem(tmp_path):
+    mount_point = DeferredCleanup.mount_point(str(tmp_path))
+
+    assert str(tmp_path).startswith(mount_point)
+    assert os.stat(mount_point).st_dev == os.stat(tmp_path).st_dev
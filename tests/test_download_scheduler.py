@@ -0,0 +1,132 @@
+import time
+import threading
+
+import pytest
+
+from download_scheduler import DownloadScheduler
+from download_telemetry import DownloadTelemetry
+
+
+class Manifest:
+    def is_non_commercial_only(self, weight_str):
+        return False
+
+
+class Downloader:
+    """Stands in for WeightsDownloader, recording the downloads asked of it."""
+
+    def __init__(self, weights_map, existing=(), download=None):
+        self.weights_map = weights_map
+        self.weights_manifest = Manifest()
+        self.existing = set(existing)
+        self.downloaded = []
+        self.download = download
+
+    def check_if_file_exists(self, weight_str, dest):
+        return weight_str in self.existing
+
+    def download_if_not_exists(self, weight_str, url, dest, max_connections, size, abort, telemetry):
+        self.downloaded.append(weight_str)
+        if self.download:
+            self.download(weight_str, abort)
+
+
+def entry(file_server, name, size):
+    return {"url": file_server.add(f"/{name}", b"x" * size), "dest": "models"}
+
+
+def test_starts_the_smallest_weights_first(file_server):
+    downloader = Downloader(
+        {
+            "large.safetensors": entry(file_server, "large.safetensors", 3000),
+            "small.safetensors": entry(file_server, "small.safetensors", 10),
+            "medium.safetensors": entry(file_server, "medium.safetensors", 500),
+        }
+    )
+
+    DownloadScheduler(downloader, max_workers=1).download(list(downloader.weights_map))
+
+    assert downloader.downloaded == [
+        "small.safetensors",
+        "medium.safetensors",
+        "large.safetensors",
+    ]
+
+
+def test_skips_weights_on_disk_and_records_cache_hits(file_server):
+    downloader = Downloader(
+        {
+            "a.safetensors": entry(file_server, "a.safetensors", 10),
+            "b.safetensors": entry(file_server, "b.safetensors", 10),
+        },
+        existing={"a.safetensors"},
+    )
+    telemetry = DownloadTelemetry()
+
+    DownloadScheduler(downloader, telemetry=telemetry).download(
+        ["a.safetensors", "b.safetensors"]
+    )
+
+    assert downloader.downloaded == ["b.safetensors"]
+    assert telemetry.summary()["cache_hits"] == 1
+
+
+def test_missing_weights_fail_before_any_download(file_server):
+    downloader = Downloader(
+        {
+            "a.safetensors": entry(file_server, "a.safetensors", 10),
+            "gone.safetensors": {"url": file_server.url("/gone"), "dest": "models"},
+        }
+    )
+
+    with pytest.raises(ValueError, match="gone.safetensors"):
+        DownloadScheduler(downloader).download(["a.safetensors", "gone.safetensors"])
+    assert downloader.downloaded == []
+
+
+def test_weights_whose_server_rejects_head_are_sized_with_a_ranged_get(file_server):
+    downloader = Downloader(
+        {
+            "large.safetensors": entry(file_server, "large.safetensors", 3000),
+            "presigned.safetensors": entry(file_server, "presigned.safetensors", 10),
+        }
+    )
+    file_server.head_status["/presigned.safetensors"] = 403
+
+    DownloadScheduler(downloader, max_workers=1).download(list(downloader.weights_map))
+
+    assert downloader.downloaded == ["presigned.safetensors", "large.safetensors"]
+    assert file_server.requests_for("/presigned.safetensors")[0]["headers"]["Range"] == "bytes=0-0"
+
+
+def test_unknown_weights_are_unavailable():
+    with pytest.raises(ValueError, match="unknown.safetensors unavailable"):
+        DownloadScheduler(Downloader({})).download(["unknown.safetensors"])
+
+
+def test_a_failure_aborts_running_downloads(file_server):
+    started = threading.Event()
+    stopped = threading.Event()
+
+    def download(weight_str, abort):
+        if weight_str == "broken.safetensors":
+            started.wait(timeout=5)
+            raise IOError("connection reset")
+        started.set()
+        if abort.wait(timeout=10):
+            stopped.set()
+
+    downloader = Downloader(
+        {
+            "broken.safetensors": entry(file_server, "broken.safetensors", 10),
+            "slow.safetensors": entry(file_server, "slow.safetensors", 20),
+        },
+        download=download,
+    )
+
+    start = time.time()
+    with pytest.raises(IOError, match="connection reset"):
+        DownloadScheduler(downloader, max_workers=2).download(list(downloader.weights_map))
+
+    assert time.time() - start < 5
+    assert stopped.wait(timeout=5)
@@ -0,0 +1,34 @@
+from download_telemetry import DownloadTelemetry
+
+
+def test_predictions_are_summarised_separately():
+    telemetry = DownloadTelemetry()
+    first, second = telemetry.prediction(), telemetry.prediction()
+
+    first.cache_hit("a.safetensors", "models")
+    second.start("b.safetensors", "models", "https://example.com/b")
+    second.finish("b.safetensors", "models", 1024, 2.0)
+    with first.phase("executing"):
+        pass
+
+    assert first.summary()["cache_hits"] == 1
+    assert first.summary()["downloads"] == 0
+    assert second.summary()["downloads"] == 1
+    assert second.summary()["bytes_downloaded"] == 1024
+    assert second.summary()["cache_hit_ratio"] == 0
+    assert second.summary()["executing_seconds"] == 0
+
+
+def test_listeners_receive_events_from_every_prediction():
+    telemetry = DownloadTelemetry()
+    events = []
+    telemetry.add_listener(events.append)
+
+    telemetry.prediction().cache_hit("a.safetensors", "models")
+    telemetry.prediction().failure("b.safetensors", "models", IOError("reset"))
+
+    assert [(e["event"], e["weight"]) for e in events] == [
+        ("cache_hit", "a.safetensors"),
+        ("failure", "b.safetensors"),
+    ]
+    assert telemetry.summary()["cache_hits"] == 0
@@ -0,0 +1,58 @@
+import io
+import base64
+
+from PIL import Image
+
+from inline_images import base64_image_extension, offload_base64_images
+
+
+def encoded_image(image_format, size=(64, 64)):
+    buffer = io.BytesIO()
+    # Noise, so the encoded image is larger than the offload threshold
+    Image.effect_noise(size, 64).convert("RGB").save(buffer, format=image_format)
+    return base64.b64encode(buffer.getvalue()).decode("ascii")
+
+
+def test_recognises_large_base64_images():
+    assert base64_image_extension(encoded_image("PNG")) == ".png"
+    assert base64_image_extension(encoded_image("JPEG")) == ".jpg"
+    assert base64_image_extension(encoded_image("WEBP")) == ".webp"
+    assert base64_image_extension(encoded_image("GIF")) == ".gif"
+    assert base64_image_extension(f"data:image/png;base64,{encoded_image('PNG')}") == ".png"
+
+
+def test_ignores_short_strings_and_other_text():
+    assert base64_image_extension("iVBORw0KGgo") is None
+    assert base64_image_extension("a photo of a cat " * 100) is None
+    assert base64_image_extension(None) is None
+
+
+def test_offloads_images_to_files_named_by_content(tmp_path):
+    image = encoded_image("PNG")
+    wf = {
+        "1": {"class_type": "ETN_LoadImageBase64", "inputs": {"image": image}},
+        "2": {"class_type": "ETN_LoadImageBase64", "inputs": {"image": image}},
+        "3": {"class_type": "CLIPTextEncode", "inputs": {"text": image}},
+    }
+
+    offload_base64_images(wf, str(tmp_path))
+
+    filename = wf["1"]["inputs"]["image"]
+    assert wf["1"]["class_type"] == "LoadImage"
+    assert wf["2"]["inputs"]["image"] == filename
+    assert filename.startswith("base64_") and filename.endswith(".png")
+    assert (tmp_path / filename).read_bytes() == base64.b64decode(image)
+    assert wf["3"]["inputs"]["text"] == image
+    assert len(list(tmp_path.iterdir())) == 1
+
+
+def test_offloaded_gifs_are_passed_by_full_path(comfyui, tmp_path):
+    inputs = tmp_path / "prediction"
+    inputs.mkdir()
+    wf = {"1": {"class_type": "ETN_LoadImageBase64", "inputs": {"image": encoded_image("GIF")}}}
+
+    offload_base64_images(wf, str(inputs))
+    comfyui.handle_inputs(wf, str(inputs))
+
+    image = wf["1"]["inputs"]["image"]
+    assert image.startswith(str(inputs)) and image.endswith(".gif")
@@ -0,0 +1,109 @@
+import os
+
+import pytest
+
+from input_cache import InputCache
+
+
+@pytest.fixture
+def cache(tmp_path):
+    return InputCache(str(tmp_path / "cache"))
+
+
+@pytest.fixture
+def inputs(tmp_path):
+    directory = tmp_path / "inputs"
+    directory.mkdir()
+    return directory
+
+
+def test_revalidates_cached_urls_instead_of_downloading_them(file_server, cache, inputs):
+    url = file_server.add("/cat.png", b"cat", etag='"v1"')
+
+    cache.fetch(url, str(inputs / "first.png"))
+    cache.fetch(url, str(inputs / "second.png"))
+
+    requests = file_server.requests_for("/cat.png")
+    assert "If-None-Match" not in requests[0]["headers"]
+    assert requests[1]["headers"]["If-None-Match"] == '"v1"'
+    assert (inputs / "second.png").read_bytes() == b"cat"
+
+
+def test_downloads_changed_urls_again(file_server, cache, inputs):
+    url = file_server.add("/cat.png", b"cat", etag='"v1"')
+    cache.fetch(url, str(inputs / "first.png"))
+
+    file_server.add("/cat.png", b"new cat", etag='"v2"')
+    cache.fetch(url, str(inputs / "second.png"))
+
+    assert (inputs / "second.png").read_bytes() == b"new cat"
+    # Files already linked into an input directory are left as they were
+    assert (inputs / "first.png").read_bytes() == b"cat"
+
+
+def test_evicts_the_least_recently_used_urls(file_server, tmp_path):
+    cache = InputCache(str(tmp_path / "cache"), max_bytes=10)
+    first = file_server.add("/first.png", b"x" * 6, etag='"1"')
+    second = file_server.add("/second.png", b"x" * 6, etag='"2"')
+
+    cache.fetch(first)
+    cache.fetch(second)
+
+    assert not os.path.exists(cache.content_path(cache.key(first)))
+    assert os.path.exists(cache.content_path(cache.key(second)))
+
+
+def test_place_all_reports_failed_urls(file_server, cache, inputs):
+    good = file_server.add("/cat.png", b"cat")
+    missing = file_server.url("/missing.png")
+
+    failed = cache.place_all(
+        {good: str(inputs / "cat.png"), missing: str(inputs / "missing.png")}
+    )
+
+    assert failed == [str(inputs / "missing.png")]
+    assert (inputs / "cat.png").read_bytes() == b"cat"
+
+
+def test_place_all_fetches_one_url_per_destination(file_server, cache, inputs):
+    first = file_server.add("/a/cat.png", b"first")
+    second = file_server.add("/b/cat.png", b"second")
+    destination = str(inputs / "cat.png")
+
+    failed = cache.place_all({first: destination, second: destination})
+
+    assert failed == [destination]
+    assert (inputs / "cat.png").read_bytes() == b"first"
+    assert file_server.requests_for("/b/cat.png") == []
+
+
+def test_linking_never_writes_through_an_existing_link(file_server, cache, inputs):
+    first = file_server.add("/a/cat.png", b"first")
+    second = file_server.add("/b/cat.png", b"second")
+    destination = str(inputs / "cat.png")
+
+    cache.fetch(first, destination)
+    cache.fetch(second, destination)
+
+    assert (inputs / "cat.png").read_bytes() == b"second"
+    with open(cache.content_path(cache.key(first)), "rb") as f:
+        assert f.read() == b"first"
+    assert sorted(os.listdir(inputs)) == ["cat.png"]
+
+
+def test_same_named_urls_get_their_own_files(comfyui, file_server, inputs, monkeypatch):
+    monkeypatch.setattr(comfyui, "input_cache", InputCache(str(inputs.parent / "cache")))
+    first = file_server.add("/a/cat.png", b"first")
+    second = file_server.add("/b/cat.png", b"second")
+    wf = {
+        "1": {"class_type": "LoadImage", "inputs": {"image": first}},
+        "2": {"class_type": "LoadImage", "inputs": {"image": second}},
+        "3": {"class_type": "LoadImage", "inputs": {"image": first}},
+    }
+
+    comfyui.handle_inputs(wf, str(inputs))
+
+    assert wf["1"]["inputs"]["image"] == wf["3"]["inputs"]["image"] == str(inputs / "cat.png")
+    assert wf["2"]["inputs"]["image"] == str(inputs / "cat_1.png")
+    assert (inputs / "cat.png").read_bytes() == b"first"
+    assert (inputs / "cat_1.png").read_bytes() == b"second"
@@ -0,0 +1,99 @@
+import io
+import os
+import tarfile
+import zipfile
+
+from input_staging import (
+    extract_tar,
+    extract_zip,
+    referenced_paths,
+    select_members,
+    stage_file,
+)
+
+MEMBERS = ["frames/0001.png", "frames/0002.png", "masks/mask.png", "cat.png", "notes.txt"]
+
+
+def make_zip(path):
+    with zipfile.ZipFile(path, "w") as archive:
+        for name in MEMBERS:
+            archive.writestr(name, name)
+    return str(path)
+
+
+def make_tar(path):
+    with tarfile.open(path, "w:gz") as archive:
+        for name in MEMBERS:
+            info = tarfile.TarInfo(name)
+            info.size = len(name)
+            archive.addfile(info, io.BytesIO(name.encode()))
+    return str(path)
+
+
+def extracted(directory):
+    return sorted(
+        os.path.relpath(os.path.join(root, name), directory)
+        for root, _, files in os.walk(directory)
+        for name in files
+    )
+
+
+def test_referenced_paths_accepts_full_paths_and_backslashes(tmp_path):
+    wf = {
+        "1": {"class_type": "LoadImage", "inputs": {"image": f"{tmp_path}/cat.png"}},
+        "2": {"class_type": "LoadImagesFromDir", "inputs": {"directory": "frames\\"}},
+        "3": {"class_type": "CLIPTextEncode", "inputs": {"text": "line one\nline two"}},
+    }
+
+    assert referenced_paths(wf, str(tmp_path)) == {"cat.png", "frames"}
+
+
+def test_selects_referenced_files_and_directories():
+    selected = select_members(MEMBERS, {"frames", "mask.png"})
+
+    assert selected == ["frames/0001.png", "frames/0002.png", "masks/mask.png"]
+
+
+def test_selects_everything_when_nothing_matches():
+    assert select_members(MEMBERS, {"dog.png"}) == MEMBERS
+    assert select_members(MEMBERS, None) == MEMBERS
+
+
+def test_extracts_only_referenced_zip_members(tmp_path):
+    archive = make_zip(tmp_path / "inputs.zip")
+
+    names = extract_zip(archive, str(tmp_path / "out"), {"cat.png", "frames"})
+
+    assert sorted(names) == ["cat.png", "frames/0001.png", "frames/0002.png"]
+    assert extracted(tmp_path / "out") == sorted(names)
+    assert (tmp_path / "out" / "frames" / "0002.png").read_text() == "frames/0002.png"
+
+
+def test_extracts_only_referenced_tar_members(tmp_path):
+    archive = make_tar(tmp_path / "inputs.tar.gz")
+
+    names = extract_tar(archive, str(tmp_path / "out"), {"mask.png"})
+
+    assert names == ["masks/mask.png"]
+    assert extracted(tmp_path / "out") == ["masks/mask.png"]
+
+
+def test_extracts_whole_archives_without_references(tmp_path):
+    extract_zip(make_zip(tmp_path / "inputs.zip"), str(tmp_path / "zip"))
+    extract_tar(make_tar(tmp_path / "inputs.tar.gz"), str(tmp_path / "tar"))
+
+    assert extracted(tmp_path / "zip") == sorted(MEMBERS)
+    assert extracted(tmp_path / "tar") == sorted(MEMBERS)
+
+
+def test_stage_file_links_without_copying(tmp_path):
+    source = tmp_path / "source.png"
+    source.write_bytes(b"image")
+    destination = tmp_path / "inputs" / "input.png"
+    destination.parent.mkdir()
+    destination.write_bytes(b"old")
+
+    stage_file(str(source), str(destination))
+
+    assert destination.read_bytes() == b"image"
+    assert os.stat(destination).st_ino == os.stat(source).st_ino
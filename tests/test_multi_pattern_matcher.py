@@ -0,0 +1,59 @@
+import os
+import json
+import random
+
+import pytest
+
+from multi_pattern_matcher import MultiPatternMatcher
+
+
+def naive(patterns, text):
+    return {value for pattern, value in patterns.items() if pattern in text}
+
+
+@pytest.mark.parametrize("min_automaton_patterns", [0, 1000])
+def test_finds_overlapping_and_nested_patterns(min_automaton_patterns):
+    patterns = {"he": 1, "she": 2, "his": 3, "hers": 4, "s": 5}
+    matcher = MultiPatternMatcher(patterns, min_automaton_patterns)
+
+    assert sorted(matcher.find("ushers")) == [1, 2, 4, 5]
+    assert matcher.find("xyz") == []
+
+
+def test_each_value_is_returned_once():
+    matcher = MultiPatternMatcher({"ab": "ab"}, min_automaton_patterns=0)
+
+    assert matcher.find("ab ab ab") == ["ab"]
+
+
+def test_empty_pattern_matches_every_text():
+    matcher = MultiPatternMatcher({"": "always", "x": "x"}, min_automaton_patterns=0)
+
+    assert matcher.find("") == ["always"]
+    assert sorted(matcher.find("x")) == ["always", "x"]
+
+
+def test_automaton_matches_substring_containment():
+    rng = random.Random(0)
+    alphabet = "abc"
+    patterns = {
+        "".join(rng.choice(alphabet) for _ in range(rng.randint(1, 5))): i
+        for i in range(200)
+    }
+    matcher = MultiPatternMatcher(patterns, min_automaton_patterns=0)
+
+    for _ in range(200):
+        text = "".join(rng.choice(alphabet) for _ in range(rng.randint(0, 30)))
+        assert set(matcher.find(text)) == naive(patterns, text)
+
+
+def test_embeddings_in_the_weights_manifest():
+    path = os.path.join(os.path.dirname(__file__), "..", "weights.json")
+    with open(path) as f:
+        embeddings = json.load(f)["EMBEDDINGS"]
+    patterns = {emb.split(".")[0]: emb for emb in embeddings}
+    matcher = MultiPatternMatcher(patterns, min_automaton_patterns=0)
+    prompt = f"a photo, {embeddings[0].split('.')[0]}, {embeddings[-1].split('.')[0]}:1.2"
+
+    assert set(matcher.find(prompt)) == naive(patterns, prompt)
+    assert {embeddings[0], embeddings[-1]} <= set(matcher.find(prompt))
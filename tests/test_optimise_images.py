@@ -0,0 +1,56 @@
+import importlib
+import os
+
+import pytest
+from PIL import Image
+
+from cog import Path
+from cog_model_helpers import optimise_images
+
+
+@pytest.mark.parametrize("preset", list(optimise_images.ENCODER_PRESETS))
+def test_every_encoder_preset_can_be_used(tmp_path, preset):
+    image = Path(tmp_path / "out.png")
+    Image.effect_noise((64, 64), 64).convert("RGB").save(image)
+
+    (optimised,) = optimise_images.optimise_image_files(
+        "webp", 80, [image], encoder_preset=preset
+    )
+
+    assert optimised.suffix == ".webp"
+    with Image.open(optimised) as result:
+        assert result.size == (64, 64)
+
+
+def test_images_saved_in_the_output_format_are_left_alone(tmp_path):
+    image = Path(tmp_path / "out.webp")
+    Image.new("RGB", (8, 8)).save(image)
+    png = Path(tmp_path / "other.png")
+    Image.new("RGB", (8, 8)).save(png)
+
+    optimised = optimise_images.optimise_image_files(
+        "webp", 80, [image, png], encoded_files={image}
+    )
+
+    assert optimised == [image, Path(tmp_path / "other.webp")]
+
+
+def test_direct_save_nodes_use_the_encoder_preset(comfyui):
+    wf = {"1": {"class_type": "SaveImage", "inputs": {"filename_prefix": "out"}}}
+    comfyui.output_node_types = {"SaveImage", "CogSaveImage"}
+
+    comfyui.save_images_as(wf, "webp", 80, "small")
+
+    assert wf["1"]["class_type"] == "CogSaveImage"
+    assert wf["1"]["inputs"]["save_options"] == '{"method": 6}'
+
+
+def test_encoder_workers_fall_back_to_cpu_count_without_affinity(monkeypatch):
+    # sched_getaffinity only exists on Linux
+    monkeypatch.delattr(os, "sched_getaffinity")
+    monkeypatch.setattr(os, "cpu_count", lambda: 3)
+    try:
+        assert importlib.reload(optimise_images).ENCODER_WORKERS == 3
+    finally:
+        monkeypatch.undo()
+        importlib.reload(optimise_images)
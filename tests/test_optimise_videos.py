@@ -0,0 +1,50 @@
+import os
+import shutil
+import subprocess
+
+import pytest
+from PIL import Image
+
+from cog import Path
+from cog_model_helpers import optimise_videos
+
+
+def transcoded(tmp_path, source):
+    partial = Path(tmp_path / f"{source}.optimising.mp4")
+    partial.write_bytes(source.encode())
+    return partial
+
+
+def test_transcoded_videos_never_replace_another_output(tmp_path):
+    (tmp_path / "out.mp4").write_bytes(b"existing")
+
+    first = optimise_videos._claim_output_path(
+        transcoded(tmp_path, "out.gif"), Path(tmp_path / "out.gif"), ".mp4"
+    )
+    second = optimise_videos._claim_output_path(
+        transcoded(tmp_path, "out.mov"), Path(tmp_path / "out.mov"), ".mp4"
+    )
+
+    assert (first.name, second.name) == ("out_1.mp4", "out_2.mp4")
+    assert (tmp_path / "out.mp4").read_bytes() == b"existing"
+    assert first.read_bytes() == b"out.gif"
+    assert sorted(os.listdir(tmp_path)) == ["out.mp4", "out_1.mp4", "out_2.mp4"]
+
+
+def test_original_profile_returns_videos_unchanged(tmp_path):
+    video = Path(tmp_path / "out.mp4")
+    video.write_bytes(b"video")
+
+    assert optimise_videos.optimise_video_files("original", [video]) == [video]
+
+
+@pytest.mark.skipif(shutil.which("ffmpeg") is None, reason="ffmpeg is not installed")
+def test_transcodes_gifs_to_mp4(tmp_path):
+    frames = [Image.new("RGB", (33, 33), color) for color in ["red", "blue"]]
+    frames[0].save(tmp_path / "out.gif", save_all=True, append_images=frames[1:])
+
+    (optimised,) = optimise_videos.optimise_video_files("h264", [Path(tmp_path / "out.gif")])
+
+    assert optimised.name == "out.mp4"
+    probe = subprocess.run(["ffmpeg", "-i", str(optimised)], capture_output=True, text=True)
+    assert "h264" in probe.stderr
@@ -0,0 +1,113 @@
+import os
+
+import pytest
+
+pytest.importorskip("websocket")
+from server_pool import ComfyUIServer  # noqa: E402
+
+
+@pytest.fixture
+def server(tmp_path):
+    return ComfyUIServer(
+        8188,
+        str(tmp_path / "output"),
+        str(tmp_path / "input"),
+        temp_directory=str(tmp_path / "comfyui"),
+    )
+
+
+def write(directory, *parts):
+    path = os.path.join(directory, *parts)
+    os.makedirs(os.path.dirname(path), exist_ok=True)
+    with open(path, "wb") as f:
+        f.write(b"x")
+    return path
+
+
+def image(filename, subfolder="", type="output"):
+    return {"filename": filename, "subfolder": subfolder, "type": type}
+
+
+def test_outputs_come_from_each_nodes_history_record(comfyui, server):
+    workflow = {
+        "9": {"class_type": "SaveImage", "inputs": {"filename_prefix": "ComfyUI"}},
+        "12": {"class_type": "VHS_VideoCombine", "inputs": {"filename_prefix": "video"}},
+        "15": {"class_type": "PreviewImage", "inputs": {}},
+    }
+    saved = write(server.output_directory, "ComfyUI_00001_.png")
+    video = write(server.output_directory, "video_00001.mp4")
+    preview = write(server.temp_directory, "preview_00001_.png")
+    # Written by something else, and not in the history
+    write(server.output_directory, "ComfyUI_00002_.png")
+    outputs = {
+        "9": {"images": [image("ComfyUI_00001_.png")]},
+        "12": {"gifs": [image("video_00001.mp4")], "text": ["not a file"]},
+        "15": {"images": [image("preview_00001_.png", type="temp")]},
+    }
+
+    manifest = comfyui.get_output_manifest(workflow, outputs, server, ("output", "temp"))
+
+    assert [(e["node_id"], e["class_type"], e["kind"], e["type"], str(e["path"])) for e in manifest] == [
+        ("9", "SaveImage", "images", "output", saved),
+        ("12", "VHS_VideoCombine", "gifs", "output", video),
+        ("15", "PreviewImage", "images", "temp", preview),
+    ]
+
+
+def test_temp_files_are_left_out_unless_asked_for(comfyui, server):
+    write(server.temp_directory, "preview.png")
+    outputs = {"15": {"images": [image("preview.png", type="temp")]}}
+
+    assert comfyui.get_output_manifest({}, outputs, server) == []
+
+
+def test_reported_files_that_are_missing_are_skipped(comfyui, server):
+    outputs = {"9": {"images": [image("gone.png")]}}
+
+    assert comfyui.node_output_files("9", outputs["9"], server) == []
+
+
+def test_concurrent_predictions_only_see_their_own_files(comfyui, server):
+    def prediction_workflow():
+        return {"9": {"class_type": "SaveImage", "inputs": {"filename_prefix": "ComfyUI"}}}
+
+    first, second = prediction_workflow(), prediction_workflow()
+    comfyui.isolate_outputs(first, "first")
+    comfyui.isolate_outputs(second, "second")
+    assert first["9"]["inputs"]["filename_prefix"] == "first/ComfyUI"
+
+    first_file = write(server.output_directory, "first", "ComfyUI_00001_.png")
+    write(server.output_directory, "second", "ComfyUI_00001_.png")
+    first_outputs = {"9": {"images": [image("ComfyUI_00001_.png", "first")]}}
+
+    # From the history, and from the scan for a node that reported nothing
+    for outputs in [first_outputs, {}]:
+        manifest = comfyui.get_output_manifest(first, outputs, server)
+        assert [str(entry["path"]) for entry in manifest] == [first_file]
+
+
+def test_save_nodes_that_report_nothing_are_found_by_their_prefix(comfyui, server):
+    workflow = {
+        "9": {"class_type": "SaveImage", "inputs": {"filename_prefix": "ComfyUI"}},
+        "20": {"class_type": "SaveAnimatedWEBP", "inputs": {"filename_prefix": "clips/anim"}},
+    }
+    reported = write(server.output_directory, "ComfyUI_00001_.png")
+    first = write(server.output_directory, "clips", "anim_00001_.webp")
+    second = write(server.output_directory, "clips", "anim_00002_.webp")
+    write(server.output_directory, "clips", "other_00001_.webp")
+    write(server.output_directory, "anim_00001_.webp")
+    outputs = {"9": {"images": [image("ComfyUI_00001_.png")]}}
+
+    manifest = comfyui.get_output_manifest(workflow, outputs, server)
+
+    assert [(e["node_id"], e["kind"], str(e["path"])) for e in manifest] == [
+        ("9", "images", reported),
+        ("20", "files", first),
+        ("20", "files", second),
+    ]
+
+
+def test_scanning_a_missing_folder_finds_nothing(comfyui, server):
+    node = {"class_type": "SaveImage", "inputs": {"filename_prefix": "nowhere/ComfyUI"}}
+
+    assert comfyui.scan_node_output_files("9", node, "nowhere/ComfyUI", server.output_directory) == []
@@ -0,0 +1,109 @@
+import copy
+import json
+import os
+
+import pytest
+
+from preflight_cache import DELETED, PreflightCache, WorkflowPreflight
+
+FILETYPES = [".safetensors", ".ckpt", ".pth"]
+EXAMPLES = os.path.join(os.path.dirname(__file__), "..", "examples", "api_workflows")
+
+
+def workflow(prompt="a cat", checkpoint="sd_xl_base_1.0.safetensors"):
+    return {
+        "1": {"class_type": "CheckpointLoaderSimple", "inputs": {"ckpt_name": checkpoint}},
+        "2": {"class_type": "CLIPTextEncode", "inputs": {"text": prompt, "clip": ["1", 1]}},
+        "3": {"class_type": "KSampler", "inputs": {"seed": 1, "model": ["1", 0]}},
+    }
+
+
+def test_fingerprint_ignores_free_text_and_seeds():
+    cat, _ = PreflightCache.classify(workflow("a cat"), FILETYPES, "manifest")
+    dog, free_text = PreflightCache.classify(workflow("a dog"), FILETYPES, "manifest")
+    other = workflow("a dog")
+    other["3"]["inputs"]["seed"] = 2
+
+    assert cat == dog == PreflightCache.classify(other, FILETYPES, "manifest")[0]
+    assert free_text == [("2", "text")]
+
+
+def test_fingerprint_covers_models_and_the_manifest():
+    base, _ = PreflightCache.classify(workflow(), FILETYPES, "manifest")
+    other_model, _ = PreflightCache.classify(
+        workflow(checkpoint="dreamshaper_8.safetensors"), FILETYPES, "manifest"
+    )
+    other_manifest, _ = PreflightCache.classify(workflow(), FILETYPES, "updated")
+
+    assert len({base, other_model, other_manifest}) == 3
+
+
+def test_rewrites_replay_onto_a_fresh_copy():
+    original = workflow()
+    snapshot = PreflightCache.snapshot(original)
+    resolved = copy.deepcopy(original)
+    resolved["1"]["inputs"]["ckpt_name"] = "renamed.safetensors"
+    resolved["2"]["class_type"] = "CLIPTextEncodeSDXL"
+    del resolved["3"]["inputs"]["seed"]
+    rewrites = PreflightCache.rewrites(snapshot, resolved)
+
+    replayed = copy.deepcopy(original)
+    WorkflowPreflight(["renamed.safetensors"], rewrites).apply(replayed)
+
+    assert replayed == resolved
+    assert ("3", None, {"seed": DELETED}) in rewrites
+
+
+def test_rewrites_can_set_an_input_to_none():
+    original = workflow()
+    snapshot = PreflightCache.snapshot(original)
+    resolved = copy.deepcopy(original)
+    resolved["3"]["inputs"]["seed"] = None
+    rewrites = PreflightCache.rewrites(snapshot, resolved)
+
+    replayed = copy.deepcopy(original)
+    WorkflowPreflight([], rewrites).apply(replayed)
+
+    assert replayed["3"]["inputs"] == {"seed": None, "model": ["1", 0]}
+
+
+def test_least_recently_used_entries_are_dropped():
+    cache = PreflightCache(max_entries=2)
+    cache.put("a", WorkflowPreflight([], []))
+    cache.put("b", WorkflowPreflight([], []))
+    cache.get("a")
+    cache.put("c", WorkflowPreflight([], []))
+
+    assert cache.get("b") is None
+    assert cache.get("a") is not None
+    assert cache.get("c") is not None
+
+
+def example_workflows():
+    for name in sorted(os.listdir(EXAMPLES)):
+        with open(os.path.join(EXAMPLES, name)) as f:
+            wf = json.load(f)
+        # Skip UI format workflows
+        if "nodes" not in wf and "last_node_id" not in wf:
+            yield name, wf
+
+
+@pytest.mark.parametrize("name", [name for name, _ in example_workflows()][:12])
+def test_replayed_preflight_matches_a_full_resolution(comfyui, name):
+    wf = dict(example_workflows())[name]
+    downloads = []
+    comfyui.weights_downloader.download_weights_list = (
+        lambda weights, extra_downloads=(), prediction=None: downloads.append(
+            (sorted(weights), sorted(extra_downloads))
+        )
+    )
+
+    resolved = copy.deepcopy(wf)
+    comfyui.handle_weights(resolved)
+    assert comfyui.preflight_cache.entries
+
+    replayed = copy.deepcopy(wf)
+    comfyui.handle_weights(replayed)
+
+    assert replayed == resolved
+    assert downloads[0] == downloads[1]
@@ -0,0 +1,192 @@
+import os
+import json
+import threading
+
+import pytest
+
+from result_cache import ResultCache
+
+WORKFLOW = {"1": {"class_type": "LoadImage", "inputs": {"image": "cat.png"}}}
+OPTIONS = [False, "webp", 95, "original"]
+
+
+@pytest.fixture
+def inputs(tmp_path):
+    directory = tmp_path / "inputs"
+    directory.mkdir()
+    (directory / "cat.png").write_bytes(b"cat")
+    return directory
+
+
+def output(tmp_path, name, data):
+    path = tmp_path / "outputs" / name
+    path.parent.mkdir(parents=True, exist_ok=True)
+    path.write_bytes(data)
+    return str(path)
+
+
+WEIGHTS = [["model.safetensors", ["https://example.com/model.safetensors.tar"]]]
+
+
+def test_key_depends_on_everything_that_changes_the_outputs(inputs):
+    key = ResultCache.key(WORKFLOW, str(inputs), WEIGHTS, [], OPTIONS)
+
+    other_workflow = {"1": {"class_type": "LoadImage", "inputs": {"image": "dog.png"}}}
+    other_weights = [["model.safetensors", ["https://example.com/v2/model.safetensors.tar"]]]
+    input_urls = [["https://example.com/cat.png", ['"v1"', None]]]
+    assert ResultCache.key(other_workflow, str(inputs), WEIGHTS, [], OPTIONS) != key
+    assert ResultCache.key(WORKFLOW, str(inputs), other_weights, [], OPTIONS) != key
+    assert ResultCache.key(WORKFLOW, str(inputs), WEIGHTS, input_urls, OPTIONS) != key
+    assert ResultCache.key(WORKFLOW, str(inputs), WEIGHTS, [], OPTIONS[:-1] + ["h264"]) != key
+
+    (inputs / "cat.png").write_bytes(b"another cat")
+    assert ResultCache.key(WORKFLOW, str(inputs), WEIGHTS, [], OPTIONS) != key
+
+
+def test_key_ignores_the_per_prediction_input_directory(tmp_path):
+    keys = []
+    for prediction_id in ["first", "second"]:
+        directory = tmp_path / prediction_id
+        directory.mkdir()
+        (directory / "cat.png").write_bytes(b"cat")
+        keys.append(ResultCache.key(WORKFLOW, str(directory), WEIGHTS, [], OPTIONS))
+
+    assert keys[0] == keys[1]
+
+
+def checkpoint_workflow(image):
+    return {
+        "1": {"class_type": "CheckpointLoaderSimple", "inputs": {"ckpt_name": "sd_xl_base_1.0.safetensors"}},
+        "2": {"class_type": "LoadImage", "inputs": {"image": image}},
+    }
+
+
+def test_resolving_weights_downloads_nothing_and_leaves_the_workflow(comfyui, monkeypatch):
+    def download(*args, **kwargs):
+        raise AssertionError("nothing should be downloaded")
+
+    monkeypatch.setattr(comfyui.weights_downloader, "download_weights_list", download)
+    workflow = checkpoint_workflow("https://example.com/cat.png")
+    submitted = json.dumps(workflow, sort_keys=True)
+
+    weights = comfyui.resolved_weights(workflow)
+
+    assert weights == [
+        [
+            "sd_xl_base_1.0.safetensors",
+            ["https://weights.replicate.delivery/default/comfy-ui/checkpoints/sd_xl_base_1.0.safetensors.tar"],
+        ]
+    ]
+    assert json.dumps(workflow, sort_keys=True) == submitted
+    assert comfyui.input_urls(workflow) == ["https://example.com/cat.png"]
+
+
+def test_input_url_versions_come_from_etag_and_last_modified(comfyui, file_server):
+    tagged = file_server.add("/tagged.png", b"cat", etag='"v1"')
+    untagged = file_server.add("/untagged.png", b"cat")
+
+    assert comfyui.input_cache.version(tagged) == ['"v1"', None]
+    assert comfyui.input_cache.version(untagged) is None
+    assert comfyui.input_cache.version(file_server.url("/missing.png")) is None
+    assert file_server.requests_for("/tagged.png", "GET") == []
+
+
+@pytest.fixture
+def predictor(comfyui, tmp_path, monkeypatch):
+    pytest.importorskip("cog")
+    import predict
+
+    output_dir = str(tmp_path / "outputs")
+    input_dir = str(tmp_path / "inputs")
+    monkeypatch.setattr(predict, "OUTPUT_DIR", output_dir)
+    monkeypatch.setattr(predict, "INPUT_DIR", input_dir)
+    monkeypatch.setattr(predict, "ALL_DIRECTORIES", [output_dir, input_dir])
+    comfyui.server_pool.primary.output_directory = output_dir
+    predictor = predict.Predictor()
+    predictor.comfyUI = comfyui
+    predictor.finished_files = []
+    predictor.finished_files_lock = threading.Lock()
+    predictor.result_cache = ResultCache(str(tmp_path / "cache"))
+    return predictor
+
+
+def test_a_cached_result_is_found_before_the_workflow_is_loaded(predictor, file_server, tmp_path, monkeypatch):
+    workflow = checkpoint_workflow(file_server.add("/cat.png", b"cat", etag='"v1"'))
+    options = [False, "webp", 95, "original"]
+    os.makedirs(tmp_path / "empty")
+    key = predictor.result_key(workflow, str(tmp_path / "empty"), options)
+    predictor.result_cache.put(key, [output(tmp_path, "a.webp", b"a")])
+
+    def load_workflow(*args, **kwargs):
+        raise AssertionError("a cache hit should not download weights or inputs")
+
+    monkeypatch.setattr(predictor.comfyUI, "load_workflow", load_workflow)
+    # Runs in its own input directory, without a server to clear
+    monkeypatch.setattr("predict.CONCURRENT_PREDICTIONS", True)
+    outputs = list(
+        predictor.run_prediction(json.dumps(workflow), None, *options, False, False)
+    )
+
+    assert [path.name for path in outputs] == ["a.webp"]
+    assert file_server.requests_for("/cat.png", "GET") == []
+
+
+def test_input_urls_without_a_validator_are_not_cached(predictor, file_server):
+    workflow = checkpoint_workflow(file_server.add("/cat.png", b"cat"))
+
+    assert predictor.result_key(workflow, "inputs", []) is None
+
+
+def test_returns_cached_files_in_order(tmp_path):
+    cache = ResultCache(str(tmp_path / "cache"))
+    files = [output(tmp_path, "b.webp", b"b"), output(tmp_path, "a.webp", b"a")]
+    cache.put("key", files)
+
+    cached = cache.get("key", str(tmp_path / "prediction"))
+
+    assert [os.path.basename(f) for f in cached] == ["b.webp", "a.webp"]
+    assert [open(f, "rb").read() for f in cached] == [b"b", b"a"]
+    assert cache.get("missing", str(tmp_path / "prediction")) is None
+
+
+def test_entries_survive_a_restart(tmp_path):
+    ResultCache(str(tmp_path / "cache")).put("key", [output(tmp_path, "a.webp", b"a")])
+
+    cached = ResultCache(str(tmp_path / "cache")).get("key", str(tmp_path / "prediction"))
+
+    assert open(cached[0], "rb").read() == b"a"
+
+
+def test_evicts_the_least_recently_used_entries(tmp_path):
+    cache = ResultCache(str(tmp_path / "cache"), max_bytes=20)
+    cache.put("first", [output(tmp_path, "first.webp", b"x" * 10)])
+    cache.put("second", [output(tmp_path, "second.webp", b"x" * 10)])
+    cache.get("first", str(tmp_path / "prediction"))
+    cache.put("third", [output(tmp_path, "third.webp", b"x" * 10)])
+
+    assert cache.get("second", str(tmp_path / "prediction")) is None
+    assert cache.get("first", str(tmp_path / "prediction")) is not None
+    assert not os.path.exists(cache.entry_directory("second"))
+
+
+def test_identical_predictions_wait_for_the_first(tmp_path):
+    cache = ResultCache(str(tmp_path / "cache"))
+    assert cache.claim("key") is None
+
+    waiting = cache.claim("key")
+    assert waiting is not None and not waiting.is_set()
+
+    results = []
+
+    def wait_and_read():
+        waiting.wait(timeout=5)
+        results.append(cache.get("key", str(tmp_path / "waiter")))
+
+    waiter = threading.Thread(target=wait_and_read)
+    waiter.start()
+    cache.put("key", [output(tmp_path, "a.webp", b"a")])
+    cache.release("key")
+    waiter.join(timeout=5)
+
+    assert open(results[0][0], "rb").read() == b"a"
+    assert cache.claim("key") is None
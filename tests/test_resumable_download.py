@@ -0,0 +1,203 @@
+import io
+import os
+import json
+import tarfile
+import threading
+
+import pytest
+
+import resumable_download
+from resumable_download import (
+    ResumableDownload,
+    atomic_move,
+    download_url,
+    is_complete,
+    marker_path,
+    write_complete_marker,
+)
+
+DATA = bytes(range(256)) * 40
+
+
+@pytest.fixture(autouse=True)
+def small_segments(tmp_path, monkeypatch):
+    monkeypatch.chdir(tmp_path)
+    monkeypatch.setattr(resumable_download, "MIN_SEGMENT_SIZE", 1000)
+    monkeypatch.setattr(resumable_download, "CHUNK_SIZE", 256)
+    monkeypatch.setattr(resumable_download, "STREAM_PART_SIZE", 1024)
+    monkeypatch.setattr(resumable_download, "RETRY_BACKOFF", 0)
+
+
+def make_tar(members):
+    archive = io.BytesIO()
+    with tarfile.open(fileobj=archive, mode="w") as tar:
+        for name, data in members.items():
+            info = tarfile.TarInfo(name)
+            info.size = len(data)
+            tar.addfile(info, io.BytesIO(data))
+    return archive.getvalue()
+
+
+def range_starts(file_server, path):
+    return sorted(
+        int(r["headers"]["Range"].split("=")[1].split("-")[0])
+        for r in file_server.requests_for(path)
+    )
+
+
+def test_downloads_in_parallel_segments(file_server, tmp_path):
+    url = file_server.add("/weight.bin", DATA, etag='"v1"')
+
+    paths = ResumableDownload(url, str(tmp_path / "models"), connections=4, extract=False).run()
+
+    assert paths == [str(tmp_path / "models" / "weight.bin")]
+    assert open(paths[0], "rb").read() == DATA
+    assert range_starts(file_server, "/weight.bin") == [0, 2560, 5120, 7680]
+    assert is_complete(paths[0])
+
+
+def test_retries_a_dropped_segment_from_its_offset(file_server, tmp_path):
+    url = file_server.add("/weight.bin", DATA, etag='"v1"')
+    file_server.drop("/weight.bin", after_bytes=512)
+
+    paths = ResumableDownload(url, str(tmp_path), connections=1, extract=False).run()
+
+    assert open(paths[0], "rb").read() == DATA
+    assert range_starts(file_server, "/weight.bin") == [0, 512]
+
+
+def test_resumes_an_interrupted_download(file_server, tmp_path, monkeypatch):
+    url = file_server.add("/weight.bin", DATA, etag='"v1"')
+    file_server.drop("/weight.bin", after_bytes=512)
+    monkeypatch.setattr(resumable_download, "SEGMENT_RETRIES", 0)
+
+    with pytest.raises(Exception):
+        ResumableDownload(url, str(tmp_path), connections=1, extract=False).run()
+    assert not os.path.exists(tmp_path / "weight.bin")
+
+    paths = ResumableDownload(url, str(tmp_path), connections=1, extract=False).run()
+
+    assert open(paths[0], "rb").read() == DATA
+    assert range_starts(file_server, "/weight.bin") == [0, 512]
+
+
+def test_restarts_when_the_remote_file_changed(file_server, tmp_path, monkeypatch):
+    url = file_server.add("/weight.bin", DATA, etag='"v1"')
+    file_server.drop("/weight.bin", after_bytes=512)
+    monkeypatch.setattr(resumable_download, "SEGMENT_RETRIES", 0)
+    with pytest.raises(Exception):
+        ResumableDownload(url, str(tmp_path), connections=1, extract=False).run()
+
+    new_data = DATA[::-1]
+    file_server.add("/weight.bin", new_data, etag='"v2"')
+    paths = ResumableDownload(url, str(tmp_path), connections=1, extract=False).run()
+
+    assert open(paths[0], "rb").read() == new_data
+    # The partial copy of the old file is discarded, not resumed
+    assert range_starts(file_server, "/weight.bin") == [0, 0]
+
+
+def test_probe_falls_back_to_a_ranged_get_when_head_is_rejected(file_server):
+    url = file_server.add("/presigned.bin", DATA, etag='"v1"')
+    file_server.head_status["/presigned.bin"] = 403
+
+    remote = ResumableDownload(url, "unused").probe()
+
+    assert remote["size"] == len(DATA)
+    assert remote["ranges"] is True
+    assert remote["etag"] == '"v1"'
+    assert file_server.requests_for("/presigned.bin")[0]["headers"]["Range"] == "bytes=0-0"
+
+
+def test_extracts_tars_into_place(file_server, tmp_path):
+    url = file_server.add("/model.safetensors.tar", make_tar({"model.safetensors": DATA}))
+
+    paths = ResumableDownload(url, str(tmp_path / "models")).run()
+
+    assert paths == [str(tmp_path / "models" / "model.safetensors")]
+    assert open(paths[0], "rb").read() == DATA
+    assert is_complete(paths[0])
+
+
+def test_extracts_tars_as_parts_arrive_without_staging_them(file_server, tmp_path):
+    archive = make_tar({"model/unet.bin": DATA, "model/vae.bin": DATA[::-1]})
+    url = file_server.add("/model.tar", archive, etag='"v1"')
+    download = ResumableDownload(url, str(tmp_path / "models"), connections=4)
+
+    paths = download.run()
+
+    assert paths == [str(tmp_path / "models" / "model")]
+    assert (tmp_path / "models" / "model" / "unet.bin").read_bytes() == DATA
+    assert (tmp_path / "models" / "model" / "vae.bin").read_bytes() == DATA[::-1]
+    # Tar extraction stops at the end-of-archive marker
+    assert len(range_starts(file_server, "/model.tar")) <= len(archive) // 1024
+    assert not os.path.exists(download.file_path)
+
+
+def test_resumes_a_tar_from_the_byte_it_reached(file_server, tmp_path):
+    url = file_server.add("/model.tar", make_tar({"model.safetensors": DATA}), etag='"v1"')
+    abort = threading.Event()
+
+    def stop_part_way(done, total, rate):
+        if done >= 4096:
+            abort.set()
+
+    with pytest.raises(resumable_download.DownloadAborted):
+        ResumableDownload(
+            url, str(tmp_path), connections=1, on_progress=stop_part_way, abort=abort
+        ).run()
+    requested = len(file_server.requests_for("/model.tar"))
+
+    paths = ResumableDownload(url, str(tmp_path), connections=1).run()
+
+    assert open(paths[0], "rb").read() == DATA
+    resumed_from = range_starts(file_server, "/model.tar")[requested:][0]
+    assert 512 < resumed_from < 4096
+
+
+def test_download_url_saves_to_the_given_path(file_server, tmp_path):
+    url = file_server.add("/download?id=1", DATA, etag='"v1"')
+    (tmp_path / "checkpoint.safetensors").write_bytes(b"old")
+
+    path = download_url(url, str(tmp_path / "checkpoint.safetensors"))
+
+    assert path == str(tmp_path / "checkpoint.safetensors")
+    assert open(path, "rb").read() == DATA
+
+
+def test_complete_markers(tmp_path):
+    path = tmp_path / "weight.bin"
+    assert not is_complete(str(path))
+
+    path.write_bytes(b"weights")
+    # Files without a marker were put there some other way and are trusted
+    assert is_complete(str(path))
+
+    write_complete_marker(str(path))
+    assert json.load(open(marker_path(str(path))))["size"] == 7
+    assert is_complete(str(path))
+
+    path.write_bytes(b"truncated")
+    assert not is_complete(str(path))
+
+
+def test_atomic_move_merges_into_a_shared_directory(tmp_path):
+    (tmp_path / "src" / "inner").mkdir(parents=True)
+    (tmp_path / "src" / "inner" / "new.bin").write_bytes(b"new")
+    (tmp_path / "dst" / "inner").mkdir(parents=True)
+    (tmp_path / "dst" / "inner" / "other.bin").write_bytes(b"other")
+
+    atomic_move(str(tmp_path / "src"), str(tmp_path / "dst"))
+
+    assert sorted(os.listdir(tmp_path / "dst" / "inner")) == ["new.bin", "other.bin"]
+    assert not os.path.exists(tmp_path / "src")
+
+
+def test_atomic_move_never_replaces_a_non_empty_directory(tmp_path):
+    (tmp_path / "src").write_bytes(b"file")
+    (tmp_path / "dst").mkdir()
+    (tmp_path / "dst" / "keep.bin").write_bytes(b"keep")
+
+    with pytest.raises(IsADirectoryError):
+        atomic_move(str(tmp_path / "src"), str(tmp_path / "dst"))
+    assert (tmp_path / "dst" / "keep.bin").read_bytes() == b"keep"
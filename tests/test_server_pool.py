@@ -0,0 +1,133 @@
+import pytest
+
+pytest.importorskip("websocket")
+from server_pool import ComfyUIServer, ServerPool  # noqa: E402
+
+FILETYPES = [".safetensors", ".ckpt"]
+
+
+def pool(devices, cpus=None):
+    return ServerPool.from_devices(
+        devices, "127.0.0.1:8188", "outputs", "inputs", FILETYPES, cpus
+    )
+
+
+def checkpoint_workflow(checkpoint):
+    return {
+        "1": {"class_type": "CheckpointLoaderSimple", "inputs": {"ckpt_name": checkpoint}},
+        "2": {"class_type": "SaveImage", "inputs": {"images": ["1", 0]}},
+    }
+
+
+def rembg_workflow():
+    return {
+        "1": {"class_type": "LoadImage", "inputs": {"image": "in.png"}},
+        "2": {"class_type": "Image Rembg (Remove Background)", "inputs": {"images": ["1", 0]}},
+        "3": {"class_type": "SaveImage", "inputs": {"images": ["2", 0]}},
+    }
+
+
+def test_each_further_server_gets_the_next_port_and_its_own_outputs():
+    servers = pool([0, 1, "cpu"]).servers
+
+    assert [s.port for s in servers] == [8188, 8189, 8190]
+    assert [s.output_directory for s in servers] == ["outputs", "outputs_8189", "outputs_8190"]
+    assert {s.input_directory for s in servers} == {"inputs"}
+    assert servers[0].temp_directory == "ComfyUI/temp"
+    assert servers[1].temp_directory == "ComfyUI/servers/8189/temp"
+
+
+def test_command_passes_port_and_device():
+    gpu, cpu, default = pool([1, "cpu", None]).servers
+
+    assert "--port 8188" in gpu.command()
+    assert "--cuda-device 1" in gpu.command()
+    assert "--cpu" not in gpu.command()
+    assert "--port 8189" in cpu.command()
+    assert "--cpu" in cpu.command()
+    assert "--cuda-device" not in cpu.command()
+    assert "--temp-directory ComfyUI/servers/8189" in cpu.command()
+    assert "--cpu" not in default.command()
+    assert "--cuda-device" not in default.command()
+
+
+def test_command_pins_servers_to_their_cpus():
+    gpu, cpu = pool([0, "cpu"], cpus=[None, [3, 2]]).servers
+
+    assert gpu.command().startswith("python ")
+    assert cpu.command().startswith("taskset -c 2,3 python ")
+
+
+def test_only_workflows_of_cpu_nodes_run_on_cpu():
+    assert ServerPool.runs_on_cpu(rembg_workflow())
+    assert not ServerPool.runs_on_cpu(checkpoint_workflow("a.safetensors"))
+
+
+def test_cpu_servers_only_get_cpu_workflows():
+    server_pool = pool([0, "cpu"])
+    gpu, cpu = server_pool.servers
+
+    assert server_pool.eligible_servers(rembg_workflow()) == [gpu, cpu]
+    assert server_pool.eligible_servers(checkpoint_workflow("a.safetensors")) == [gpu]
+
+    # Busy GPU server, the GPU workflow still waits for it
+    gpu.in_flight = 5
+    assert server_pool.acquire(checkpoint_workflow("a.safetensors")) is gpu
+    assert server_pool.acquire(rembg_workflow()) is cpu
+
+
+def test_a_pool_of_only_cpu_servers_runs_everything():
+    server_pool = pool(["cpu"])
+
+    assert server_pool.eligible_servers(checkpoint_workflow("a.safetensors")) == server_pool.servers
+
+
+def test_acquire_prefers_the_least_loaded_server():
+    server_pool = pool([0, 1])
+    first = server_pool.acquire(checkpoint_workflow("a.safetensors"))
+    second = server_pool.acquire(checkpoint_workflow("b.safetensors"))
+
+    assert first is not second
+    assert first.in_flight == second.in_flight == 1
+
+    server_pool.release(first)
+    assert first.in_flight == 0
+    assert server_pool.acquire(checkpoint_workflow("c.safetensors")) is first
+
+
+def test_acquire_prefers_a_server_with_the_models_loaded_when_load_is_equal():
+    server_pool = pool([0, 1])
+    _, other = server_pool.servers
+    other.remember_models({"a.safetensors"})
+
+    assert server_pool.acquire(checkpoint_workflow("a.safetensors")) is other
+
+
+def test_loaded_models_do_not_outweigh_a_prompt_in_flight():
+    server_pool = pool([0, 1])
+    idle, busy = server_pool.servers
+    busy.remember_models({"a.safetensors"})
+    busy.in_flight = 2
+
+    assert server_pool.acquire(checkpoint_workflow("a.safetensors")) is idle
+
+
+def test_partial_overlap_breaks_ties_in_favour_of_more_loaded_models():
+    server_pool = pool([0, 1])
+    some, most = server_pool.servers
+    some.remember_models({"a.safetensors"})
+    most.remember_models({"a.safetensors", "b.safetensors"})
+    workflow = checkpoint_workflow("a.safetensors")
+    workflow["3"] = {"class_type": "CheckpointLoaderSimple", "inputs": {"ckpt_name": "b.safetensors"}}
+
+    assert server_pool.acquire(workflow) is most
+
+
+def test_loaded_models_are_forgotten_oldest_first(monkeypatch):
+    monkeypatch.setattr("server_pool.LOADED_MODELS_MEMORY", 2)
+    server = ComfyUIServer(8188, "outputs", "inputs")
+    server.remember_models(["a", "b"])
+    server.remember_models(["a"])
+    server.remember_models(["c"])
+
+    assert list(server.loaded_models) == ["a", "c"]
@@ -0,0 +1,156 @@
+import asyncio
+import json
+import os
+import queue
+import threading
+import time
+
+import pytest
+from PIL import Image
+
+pytest.importorskip("cog")
+import predict  # noqa: E402
+from cog_model_helpers import optimise_videos  # noqa: E402
+
+
+class FakeClient:
+    """
+    Stands in for a ComfyUI server. Each save node in the prompt writes a
+    PNG when the test calls run_node, and finish completes the prompt.
+    """
+
+    def __init__(self, output_directory, auto_finish=False):
+        self.output_directory = output_directory
+        self.auto_finish = auto_finish
+        self.messages = queue.Queue()
+        self.outputs = {}
+        self.workflow = None
+        self.history_requested = False
+
+    def queue_prompt(self, workflow):
+        self.workflow = workflow
+        if self.auto_finish:
+            for node_id in workflow:
+                self.run_node(node_id)
+            self.finish()
+        return "prompt"
+
+    def run_node(self, node_id):
+        subfolder, prefix = os.path.split(self.workflow[node_id]["inputs"]["filename_prefix"])
+        os.makedirs(os.path.join(self.output_directory, subfolder), exist_ok=True)
+        filename = f"{prefix}_00001_.png"
+        Image.new("RGB", (8, 8)).save(os.path.join(self.output_directory, subfolder, filename))
+        output = {"images": [{"filename": filename, "subfolder": subfolder, "type": "output"}]}
+        self.outputs[node_id] = output
+        self.messages.put(
+            {"type": "executed", "data": {"prompt_id": "prompt", "node": node_id, "output": output}}
+        )
+
+    def finish(self):
+        self.messages.put({"type": "executing", "data": {"prompt_id": "prompt", "node": None}})
+
+    def subscribe(self, prompt_id):
+        return self.messages
+
+    def unsubscribe(self, prompt_id):
+        pass
+
+    def get_history(self, prompt_id):
+        self.history_requested = True
+        return {"outputs": self.outputs, "status": {"completed": True}}
+
+    def connect(self):
+        pass
+
+    def start_reader(self):
+        pass
+
+    def clear_queue(self):
+        pass
+
+
+def workflow():
+    return {
+        "1": {"class_type": "SaveImage", "inputs": {"filename_prefix": "first", "images": ["3", 0]}},
+        "2": {"class_type": "SaveImage", "inputs": {"filename_prefix": "second", "images": ["3", 0]}},
+    }
+
+
+@pytest.fixture
+def predictor(comfyui, tmp_path, monkeypatch):
+    output_dir = str(tmp_path / "outputs")
+    input_dir = str(tmp_path / "inputs")
+    monkeypatch.setattr(predict, "OUTPUT_DIR", output_dir)
+    monkeypatch.setattr(predict, "INPUT_DIR", input_dir)
+    monkeypatch.setattr(predict, "ALL_DIRECTORIES", [output_dir, input_dir])
+    comfyui.weights_downloader.download_weights_list = lambda *args: None
+    server = comfyui.server_pool.primary
+    server.output_directory = output_dir
+
+    predictor = predict.Predictor()
+    predictor.comfyUI = comfyui
+    predictor.finished_files = []
+    predictor.finished_files_lock = threading.Lock()
+    predictor.result_cache = None
+    return predictor
+
+
+def run_prediction(predictor):
+    return predictor.run_prediction(
+        json.dumps(workflow()),
+        None,
+        False,
+        "png",
+        100,
+        optimise_videos.DEFAULT_VIDEO_PROFILE,
+        True,
+        False,
+    )
+
+
+def test_streaming_yields_outputs_while_the_workflow_is_running(predictor, monkeypatch):
+    monkeypatch.setattr(predict, "STREAM_OUTPUTS", True)
+    client = FakeClient(predict.OUTPUT_DIR)
+    predictor.comfyUI.server_pool.primary.client = client
+    outputs = run_prediction(predictor)
+
+    # The first output arrives once its node has run, before the prompt ends
+    first = []
+    consumer = threading.Thread(target=lambda: first.append(next(outputs)))
+    consumer.start()
+    while client.workflow is None:
+        time.sleep(0.01)
+    client.run_node("1")
+    consumer.join(timeout=10)
+
+    assert [path.name for path in first] == ["first_00001_.png"]
+    assert not client.history_requested
+
+    client.run_node("2")
+    client.finish()
+    rest = list(outputs)
+
+    assert [path.name for path in rest] == ["second_00001_.png"]
+    assert client.history_requested
+
+
+def test_without_streaming_predict_returns_a_list(predictor, monkeypatch):
+    monkeypatch.setattr(predict, "STREAM_OUTPUTS", False)
+    predictor.comfyUI.server_pool.primary.client = FakeClient(predict.OUTPUT_DIR, auto_finish=True)
+
+    outputs = asyncio.run(
+        predictor.predict(
+            workflow_json=json.dumps(workflow()),
+            input_file=None,
+            return_temp_files=False,
+            output_format="png",
+            output_quality=100,
+            video_profile=optimise_videos.DEFAULT_VIDEO_PROFILE,
+            randomise_seeds=True,
+            force_reset_cache=False,
+        )
+    )
+
+    assert isinstance(outputs, list)
+    assert sorted(path.name for path in outputs) == ["first_00001_.png", "second_00001_.png"]
+    assert predict.Predictor.predict.__annotations__["return"] == predict.List[predict.Path]
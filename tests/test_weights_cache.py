@@ -0,0 +1,126 @@
+import os
+import time
+import threading
+import multiprocessing
+
+import pytest
+
+import weights_cache
+from weights_cache import GB, WeightsCache
+
+
+@pytest.fixture(autouse=True)
+def cache_directory(tmp_path, monkeypatch):
+    monkeypatch.chdir(tmp_path)
+
+
+def weight(tmp_path, name, size=100):
+    path = tmp_path / "models" / name
+    path.parent.mkdir(parents=True, exist_ok=True)
+    path.write_bytes(b"x" * size)
+    return str(path)
+
+
+def budget_cache(size_bytes):
+    cache = WeightsCache(min_free_gb=0)
+    cache.budget_bytes = size_bytes
+    return cache
+
+
+def test_evicts_the_least_recently_used_weights(tmp_path):
+    cache = budget_cache(300)
+    paths = {}
+    for name in ["a", "b", "c"]:
+        paths[name] = weight(tmp_path, name)
+        cache.add(name, paths[name])
+        time.sleep(0.01)
+    with cache.use({"a": [paths["a"]]}):
+        pass
+
+    cache.reserve(150, str(tmp_path / "models"))
+
+    assert not os.path.exists(paths["b"])
+    assert not os.path.exists(paths["c"])
+    assert os.path.exists(paths["a"])
+    assert list(cache.records) == ["a"]
+
+
+def test_never_evicts_weights_in_use(tmp_path):
+    cache = budget_cache(200)
+    paths = {name: weight(tmp_path, name) for name in ["a", "b"]}
+    for name, path in paths.items():
+        cache.add(name, path)
+
+    # Two predictions hold "a", it stays in use until both have finished
+    with cache.use({"a": [paths["a"]]}):
+        with cache.use({"a": [paths["a"]]}):
+            pass
+        cache.reserve(150, str(tmp_path / "models"))
+        assert os.path.exists(paths["a"])
+        assert not os.path.exists(paths["b"])
+
+    cache.evict("a")
+    assert not os.path.exists(paths["a"])
+
+
+def hold_weight(path, holding, done):
+    with WeightsCache().use({"a": [path]}):
+        holding.set()
+        done.wait(timeout=10)
+
+
+def test_never_evicts_weights_another_process_is_using(tmp_path):
+    path = weight(tmp_path, "a")
+    cache = budget_cache(100)
+    cache.add("a", path)
+    context = multiprocessing.get_context("fork")
+    holding, done = context.Event(), context.Event()
+    process = context.Process(target=hold_weight, args=(path, holding, done))
+    process.start()
+    try:
+        assert holding.wait(timeout=10)
+        cache.reserve(100, str(tmp_path / "models"))
+        assert os.path.exists(path)
+    finally:
+        done.set()
+        process.join(timeout=10)
+
+    cache.reserve(100, str(tmp_path / "models"))
+    assert not os.path.exists(path)
+
+
+def test_records_are_merged_across_processes(tmp_path):
+    first, second = WeightsCache(), WeightsCache()
+    first.add("a", weight(tmp_path, "a"))
+    second.add("b", weight(tmp_path, "b"))
+
+    assert sorted(WeightsCache().records) == ["a", "b"]
+
+    first.evict("b")
+    assert sorted(WeightsCache().records) == ["a"]
+
+
+def test_concurrent_updates_are_not_lost(tmp_path):
+    caches = [WeightsCache() for _ in range(4)]
+    paths = [weight(tmp_path, f"w{i}") for i in range(20)]
+
+    def add(i):
+        caches[i % 4].add(f"w{i}", paths[i])
+
+    threads = [threading.Thread(target=add, args=(i,)) for i in range(20)]
+    for thread in threads:
+        thread.start()
+    for thread in threads:
+        thread.join()
+
+    assert len(WeightsCache().records) == 20
+
+
+def test_untracked_weights_are_never_evicted(tmp_path):
+    cache = budget_cache(1)
+    baked_in = weight(tmp_path, "baked_in")
+
+    cache.reserve(1 * GB, str(tmp_path / "models"))
+
+    assert os.path.exists(baked_in)
+    assert weights_cache.path_size(str(tmp_path / "models")) == 100
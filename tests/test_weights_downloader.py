@@ -0,0 +1,71 @@
+import io
+import tarfile
+import threading
+
+import pytest
+from filelock import FileLock
+
+import resumable_download
+import weights_downloader
+from resumable_download import DownloadAborted
+
+
+@pytest.fixture
+def downloader(comfyui, tmp_path, monkeypatch):
+    cache_path = tmp_path / "weights_cache"
+    monkeypatch.setattr(weights_downloader, "LOCKS_PATH", str(cache_path / "locks"))
+    monkeypatch.setattr(weights_downloader, "WEIGHT_LOCK_POLL_INTERVAL", 0.05)
+    monkeypatch.setattr(resumable_download, "STAGING_PATH", str(cache_path / "staging"))
+    monkeypatch.setattr(
+        resumable_download, "COMPLETE_MARKERS_PATH", str(cache_path / "complete")
+    )
+    return comfyui.weights_downloader
+
+
+def weight_tar(name, data):
+    archive = io.BytesIO()
+    with tarfile.open(fileobj=archive, mode="w") as tar:
+        info = tarfile.TarInfo(name)
+        info.size = len(data)
+        tar.addfile(info, io.BytesIO(data))
+    return archive.getvalue()
+
+
+def test_concurrent_callers_share_one_transfer(downloader, file_server, tmp_path):
+    url = file_server.add("/model.safetensors.tar", weight_tar("model.safetensors", b"weights"))
+    file_server.delays["/model.safetensors.tar"] = 0.5
+    dest = str(tmp_path / "models")
+    start = threading.Barrier(2)
+    seen = []
+
+    def fetch():
+        start.wait()
+        # Every call takes its own FileLock, as a separate process would
+        downloader.download_if_not_exists("model.safetensors", url, dest)
+        with open(tmp_path / "models" / "model.safetensors", "rb") as f:
+            seen.append(f.read())
+
+    threads = [threading.Thread(target=fetch) for _ in range(2)]
+    for thread in threads:
+        thread.start()
+    for thread in threads:
+        thread.join(timeout=10)
+
+    assert seen == [b"weights", b"weights"]
+    assert len(file_server.requests_for("/model.safetensors.tar")) == 1
+
+
+def test_waiting_for_a_stuck_peer_stops_on_abort(downloader, file_server, tmp_path):
+    url = file_server.add("/model.safetensors.tar", weight_tar("model.safetensors", b"weights"))
+    dest = str(tmp_path / "models")
+    abort = threading.Event()
+    peer = FileLock(downloader.weight_lock_path("model.safetensors", dest))
+    peer.acquire()
+    try:
+        threading.Timer(0.2, abort.set).start()
+        with pytest.raises(DownloadAborted):
+            downloader.download_if_not_exists("model.safetensors", url, dest, abort=abort)
+    finally:
+        peer.release()
+
+    assert file_server.requests_for("/model.safetensors.tar") == []
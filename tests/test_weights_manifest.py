@@ -0,0 +1,154 @@
+import json
+import os
+
+import pytest
+
+import weights_manifest
+from weights_manifest import WeightsManifest
+
+
+@pytest.fixture
+def manifest_sources(tmp_path, monkeypatch):
+    helpers = tmp_path / "helpers"
+    helpers.mkdir()
+    (helpers / "Some_Node.py").write_text("# helper\n")
+    (tmp_path / "weights.json").write_text(
+        json.dumps({"CHECKPOINTS": ["a.safetensors"]})
+    )
+    (tmp_path / "weight_synonyms.json").write_text("{}")
+
+    monkeypatch.setattr(weights_manifest, "WEIGHTS_MANIFEST_PATH", str(tmp_path / "weights.json"))
+    monkeypatch.setattr(
+        weights_manifest, "WEIGHTS_SYNONYMS_PATH", str(tmp_path / "weight_synonyms.json")
+    )
+    monkeypatch.setattr(
+        weights_manifest, "REMOTE_WEIGHTS_MANIFEST_PATH", str(tmp_path / "updated_weights.json")
+    )
+    monkeypatch.setattr(
+        weights_manifest,
+        "REMOTE_WEIGHTS_MANIFEST_HEADERS_PATH",
+        str(tmp_path / "updated_weights.headers.json"),
+    )
+    monkeypatch.setattr(
+        weights_manifest, "USER_WEIGHTS_MANIFEST_PATH", str(tmp_path / "user_weights.json")
+    )
+    monkeypatch.setattr(weights_manifest, "HELPERS_PATH", str(helpers))
+    monkeypatch.setattr(
+        weights_manifest, "WEIGHTS_MANIFEST_INDEX_PATH", str(tmp_path / "cache" / "index.pickle")
+    )
+    monkeypatch.setattr(weights_manifest, "_compiled_index", None)
+    monkeypatch.delenv("DOWNLOAD_LATEST_WEIGHTS_MANIFEST", raising=False)
+    return tmp_path
+
+
+@pytest.fixture
+def compiles(monkeypatch):
+    calls = []
+    compile_index = WeightsManifest._compile_index
+
+    def counting(self, fingerprint):
+        calls.append(fingerprint)
+        return compile_index(self, fingerprint)
+
+    monkeypatch.setattr(WeightsManifest, "_compile_index", counting)
+    return calls
+
+
+def touch(path):
+    # Moves the mtime forward by a second so the change is seen on
+    # filesystems with coarse timestamps
+    stat = os.stat(path)
+    os.utime(path, ns=(stat.st_atime_ns, stat.st_mtime_ns + 1_000_000_000))
+
+
+def test_a_fresh_process_loads_the_saved_index(manifest_sources, compiles, monkeypatch):
+    WeightsManifest()
+    assert len(compiles) == 1
+    assert os.path.exists(weights_manifest.WEIGHTS_MANIFEST_INDEX_PATH)
+
+    monkeypatch.setattr(weights_manifest, "_compiled_index", None)
+    manifest = WeightsManifest()
+
+    assert len(compiles) == 1
+    assert "a.safetensors" in manifest.weights_map
+
+
+def test_editing_a_manifest_rebuilds_the_index(manifest_sources, compiles, monkeypatch):
+    WeightsManifest()
+    (manifest_sources / "weights.json").write_text(
+        json.dumps({"CHECKPOINTS": ["a.safetensors", "b.safetensors"]})
+    )
+    touch(manifest_sources / "weights.json")
+
+    # In this process, and in a new one reading the saved index
+    assert "b.safetensors" in WeightsManifest().weights_map
+    monkeypatch.setattr(weights_manifest, "_compiled_index", None)
+    assert "b.safetensors" in WeightsManifest().weights_map
+    assert len(compiles) == 2
+
+
+def test_a_new_user_manifest_rebuilds_the_index(manifest_sources, compiles):
+    first = WeightsManifest().fingerprint
+    (manifest_sources / "user_weights.json").write_text(
+        json.dumps({"LORAS": ["mine.safetensors"]})
+    )
+
+    manifest = WeightsManifest()
+
+    assert manifest.fingerprint != first
+    assert "mine.safetensors" in manifest.weights_map
+    assert len(compiles) == 2
+
+
+def test_touching_a_helper_rebuilds_the_index(manifest_sources, compiles, monkeypatch):
+    first = WeightsManifest().fingerprint
+    touch(manifest_sources / "helpers" / "Some_Node.py")
+    monkeypatch.setattr(weights_manifest, "_compiled_index", None)
+
+    assert WeightsManifest().fingerprint != first
+    assert len(compiles) == 2
+
+
+def test_an_unreadable_index_is_rebuilt(manifest_sources, compiles, monkeypatch):
+    WeightsManifest()
+    with open(weights_manifest.WEIGHTS_MANIFEST_INDEX_PATH, "wb") as f:
+        f.write(b"not a pickle")
+    monkeypatch.setattr(weights_manifest, "_compiled_index", None)
+
+    assert "a.safetensors" in WeightsManifest().weights_map
+    assert len(compiles) == 2
+
+
+def test_a_304_keeps_the_cached_manifest(manifest_sources, file_server, monkeypatch):
+    body = json.dumps({"LORAS": ["remote.safetensors"]}).encode()
+    url = file_server.add("/weights.json", body, etag='"v1"')
+    monkeypatch.setattr(weights_manifest, "REMOTE_WEIGHTS_MANIFEST_URL", url)
+    manifest = WeightsManifest()
+
+    assert manifest._download_updated_weights_manifest()
+    saved = os.stat(weights_manifest.REMOTE_WEIGHTS_MANIFEST_PATH)
+    assert not manifest._download_updated_weights_manifest()
+
+    second = file_server.requests_for("/weights.json")[1]
+    assert second["headers"]["If-None-Match"] == '"v1"'
+    assert os.stat(weights_manifest.REMOTE_WEIGHTS_MANIFEST_PATH) == saved
+    with open(weights_manifest.REMOTE_WEIGHTS_MANIFEST_HEADERS_PATH) as f:
+        assert json.load(f)["etag"] == '"v1"'
+    assert "remote.safetensors" in WeightsManifest().weights_map
+
+
+def test_a_changed_remote_manifest_replaces_the_cached_one(
+    manifest_sources, file_server, monkeypatch
+):
+    url = file_server.add("/weights.json", b'{"LORAS": ["old.safetensors"]}', etag='"v1"')
+    monkeypatch.setattr(weights_manifest, "REMOTE_WEIGHTS_MANIFEST_URL", url)
+    manifest = WeightsManifest()
+    manifest._download_updated_weights_manifest()
+
+    file_server.add("/weights.json", b'{"LORAS": ["new.safetensors"]}', etag='"v2"')
+
+    assert manifest._download_updated_weights_manifest()
+    with open(weights_manifest.REMOTE_WEIGHTS_MANIFEST_HEADERS_PATH) as f:
+        assert json.load(f)["etag"] == '"v2"'
+    assert not [p for p in os.listdir(manifest_sources) if p.endswith(".tmp")]
+    assert "new.safetensors" in WeightsManifest().weights_map
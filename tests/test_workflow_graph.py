@@ -0,0 +1,65 @@
+from workflow_graph import reachable_node_ids, unreachable_node_ids
+
+OUTPUT_NODE_TYPES = {"SaveImage", "PreviewImage"}
+
+
+def workflow():
+    return {
+        "1": {"class_type": "CheckpointLoaderSimple", "inputs": {"ckpt_name": "a.safetensors"}},
+        "2": {"class_type": "CLIPTextEncode", "inputs": {"text": "a cat", "clip": ["1", 1]}},
+        "3": {"class_type": "KSampler", "inputs": {"model": ["1", 0], "positive": ["2", 0]}},
+        "4": {"class_type": "VAEDecode", "inputs": {"samples": ["3", 0], "vae": ["1", 2]}},
+        "5": {"class_type": "SaveImage", "inputs": {"images": ["4", 0]}},
+        # An unused branch, with its own model
+        "6": {"class_type": "CheckpointLoaderSimple", "inputs": {"ckpt_name": "b.safetensors"}},
+        "7": {"class_type": "CLIPTextEncode", "inputs": {"text": "a dog", "clip": ["6", 1]}},
+    }
+
+
+def test_keeps_every_node_an_output_depends_on():
+    assert reachable_node_ids(workflow(), OUTPUT_NODE_TYPES) == {"1", "2", "3", "4", "5"}
+
+
+def test_finds_nodes_no_output_depends_on():
+    assert unreachable_node_ids(workflow(), OUTPUT_NODE_TYPES) == ["6", "7"]
+
+
+def test_every_output_node_is_kept():
+    wf = workflow()
+    wf["8"] = {"class_type": "PreviewImage", "inputs": {"images": ["7", 0]}}
+
+    assert unreachable_node_ids(wf, OUTPUT_NODE_TYPES) == []
+
+
+def test_nothing_is_pruned_without_an_output_node():
+    wf = workflow()
+    del wf["5"]
+
+    assert unreachable_node_ids(wf, OUTPUT_NODE_TYPES) == []
+
+
+def test_lists_that_are_not_links_are_ignored():
+    wf = workflow()
+    wf["5"]["inputs"]["size"] = [512, 512]
+    wf["5"]["inputs"]["missing"] = ["99", 0]
+
+    assert unreachable_node_ids(wf, OUTPUT_NODE_TYPES) == ["6", "7"]
+
+
+def test_cycles_terminate():
+    wf = {
+        "1": {"class_type": "Loop", "inputs": {"previous": ["2", 0]}},
+        "2": {"class_type": "Loop", "inputs": {"previous": ["1", 0]}},
+        "3": {"class_type": "SaveImage", "inputs": {"images": ["1", 0]}},
+    }
+
+    assert reachable_node_ids(wf, OUTPUT_NODE_TYPES) == {"1", "2", "3"}
+
+
+def test_prune_unused_nodes_removes_them_from_the_workflow(comfyui):
+    comfyui.output_node_types = OUTPUT_NODE_TYPES
+    wf = workflow()
+
+    comfyui.prune_unused_nodes(wf)
+
+    assert sorted(wf) == ["1", "2", "3", "4", "5"]
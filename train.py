@@ -1,6 +1,5 @@
 import tarfile
 import os
-import subprocess
 import requests
 import urllib.parse
 import shutil
@@ -9,6 +8,7 @@ import time
 
 from cog import BaseModel, Input, Path, Secret
 from huggingface_hub import hf_hub_download
+from resumable_download import download_url
 
 os.environ["DOWNLOAD_LATEST_WEIGHTS_MANIFEST"] = "true"
 os.environ["HF_HUB_ENABLE_HF_TRANSFER"] = "1"
@@ -119,13 +119,11 @@ def download_from_civitai(
 
     start_time = time.time()
     try:
-        result = subprocess.run(["pget", "-f", url, filename], timeout=600)
-        if result.returncode != 0:
-            raise RuntimeError(
-                "Download failed. You need to pass in a valid CivitAI API token if the download showed a 401 Unauthorized error. You can create an API key from the bottom of https://civitai.com/user/account"
-            )
-    except subprocess.TimeoutExpired:
-        raise RuntimeError("Download failed due to timeout")
+        download_url(url, filename)
+    except Exception as e:
+        raise RuntimeError(
+            f"Download failed: {e}. You need to pass in a valid CivitAI API token if the download showed a 401 Unauthorized error. You can create an API key from the bottom of https://civitai.com/user/account"
+        )
 
     print(f"Successfully downloaded {filename}")
     end_time = time.time()
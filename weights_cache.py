@@ -0,0 +1,195 @@
+import os
+import json
+import time
+import fcntl
+import shutil
+import hashlib
+import threading
+from collections import Counter
+from contextlib import contextmanager
+from filelock import FileLock
+from config import config
+
+WEIGHTS_CACHE_PATH = config["WEIGHTS_CACHE_PATH"]
+WEIGHTS_ACCESS_PATH = os.path.join(WEIGHTS_CACHE_PATH, "weights_access.json")
+LEASES_PATH = os.path.join(WEIGHTS_CACHE_PATH, "leases")
+DISK_BUDGET_GB = config["WEIGHTS_DISK_BUDGET_GB"]
+MIN_FREE_DISK_GB = config["WEIGHTS_MIN_FREE_DISK_GB"]
+GB = 1024 * 1024 * 1024
+
+
+def path_size(path):
+    if os.path.isfile(path):
+        return os.path.getsize(path)
+    total = 0
+    for root, _, files in os.walk(path):
+        for file in files:
+            try:
+                total += os.path.getsize(os.path.join(root, file))
+            except OSError:
+                pass
+    return total
+
+
+class WeightsCache:
+    """
+    Keeps the weights we download within a disk budget.
+
+    Every weight resolved for a workflow has its last access time recorded.
+    Before a download we evict the least recently used weights until the new
+    file fits, never touching weights a running workflow references.
+    Weights we have never seen (user weights, files baked into the image)
+    are not tracked and so are never evicted.
+
+    Records are shared with other processes using the same volume, so they
+    are re-read under a file lock before every change. Every process using a
+    weight holds a shared lock on its lease file, and eviction needs the
+    exclusive lock, so a weight another process is running with is skipped.
+    """
+
+    def __init__(self, budget_gb=DISK_BUDGET_GB, min_free_gb=MIN_FREE_DISK_GB):
+        self.budget_bytes = budget_gb * GB if budget_gb else None
+        self.min_free_bytes = (min_free_gb or 0) * GB
+        self.lock = threading.RLock()
+        # How many running workflows reference each weight
+        self.in_use = Counter()
+        self.reserved_bytes = 0
+        os.makedirs(WEIGHTS_CACHE_PATH, exist_ok=True)
+        self.file_lock = FileLock(f"{WEIGHTS_ACCESS_PATH}.lock")
+        self.records = self._load()
+
+    def _load(self):
+        if os.path.exists(WEIGHTS_ACCESS_PATH):
+            try:
+                with open(WEIGHTS_ACCESS_PATH, "r") as f:
+                    return json.load(f)
+            except (OSError, ValueError):
+                print(f"Ignoring unreadable {WEIGHTS_ACCESS_PATH}")
+        return {}
+
+    def _save(self):
+        os.makedirs(WEIGHTS_CACHE_PATH, exist_ok=True)
+        tmp_path = f"{WEIGHTS_ACCESS_PATH}.{os.getpid()}.tmp"
+        with open(tmp_path, "w") as f:
+            json.dump(self.records, f)
+        os.replace(tmp_path, WEIGHTS_ACCESS_PATH)
+
+    def _update(self, change):
+        with self.lock, self.file_lock:
+            self.records = self._load()
+            result = change(self.records)
+            self._save()
+            return result
+
+    @contextmanager
+    def use(self, weights):
+        """
+        Records that the weights were accessed and keeps them from being
+        evicted until the block exits. weights maps each weight_str the
+        workflow needs to its paths on disk.
+        """
+        with self.lock:
+            self.in_use.update(weights.keys())
+        # Waits only while another process is evicting one of the weights
+        leases = [self._lease(weight_str, fcntl.LOCK_SH) for weight_str in weights]
+        try:
+            self._update(lambda records: self._record_access(records, weights))
+            yield
+        finally:
+            for lease in leases:
+                os.close(lease)
+            with self.lock:
+                self.in_use.subtract(weights.keys())
+                self.in_use = +self.in_use
+
+    @staticmethod
+    def _lease(weight_str, operation):
+        # Returns the locked lease file, or None if a non-blocking lock was refused
+        os.makedirs(LEASES_PATH, exist_ok=True)
+        key = hashlib.sha1(weight_str.encode("utf-8")).hexdigest()
+        fd = os.open(os.path.join(LEASES_PATH, f"{key}.lease"), os.O_RDWR | os.O_CREAT)
+        try:
+            fcntl.flock(fd, operation)
+        except BlockingIOError:
+            os.close(fd)
+            return None
+        return fd
+
+    @staticmethod
+    def _record_access(records, weights):
+        now = time.time()
+        for weight_str, paths in weights.items():
+            existing = [p for p in paths if os.path.exists(p)]
+            if not existing:
+                continue
+            record = records.setdefault(weight_str, {"paths": [], "size": 0})
+            record["last_access"] = now
+            new_paths = [p for p in existing if p not in record["paths"]]
+            if new_paths:
+                record["paths"].extend(new_paths)
+                record["size"] = sum(path_size(p) for p in record["paths"])
+
+    def add(self, weight_str, path):
+        def add_path(records):
+            record = records.setdefault(weight_str, {"paths": [], "size": 0})
+            record["last_access"] = time.time()
+            if path not in record["paths"]:
+                record["paths"].append(path)
+            record["size"] = sum(
+                path_size(p) for p in record["paths"] if os.path.exists(p)
+            )
+
+        self._update(add_path)
+
+    def used_bytes(self):
+        return sum(record.get("size", 0) for record in self.records.values())
+
+    def _needs_room(self, size, dest):
+        if self.budget_bytes:
+            if self.used_bytes() + self.reserved_bytes + size > self.budget_bytes:
+                return True
+        os.makedirs(dest, exist_ok=True)
+        free = shutil.disk_usage(dest).free - self.reserved_bytes
+        return free - size < self.min_free_bytes
+
+    def reserve(self, size, dest):
+        """Evict until size bytes fit in dest, and hold them until release."""
+        with self.lock:
+            self.records = self._load()
+            candidates = sorted(
+                (w for w in self.records if w not in self.in_use),
+                key=lambda w: self.records[w].get("last_access", 0),
+            )
+            while self._needs_room(size, dest) and candidates:
+                self.evict(candidates.pop(0))
+
+            if self._needs_room(size, dest):
+                print(
+                    f"⚠️  Not enough disk space for {size / GB:.2f}GB in {dest}, nothing left to evict"
+                )
+            self.reserved_bytes += size
+
+    def release(self, size):
+        with self.lock:
+            self.reserved_bytes = max(0, self.reserved_bytes - size)
+
+    def evict(self, weight_str):
+        with self.lock:
+            if weight_str in self.in_use:
+                return
+            lease = self._lease(weight_str, fcntl.LOCK_EX | fcntl.LOCK_NB)
+            if lease is None:
+                print(f"⏭️  Not evicting {weight_str}, another process is using it")
+                return
+            try:
+                record = self._update(lambda records: records.pop(weight_str, None))
+                if record is None:
+                    return
+                for path in record["paths"]:
+                    if os.path.isdir(path):
+                        shutil.rmtree(path, ignore_errors=True)
+                    elif os.path.exists(path):
+                        os.remove(path)
+            finally:
+                os.close(lease)
+            print(f"🗑️  Evicted {weight_str} ({record.get('size', 0) / GB:.2f}GB)")
@@ -1,7 +1,24 @@
-import subprocess
 import time
 import os
+import hashlib
+from filelock import FileLock, Timeout
+from config import config
 from weights_manifest import WeightsManifest
+from download_scheduler import DownloadScheduler
+from weights_cache import WeightsCache, path_size
+from resumable_download import (
+    ResumableDownload,
+    DownloadAborted,
+    is_complete,
+    remove_complete_marker,
+)
+from download_telemetry import telemetry as shared_telemetry
+
+LOCKS_PATH = os.path.join(config["WEIGHTS_CACHE_PATH"], "locks")
+# While another process holds a weight's lock we check for an abort this
+# often, and give up if it has not finished after WEIGHT_LOCK_TIMEOUT
+WEIGHT_LOCK_POLL_INTERVAL = 1
+WEIGHT_LOCK_TIMEOUT = 30 * 60
 
 
 class WeightsDownloader:
@@ -20,77 +37,177 @@ class WeightsDownloader:
 
     def __init__(self):
         self.weights_manifest = WeightsManifest()
-        self.weights_map = self.weights_manifest.weights_map
+        self.weights_cache = WeightsCache()
+
+    @property
+    def weights_map(self):
+        # Read through so a background manifest refresh is picked up
+        return self.weights_manifest.weights_map
 
     def get_canonical_weight_str(self, weight_str):
         return self.weights_manifest.get_canonical_weight_str(weight_str)
 
+    def get_embeddings_matcher(self):
+        return self.weights_manifest.embeddings_matcher
+
+    def get_manifest_fingerprint(self):
+        return self.weights_manifest.fingerprint
+
     def get_weights_by_type(self, type):
         return self.weights_manifest.get_weights_by_type(type)
 
     def download_weights(self, weight_str):
-        if weight_str in self.weights_map:
-            if self.weights_manifest.is_non_commercial_only(weight_str):
-                print(
-                    f"⚠️  {weight_str} is for non-commercial use only. Unless you have obtained a commercial license.\nDetails: https://github.com/replicate/cog-comfyui/blob/main/weights_licenses.md"
-                )
-
-            if isinstance(self.weights_map[weight_str], list):
-                for weight in self.weights_map[weight_str]:
-                    self.download_if_not_exists(
-                        weight_str, weight["url"], weight["dest"]
-                    )
-            else:
-                self.download_if_not_exists(
-                    weight_str,
-                    self.weights_map[weight_str]["url"],
-                    self.weights_map[weight_str]["dest"],
-                )
+        self.download_weights_list([weight_str])
+
+    def download_weights_list(self, weight_strs, extra_downloads=(), prediction=None):
+        # Weights this workflow references are protected from eviction, until
+        # the prediction finishes if there is one, or the download otherwise
+        in_use = {
+            weight_str: self.weight_paths(weight_str)
+            for weight_str in weight_strs
+            if weight_str in self.weights_map
+        }
+        for weight_str, _, dest in extra_downloads:
+            in_use.setdefault(weight_str, []).append(self.weight_path(weight_str, dest))
+        usage = self.weights_cache.use(in_use)
+        if prediction is None:
+            with usage:
+                DownloadScheduler(self).download(weight_strs, extra_downloads)
         else:
-            raise ValueError(
-                f"{weight_str} unavailable. View the list of available weights: https://github.com/replicate/cog-comfyui/blob/main/supported_weights.md"
+            prediction.hold(usage)
+            DownloadScheduler(self, telemetry=prediction.telemetry).download(
+                weight_strs, extra_downloads
             )
 
-    def check_if_file_exists(self, weight_str, dest):
+    def weight_paths(self, weight_str):
+        entries = self.weights_map[weight_str]
+        if not isinstance(entries, list):
+            entries = [entries]
+        return [self.weight_path(weight_str, entry["dest"]) for entry in entries]
+
+    @staticmethod
+    def weight_path(weight_str, dest):
         if dest.endswith(weight_str):
-            path_string = dest
-        else:
-            path_string = os.path.join(dest, weight_str)
-        return os.path.exists(path_string)
+            return dest
+        return os.path.join(dest, weight_str)
 
-    def download_if_not_exists(self, weight_str, url, dest):
+    def check_if_file_exists(self, weight_str, dest):
+        return is_complete(self.weight_path(weight_str, dest))
+
+    def download_if_not_exists(
+        self,
+        weight_str,
+        url,
+        dest,
+        max_connections=None,
+        size=None,
+        abort=None,
+        telemetry=shared_telemetry,
+    ):
         if self.check_if_file_exists(weight_str, dest):
-            print(f"✅ {weight_str} exists in {dest}")
+            telemetry.cache_hit(weight_str, dest)
             return
-        WeightsDownloader.download(weight_str, url, dest)
+
+        # Processes sharing a models volume take turns on each weight, so the
+        # second one waits for the first download instead of repeating it
+        with self.weight_lock(weight_str, dest, abort):
+            if self.check_if_file_exists(weight_str, dest):
+                print(f"✅ {weight_str} was downloaded to {dest} by another process")
+                return
+            self._download_and_track(
+                weight_str, url, dest, max_connections, size, abort, telemetry
+            )
+
+    def weight_lock_path(self, weight_str, dest):
+        path = os.path.abspath(self.weight_path(weight_str, dest))
+        key = hashlib.sha1(path.encode("utf-8")).hexdigest()
+        return os.path.join(LOCKS_PATH, f"{key}.lock")
+
+    def weight_lock(self, weight_str, dest, abort=None):
+        os.makedirs(LOCKS_PATH, exist_ok=True)
+        lock = FileLock(self.weight_lock_path(weight_str, dest))
+        try:
+            return lock.acquire(timeout=0)
+        except Timeout:
+            print(f"⏳ Waiting for another process to finish downloading {weight_str}")
+
+        deadline = time.monotonic() + WEIGHT_LOCK_TIMEOUT
+        while True:
+            try:
+                return lock.acquire(timeout=WEIGHT_LOCK_POLL_INTERVAL)
+            except Timeout:
+                if abort is not None and abort.is_set():
+                    raise DownloadAborted(f"Stopped waiting for {weight_str}")
+                if time.monotonic() > deadline:
+                    raise TimeoutError(
+                        f"Another process has been downloading {weight_str} for over {WEIGHT_LOCK_TIMEOUT}s"
+                    )
+
+    def _download_and_track(
+        self,
+        weight_str,
+        url,
+        dest,
+        max_connections,
+        size,
+        abort=None,
+        telemetry=shared_telemetry,
+    ):
+        # Tars are extracted as they arrive, so nothing is staged beside them
+        reserved = size or 0
+        if reserved:
+            self.weights_cache.reserve(reserved, dest)
+        try:
+            WeightsDownloader.download(
+                weight_str, url, dest, max_connections, abort, telemetry
+            )
+        finally:
+            if reserved:
+                self.weights_cache.release(reserved)
+
+        if weight_str in self.weights_map:
+            self.weights_cache.add(weight_str, self.weight_path(weight_str, dest))
 
     @staticmethod
-    def download(weight_str, url, dest):
+    def download(
+        weight_str,
+        url,
+        dest,
+        max_connections=None,
+        abort=None,
+        telemetry=shared_telemetry,
+    ):
         if "/" in weight_str:
             subfolder = weight_str.rsplit("/", 1)[0]
             dest = os.path.join(dest, subfolder)
             os.makedirs(dest, exist_ok=True)
 
-        print(f"⏳ Downloading {weight_str} to {dest}")
+        telemetry.start(weight_str, dest, url)
         start = time.time()
-        subprocess.check_call(
-            ["pget", "--log-level", "warn", "-xf", url, dest], close_fds=False
-        )
-        elapsed_time = time.time() - start
         try:
-            file_size_bytes = os.path.getsize(
-                os.path.join(dest, os.path.basename(weight_str))
-            )
-            file_size_megabytes = file_size_bytes / (1024 * 1024)
-            print(
-                f"✅ {weight_str} downloaded to {dest} in {elapsed_time:.2f}s, size: {file_size_megabytes:.2f}MB"
-            )
-        except FileNotFoundError:
-            print(f"✅ {weight_str} downloaded to {dest} in {elapsed_time:.2f}s")
+            paths = ResumableDownload(
+                url,
+                dest,
+                connections=max_connections or 8,
+                on_progress=lambda done, total, rate: telemetry.progress(
+                    weight_str, done, total, rate
+                ),
+                abort=abort,
+            ).run()
+        except DownloadAborted:
+            print(f"⏹️  Stopped downloading {weight_str}, another download failed")
+            raise
+        except Exception as e:
+            telemetry.failure(weight_str, dest, e)
+            raise
+        telemetry.finish(
+            weight_str, dest, sum(path_size(p) for p in paths), time.time() - start
+        )
 
     def delete_weights(self, weight_str):
         if weight_str in self.weights_map:
             weight_path = os.path.join(self.weights_map[weight_str]["dest"], weight_str)
             if os.path.exists(weight_path):
                 os.remove(weight_path)
+                remove_complete_marker(weight_path)
                 print(f"Deleted {weight_path}")
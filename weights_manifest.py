@@ -1,17 +1,37 @@
-import subprocess
 import time
 import os
 import json
+import pickle
+import hashlib
+import threading
+import urllib.request
+from urllib.error import HTTPError, URLError
 import custom_node_helpers as helpers
 from config import config
+from multi_pattern_matcher import MultiPatternMatcher
 
 USER_WEIGHTS_MANIFEST_PATH = config["USER_WEIGHTS_MANIFEST_PATH"]
 REMOTE_WEIGHTS_MANIFEST_URL = config["REMOTE_WEIGHTS_MANIFEST_URL"]
+REMOTE_WEIGHTS_MANIFEST_REFRESH_INTERVAL = config[
+    "REMOTE_WEIGHTS_MANIFEST_REFRESH_INTERVAL"
+]
 REMOTE_WEIGHTS_MANIFEST_PATH = "updated_weights.json"
+REMOTE_WEIGHTS_MANIFEST_HEADERS_PATH = "updated_weights.headers.json"
 WEIGHTS_MANIFEST_PATH = "weights.json"
 WEIGHTS_SYNONYMS_PATH = "weight_synonyms.json"
 BASE_URL = config["WEIGHTS_BASE_URL"]
 MODELS_PATH = config["MODELS_PATH"]
+WEIGHTS_MANIFEST_INDEX_PATH = os.path.join(
+    config["WEIGHTS_CACHE_PATH"], "weights_manifest_index.pickle"
+)
+HELPERS_PATH = os.path.dirname(os.path.abspath(helpers.__file__))
+
+# The compiled index for this process, shared by every WeightsManifest.
+# A background refresh replaces it with a single assignment.
+_compiled_index = None
+_index_lock = threading.Lock()
+_refresh_thread = None
+_first_refresh_done = threading.Event()
 
 
 class WeightsManifest:
@@ -23,43 +43,184 @@ class WeightsManifest:
         self.download_latest_weights_manifest = (
             os.getenv("DOWNLOAD_LATEST_WEIGHTS_MANIFEST", "false").lower() == "true"
         )
-        self.weights_manifest = self._load_weights_manifest()
-        self.synonyms = self._initialize_synonyms()
-        self.weights_map = self._initialize_weights_map()
-
-    def _load_weights_manifest(self):
+        self._load_index()
         if self.download_latest_weights_manifest:
-            self._download_updated_weights_manifest()
-        return self._merge_manifests()
+            self._start_background_refresh()
 
-    def _download_updated_weights_manifest(self):
-        if not os.path.exists(REMOTE_WEIGHTS_MANIFEST_PATH):
-            print(
-                f"Downloading updated weights manifest from {REMOTE_WEIGHTS_MANIFEST_URL}"
+    @property
+    def weights_manifest(self):
+        return _compiled_index["weights_manifest"]
+
+    @property
+    def synonyms(self):
+        return _compiled_index["synonyms"]
+
+    @property
+    def weights_map(self):
+        return _compiled_index["weights_map"]
+
+    @property
+    def fingerprint(self):
+        return _compiled_index["fingerprint"]
+
+    @property
+    def embeddings_matcher(self):
+        # Built once per compiled index, embeddings are matched by the
+        # part of their filename before the first dot
+        index = _compiled_index
+        if "embeddings_matcher" not in index:
+            index["embeddings_matcher"] = MultiPatternMatcher(
+                {
+                    emb.split(".")[0]: emb
+                    for emb in index["weights_manifest"].get("EMBEDDINGS", [])
+                }
             )
-            start = time.time()
+        return index["embeddings_matcher"]
+
+    @staticmethod
+    def _source_fingerprint():
+        # Anything that feeds into the merged manifest or the weights map
+        sources = [
+            WEIGHTS_MANIFEST_PATH,
+            REMOTE_WEIGHTS_MANIFEST_PATH,
+            USER_WEIGHTS_MANIFEST_PATH,
+            WEIGHTS_SYNONYMS_PATH,
+        ] + sorted(
+            os.path.join(HELPERS_PATH, f)
+            for f in os.listdir(HELPERS_PATH)
+            if f.endswith(".py")
+        )
+        parts = [BASE_URL, MODELS_PATH]
+        for path in sources:
             try:
-                subprocess.check_call(
-                    [
-                        "pget",
-                        "--log-level",
-                        "warn",
-                        "-f",
-                        REMOTE_WEIGHTS_MANIFEST_URL,
-                        REMOTE_WEIGHTS_MANIFEST_PATH,
-                    ],
-                    close_fds=False,
-                    timeout=5,
-                )
-                print(
-                    f"Downloading {REMOTE_WEIGHTS_MANIFEST_URL} took: {(time.time() - start):.2f}s"
-                )
-            except subprocess.CalledProcessError:
-                print(f"Failed to download {REMOTE_WEIGHTS_MANIFEST_URL}")
-                pass
-            except subprocess.TimeoutExpired:
-                print(f"Download from {REMOTE_WEIGHTS_MANIFEST_URL} timed out")
-                pass
+                stat = os.stat(path)
+                parts.append(f"{path}:{stat.st_mtime_ns}:{stat.st_size}")
+            except FileNotFoundError:
+                parts.append(f"{path}:missing")
+        return hashlib.sha256("\n".join(parts).encode("utf-8")).hexdigest()
+
+    def _load_index(self):
+        """
+        Returns the merged manifest, synonyms and weights map, compiling them
+        only when one of their sources has changed since the last compile.
+        """
+        global _compiled_index
+        with _index_lock:
+            fingerprint = self._source_fingerprint()
+            if _compiled_index and _compiled_index["fingerprint"] == fingerprint:
+                return _compiled_index
+
+            index = None
+            if os.path.exists(WEIGHTS_MANIFEST_INDEX_PATH):
+                try:
+                    with open(WEIGHTS_MANIFEST_INDEX_PATH, "rb") as f:
+                        index = pickle.load(f)
+                except (OSError, pickle.UnpicklingError, EOFError, ValueError):
+                    index = None
+
+            if not index or index.get("fingerprint") != fingerprint:
+                index = self._compile_index(fingerprint)
+
+            _compiled_index = index
+            return index
+
+    def _compile_index(self, fingerprint):
+        weights_manifest = self._merge_manifests()
+        index = {
+            "fingerprint": fingerprint,
+            "weights_manifest": weights_manifest,
+            "synonyms": self._initialize_synonyms(),
+            "weights_map": self._initialize_weights_map(weights_manifest),
+        }
+
+        try:
+            os.makedirs(os.path.dirname(WEIGHTS_MANIFEST_INDEX_PATH), exist_ok=True)
+            tmp_path = f"{WEIGHTS_MANIFEST_INDEX_PATH}.{os.getpid()}.tmp"
+            with open(tmp_path, "wb") as f:
+                pickle.dump(index, f, protocol=pickle.HIGHEST_PROTOCOL)
+            os.replace(tmp_path, WEIGHTS_MANIFEST_INDEX_PATH)
+        except OSError as e:
+            print(f"Could not save weights manifest index: {e}")
+
+        return index
+
+    def _start_background_refresh(self):
+        global _refresh_thread
+        with _index_lock:
+            if _refresh_thread is not None:
+                return
+            _refresh_thread = threading.Thread(
+                target=self._refresh_loop, name="weights-manifest-refresh", daemon=True
+            )
+            _refresh_thread.start()
+
+    def _refresh_loop(self):
+        while True:
+            try:
+                if self._download_updated_weights_manifest():
+                    self._load_index()
+                    print("Weights manifest updated")
+            except Exception as e:
+                print(f"Failed to refresh weights manifest: {e}")
+            finally:
+                _first_refresh_done.set()
+            time.sleep(REMOTE_WEIGHTS_MANIFEST_REFRESH_INTERVAL)
+
+    @staticmethod
+    def wait_for_first_refresh(timeout):
+        # Lets a request for an unknown weight wait briefly on a refresh that
+        # is already in flight, without setup ever blocking on the network
+        if _refresh_thread is None:
+            return False
+        return _first_refresh_done.wait(timeout)
+
+    def _download_updated_weights_manifest(self):
+        """
+        Fetches the remote manifest if it has changed since we last saw it,
+        returning True when a new version was saved.
+        """
+        headers = {}
+        if os.path.exists(REMOTE_WEIGHTS_MANIFEST_PATH) and os.path.exists(
+            REMOTE_WEIGHTS_MANIFEST_HEADERS_PATH
+        ):
+            with open(REMOTE_WEIGHTS_MANIFEST_HEADERS_PATH, "r") as f:
+                cached = json.load(f)
+            if cached.get("etag"):
+                headers["If-None-Match"] = cached["etag"]
+            if cached.get("last_modified"):
+                headers["If-Modified-Since"] = cached["last_modified"]
+
+        start = time.time()
+        request = urllib.request.Request(REMOTE_WEIGHTS_MANIFEST_URL, headers=headers)
+        try:
+            with urllib.request.urlopen(request, timeout=30) as response:
+                body = response.read()
+                etag = response.headers.get("ETag")
+                last_modified = response.headers.get("Last-Modified")
+        except HTTPError as e:
+            if e.code == 304:
+                return False
+            print(f"Failed to download {REMOTE_WEIGHTS_MANIFEST_URL}: {e.code}")
+            return False
+        except (URLError, TimeoutError) as e:
+            print(f"Failed to download {REMOTE_WEIGHTS_MANIFEST_URL}: {e}")
+            return False
+
+        # Only replace the manifest with something we can parse
+        json.loads(body)
+        tmp_path = f"{REMOTE_WEIGHTS_MANIFEST_PATH}.{os.getpid()}.tmp"
+        with open(tmp_path, "wb") as f:
+            f.write(body)
+        os.replace(tmp_path, REMOTE_WEIGHTS_MANIFEST_PATH)
+        tmp_path = f"{REMOTE_WEIGHTS_MANIFEST_HEADERS_PATH}.{os.getpid()}.tmp"
+        with open(tmp_path, "w") as f:
+            json.dump({"etag": etag, "last_modified": last_modified}, f)
+        os.replace(tmp_path, REMOTE_WEIGHTS_MANIFEST_HEADERS_PATH)
+
+        print(
+            f"Downloading {REMOTE_WEIGHTS_MANIFEST_URL} took: {(time.time() - start):.2f}s"
+        )
+        return True
 
     def _merge_manifests(self):
         if os.path.exists(WEIGHTS_MANIFEST_PATH):
@@ -79,10 +240,12 @@ class WeightsManifest:
                     manifest_to_merge = json.load(f)
                     for key in manifest_to_merge:
                         if key in original_manifest:
+                            existing = set(original_manifest[key])
                             for item in manifest_to_merge[key]:
-                                if item not in original_manifest[key]:
+                                if item not in existing:
                                     print(f"Adding {item} to {key}")
                                     original_manifest[key].append(item)
+                                    existing.add(item)
                         else:
                             original_manifest[key] = manifest_to_merge[key]
 
@@ -97,7 +260,7 @@ class WeightsManifest:
             weight_str = weight_str[:-4] + ".safetensors"
         return self.synonyms.get(weight_str, weight_str)
 
-    def _initialize_weights_map(self):
+    def _initialize_weights_map(self, weights_manifest):
         weights_map = {}
 
         def generate_weights_map(keys, directory_name):
@@ -141,15 +304,13 @@ class WeightsManifest:
                 else:
                     weights_map[k] = v
 
-        for key in self.weights_manifest.keys():
-            map = generate_weights_map(self.weights_manifest[key], key)
+        for key in weights_manifest.keys():
+            map = generate_weights_map(weights_manifest[key], key)
             update_weights_map(map)
 
-        for module_name in dir(helpers):
-            module = getattr(helpers, module_name)
-            if hasattr(module, "weights_map"):
-                map = module.weights_map(BASE_URL)
-                update_weights_map(map)
+        for helper in helpers.HELPERS:
+            map = helper.weights_map(BASE_URL)
+            update_weights_map(map)
 
         return weights_map
 
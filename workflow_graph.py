@@ -0,0 +1,35 @@
+def linked_node_ids(node):
+    # Links are [node_id, output_index] pairs
+    return [
+        value[0]
+        for value in node.get("inputs", {}).values()
+        if isinstance(value, list) and len(value) == 2 and isinstance(value[0], str)
+    ]
+
+
+def reachable_node_ids(workflow, output_node_types):
+    """
+    The ids of the output nodes in the workflow and every node they depend
+    on, directly or through other nodes.
+    """
+    pending = [
+        node_id
+        for node_id, node in workflow.items()
+        if node.get("class_type") in output_node_types
+    ]
+    reachable = set()
+    while pending:
+        node_id = pending.pop()
+        if node_id in reachable or node_id not in workflow:
+            continue
+        reachable.add(node_id)
+        pending.extend(linked_node_ids(workflow[node_id]))
+    return reachable
+
+
+def unreachable_node_ids(workflow, output_node_types):
+    reachable = reachable_node_ids(workflow, output_node_types)
+    # Without an output node nothing runs, which ComfyUI reports itself
+    if not reachable:
+        return []
+    return [node_id for node_id in workflow if node_id not in reachable]